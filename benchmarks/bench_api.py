@@ -0,0 +1,159 @@
+"""
+End to end benchmarks of the sync and asyncio clients against a local
+FakeOwnerAPI
+
+    $ python -m benchmarks.bench_api --fleet-size 500 --latency 0.05
+"""
+import argparse
+import asyncio
+import time
+
+from yauta.aio import AsyncTeslaAPI
+from yauta.fleet import TeslaFleet
+from yauta.tesla import TeslaAPI
+from yauta.testing import FakeOwnerAPI
+from yauta.vehicle import TeslaVehicle
+
+CREDENTIALS = {
+    'email': 'bench@example.com',
+    'password': 'xxxxxxxx',
+    'client_id': 'xxxxxxxx',
+    'client_secret': 'xxxxxxxx'
+}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    index = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def _api(server, **kwargs):
+    api = TeslaAPI(**dict(CREDENTIALS, **kwargs))
+    api.prefix_url = server.url
+    return api.initialize()
+
+
+def fleet_sweep(fleet_size, latency, workers):
+    """
+    Poll vehicle_data for the whole fleet through TeslaFleet
+
+    returns
+    dict of elapsed seconds, vehicles per second and errors
+    """
+    with FakeOwnerAPI(fleet_size=fleet_size, latency=latency) as server:
+        fleet = TeslaFleet(_api(server, pool_size=workers), workers)
+        fleet.refresh()
+        start = time.monotonic()
+        results = fleet.poll()
+        elapsed = time.monotonic() - start
+    return {
+        'elapsed': elapsed,
+        'per_second': fleet_size / elapsed,
+        'errors': sum(1 for r in results.values() if r.error is not None)
+    }
+
+
+async def _async_sweep(server, concurrency):
+    async with AsyncTeslaAPI(
+            concurrency=concurrency, pool_size=concurrency,
+            **CREDENTIALS) as api:
+        api.prefix_url = server.url
+        await api.initialize()
+        vehicles = await api.get_vehicles()
+        start = time.monotonic()
+        results = await api.gather(v.get_vehicle_data() for v in vehicles)
+        elapsed = time.monotonic() - start
+    return elapsed, sum(1 for r in results if isinstance(r, Exception))
+
+
+def async_sweep(fleet_size, latency, concurrency):
+    """
+    Poll vehicle_data for the whole fleet through AsyncTeslaAPI
+    """
+    with FakeOwnerAPI(fleet_size=fleet_size, latency=latency) as server:
+        elapsed, errors = asyncio.run(_async_sweep(server, concurrency))
+    return {
+        'elapsed': elapsed,
+        'per_second': fleet_size / elapsed,
+        'errors': errors
+    }
+
+
+def wake_to_data(fleet_size, latency, wake_delay, workers):
+    """
+    Wake a sleeping fleet and fetch vehicle_data from every vehicle
+
+    returns
+    dict of p50 and p99 seconds from wake_up to data, and errors
+    """
+    with FakeOwnerAPI(fleet_size=fleet_size, latency=latency, asleep=1.0,
+                      wake_delay=wake_delay) as server:
+        fleet = TeslaFleet(_api(server, pool_size=workers), workers)
+        fleet.refresh()
+
+        def wake_and_read(vehicle):
+            vehicle.wake_up(wait=True)
+            return vehicle.get_vehicle_data()
+
+        results = fleet.map(wake_and_read)
+    timings = [r.elapsed for r in results.values()]
+    return {
+        'p50': percentile(timings, 50),
+        'p99': percentile(timings, 99),
+        'errors': sum(1 for r in results.values() if r.error is not None)
+    }
+
+
+def command_latency(count, latency):
+    """
+    Send `count` commands one after the other
+
+    returns
+    dict of p50 and p99 seconds per command
+    """
+    with FakeOwnerAPI(latency=latency) as server:
+        vehicle = TeslaVehicle(1, _api(server))
+        timings = []
+        for _ in range(count):
+            start = time.monotonic()
+            vehicle.honk_horn()
+            timings.append(time.monotonic() - start)
+    return {'p50': percentile(timings, 50), 'p99': percentile(timings, 99)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--fleet-size', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='seconds added to every response')
+    parser.add_argument('--workers', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--wake-delay', type=float, default=2.0)
+    parser.add_argument('--commands', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    sweep = fleet_sweep(args.fleet_size, args.latency, args.workers)
+    print('fleet sweep (%s workers): %.2fs, %.1f vehicles/s, %s errors' % (
+        args.workers, sweep['elapsed'], sweep['per_second'], sweep['errors']))
+
+    sweep = async_sweep(args.fleet_size, args.latency, args.concurrency)
+    print('async sweep (%s concurrency): %.2fs, %.1f vehicles/s, '
+          '%s errors' % (args.concurrency, sweep['elapsed'],
+                         sweep['per_second'], sweep['errors']))
+
+    wake = wake_to_data(
+        min(args.fleet_size, args.workers), args.latency, args.wake_delay,
+        args.workers)
+    print('wake to data (%.1fs wake): p50 %.2fs, p99 %.2fs, %s errors' % (
+        args.wake_delay, wake['p50'], wake['p99'], wake['errors']))
+
+    commands = command_latency(args.commands, args.latency)
+    print('command latency: p50 %.1fms, p99 %.1fms' % (
+        commands['p50'] * 1000, commands['p99'] * 1000))
+
+
+if __name__ == '__main__':
+    main()
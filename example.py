@@ -1,6 +1,5 @@
 import os
 import pprint
-import time
 from yauta.tesla import TeslaAPI
 
 
@@ -25,13 +24,9 @@ my_car = vehicles[0]
 print('Car: %s' % my_car.id)
 
 print('Waking up car...')
-resp = my_car.wake_up()
+resp = my_car.wake_up(wait=True)
 my_car.honk_horn()
 pprint.pprint(resp)
 
-time.sleep(30)
-
-my_car.get_vehicle_data()
-time.sleep(5)
 data = my_car.get_vehicle_data()
 pprint.pprint(data)
@@ -16,5 +16,14 @@ setup(
     install_requires=[
         "requests"
     ],
+    extras_require={
+        "async": ["aiohttp"],
+        "recorder": ["numpy"],
+        "table": ["numpy"],
+        "geo": ["numpy"]
+    },
+    entry_points={
+        "console_scripts": ["yauta=yauta.cli:main"]
+    },
 )
 
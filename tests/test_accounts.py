@@ -0,0 +1,133 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+from yauta.accounts import (
+    API_KEYS,
+    AccountPool,
+    WorkerCrashedException,
+    shard
+)
+from yauta.tesla import TeslaAPI
+from yauta.testing import FakeOwnerAPI
+
+
+def fake_api(account, token_store, transport):
+    api = TeslaAPI(
+        token_store=token_store, transport=transport,
+        **{k: account[k] for k in API_KEYS})
+    api.prefix_url = account['url']
+    return api.initialize()
+
+
+def slow_api(account, token_store, transport):
+    time.sleep(0.3)
+    return fake_api(account, token_store, transport)
+
+
+def account_email(api):
+    return api.email
+
+
+def crash_once(api, marker_dir):
+    marker = os.path.join(marker_dir, api.email)
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        os._exit(1)
+    return api.email
+
+
+def always_crash(api):
+    os._exit(1)
+
+
+def raise_error(api):
+    raise ValueError(api.email)
+
+
+class AccountPoolTest(TestCase):
+    def setUp(self):
+        self.server = FakeOwnerAPI(fleet_size=2).start()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.accounts = [{
+            'email': 'owner%s@example.com' % i,
+            'password': 'xxxxxxxx',
+            'client_id': 'xxxxxxxx',
+            'client_secret': 'xxxxxxxx',
+            'url': self.server.url
+        } for i in range(6)]
+        self.pool = AccountPool(
+            self.accounts, processes=3, threads=2, api_factory=fake_api,
+            token_db=os.path.join(self.tmp.name, 'tokens.db'))
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+        self.tmp.cleanup()
+
+    def test_shard_is_stable(self):
+        self.assertEqual(
+            shard('owner1@example.com', 8), shard('owner1@example.com', 8))
+        self.assertEqual(
+            len(set(shard('owner%s@example.com' % i, 3) for i in range(30))),
+            3)
+
+    def test_poll(self):
+        with self.pool:
+            results = self.pool.poll(fields=['charge_state'])
+            self.assertEqual(
+                sorted(results), sorted(a['email'] for a in self.accounts))
+            for r in results.values():
+                self.assertIsNone(r.error)
+                self.assertEqual(sorted(r.result), [1, 2])
+                self.assertIn('charge_state', r.result[1].result)
+
+            # sessions and tokens stay in the workers between tasks
+            self.pool.map(account_email)
+        self.assertEqual(self.server.tokens, 6)
+
+        # a new pool picks the tokens up from the shared token store
+        with AccountPool(
+                self.accounts, processes=2, api_factory=fake_api,
+                token_db=self.pool.token_db) as pool:
+            pool.map(account_email)
+        self.assertEqual(self.server.tokens, 6)
+
+    def test_accounts_initialize_concurrently(self):
+        with AccountPool(
+                self.accounts, processes=1, threads=6,
+                api_factory=slow_api) as pool:
+            pool.start()
+            start = time.monotonic()
+            results = pool.map(account_email)
+            elapsed = time.monotonic() - start
+        self.assertEqual(len(results), 6)
+        # one account after the other would take 1.8s
+        self.assertLess(elapsed, 1.2)
+
+    def test_errors(self):
+        with self.pool:
+            results = self.pool.map(raise_error)
+        self.assertEqual(len(results), 6)
+        for key, r in results.items():
+            self.assertIsInstance(r.error, ValueError)
+            self.assertEqual(str(r.error), key)
+
+    def test_worker_restarts(self):
+        with self.pool:
+            results = self.pool.map(crash_once, self.tmp.name)
+            self.assertEqual(
+                {k: r.result for k, r in results.items()},
+                {a['email']: a['email'] for a in self.accounts})
+            self.assertGreaterEqual(self.pool.restarts, 1)
+
+            self.pool.max_restarts = 1
+            results = self.pool.map(always_crash)
+            self.assertEqual(len(results), 6)
+            self.assertTrue(all(
+                isinstance(r.error, WorkerCrashedException)
+                for r in results.values()))
+
+            # and the pool still works afterwards
+            self.assertEqual(len(self.pool.map(account_email)), 6)
@@ -0,0 +1,129 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase, mock
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from yauta.aio import AsyncTeslaAPI, AsyncTeslaVehicle
+from yauta.cache import VehicleDataCache
+from yauta.exceptions import TeslaException
+
+
+class AsyncTeslaTest(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.commands = []
+        self.wakes = 0
+        self.polls = 0
+        self.data_requests = []
+
+        async def token(request):
+            return web.json_response({'access_token': 'XXXXXXXX'})
+
+        async def vehicles(request):
+            return web.json_response({
+                'response': [{'id': i, 'state': 'online'} for i in range(20)],
+                'count': 20
+            })
+
+        async def vehicle_data(request):
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.01)
+            self.in_flight -= 1
+            self.data_requests.append(request.query.get('endpoints'))
+            return web.json_response({'response': {
+                'id': int(request.match_info['id']),
+                'charge_state': {'battery_level': 50}
+            }})
+
+        async def command(request):
+            if request.match_info['command'] == 'honk_horn':
+                raise web.HTTPBadRequest()
+            self.commands.append(
+                (request.match_info['command'], dict(await request.post())))
+            return web.json_response(
+                {'response': {'result': True, 'reason': ''}})
+
+        async def wake_up(request):
+            self.wakes += 1
+            await asyncio.sleep(0.01)
+            return web.json_response({'response': {'state': 'asleep'}})
+
+        async def vehicle(request):
+            self.polls += 1
+            state = 'online' if self.polls >= 3 else 'asleep'
+            return web.json_response({'response': {'state': state}})
+
+        app = web.Application()
+        app.router.add_post('/oauth/token', token)
+        app.router.add_get('/api/1/vehicles', vehicles)
+        app.router.add_get('/api/1/vehicles/{id}', vehicle)
+        app.router.add_get('/api/1/vehicles/{id}/vehicle_data', vehicle_data)
+        app.router.add_post('/api/1/vehicles/{id}/wake_up', wake_up)
+        app.router.add_post('/api/1/vehicles/{id}/command/{command}', command)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+        self.api = AsyncTeslaAPI(
+            email='xxxxxxx',
+            password='xxxxxxx',
+            client_id='xxxxxxxx',
+            client_secret='xxxxxxxx',
+            concurrency=5
+        )
+        self.api.prefix_url = str(self.server.make_url('')).rstrip('/')
+
+    async def asyncTearDown(self):
+        await self.api.close()
+        await self.server.close()
+
+    async def test_initialize_and_get_vehicles(self):
+        await self.api.initialize()
+        self.assertEqual(self.api.headers['Authorization'], 'Bearer XXXXXXXX')
+        vehicles = await self.api.get_vehicles()
+        self.assertEqual(len(vehicles), 20)
+        self.assertTrue(isinstance(vehicles[0], AsyncTeslaVehicle))
+
+    async def test_gather_is_bounded(self):
+        await self.api.initialize('XXXXXXXX')
+        vehicles = await self.api.get_vehicles()
+        results = await self.api.gather(
+            v.get_vehicle_data() for v in vehicles)
+        self.assertEqual([r['id'] for r in results], list(range(20)))
+        self.assertLessEqual(self.max_in_flight, 5)
+
+    async def test_data_groups(self):
+        await self.api.initialize('XXXXXXXX')
+        vehicle = AsyncTeslaVehicle(1, self.api)
+        # does not depend on the sync read path, even with a cache set
+        self.api.cache = VehicleDataCache()
+        self.assertEqual(
+            await vehicle.get_charge_state(), {'battery_level': 50})
+        self.assertEqual(self.data_requests, ['charge_state'])
+        with self.assertRaises(TeslaException):
+            await vehicle.get_vehicle_data(['no_such_group'])
+
+    async def test_commands(self):
+        await self.api.initialize('XXXXXXXX')
+        vehicle = AsyncTeslaVehicle(1, self.api)
+        resp = await vehicle.set_charge_limit(80)
+        self.assertTrue(resp['result'])
+        self.assertEqual(
+            self.commands, [('set_charge_limit', {'percent': '80'})])
+        with self.assertRaises(TeslaException):
+            vehicle.actuate_trunk('side')
+        with self.assertRaises(TeslaException):
+            await vehicle.honk_horn()
+
+    @mock.patch('yauta.aio.WAKE_POLL_INITIAL', 0.01)
+    async def test_wake_up_wait_coalesces(self):
+        await self.api.initialize('XXXXXXXX')
+        vehicle = AsyncTeslaVehicle(1, self.api)
+        results = await asyncio.gather(
+            *[vehicle.wake_up(wait=True) for _ in range(5)])
+        self.assertEqual(self.wakes, 1)
+        self.assertEqual(self.polls, 3)
+        self.assertEqual([r['state'] for r in results], ['online'] * 5)
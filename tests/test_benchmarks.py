@@ -0,0 +1,18 @@
+import unittest
+
+from benchmarks import bench_api
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_benchmarks_run(self):
+        self.assertEqual(bench_api.fleet_sweep(4, 0, 2)['errors'], 0)
+        self.assertEqual(bench_api.async_sweep(4, 0, 2)['errors'], 0)
+        self.assertEqual(bench_api.wake_to_data(2, 0, 0, 2)['errors'], 0)
+        self.assertGreater(bench_api.command_latency(3, 0)['p99'], 0)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(bench_api.percentile(values, 50), 51)
+        self.assertEqual(bench_api.percentile(values, 99), 99)
+        self.assertEqual(bench_api.percentile(values, 100), 100)
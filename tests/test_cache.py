@@ -0,0 +1,155 @@
+import threading
+from unittest import TestCase, mock
+
+from yauta.cache import VehicleDataCache
+from yauta.tesla import TeslaAPI
+from yauta.vehicle import TeslaVehicle
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def vehicle_data(level):
+    return {
+        'id': 1111,
+        'state': 'online',
+        'charge_state': {'battery_level': level},
+        'climate_state': {'inside_temp': 20},
+        'drive_state': {'speed': None},
+        'vehicle_state': {'locked': True}
+    }
+
+
+def response(data):
+    resp = mock.Mock()
+    resp.json.return_value = {'response': data}
+    return resp
+
+
+class VehicleDataCacheTest(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_per_group_ttl(self):
+        cache = VehicleDataCache(
+            ttl={'drive_state': 5, 'charge_state': 30}, clock=self.clock)
+        cache.put(1111, vehicle_data(80))
+        self.assertEqual(cache.get(1111)[1], True)
+        self.clock.now = 10
+        self.assertEqual(cache.get(1111)[1], False)
+        self.assertEqual(cache.get(1111, ['charge_state'])[1], True)
+        self.clock.now = 31
+        self.assertEqual(cache.get(1111, ['charge_state'])[1], False)
+
+    def test_lru_eviction(self):
+        cache = VehicleDataCache(maxsize=2, clock=self.clock)
+        cache.put(1, vehicle_data(1))
+        cache.put(2, vehicle_data(2))
+        cache.get(1)
+        cache.put(3, vehicle_data(3))
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(2)[0])
+        self.assertTrue(cache.get(1)[0])
+
+    def test_invalidate_command(self):
+        cache = VehicleDataCache(clock=self.clock)
+        cache.put(1111, vehicle_data(80))
+        cache.invalidate_command(1111, 'honk_horn')
+        self.assertTrue(cache.get(1111)[1])
+        cache.invalidate_command(1111, 'set_temps')
+        self.assertFalse(cache.get(1111)[1])
+        self.assertTrue(cache.get(1111, ['charge_state'])[1])
+        self.assertFalse(cache.get(1111, ['climate_state'])[1])
+
+
+class TeslaVehicleCacheTest(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.api = TeslaAPI(
+           email='xxxxxxxx',
+           password='xxxxxxxx',
+           client_id='xxxxxxxx',
+           client_secret='xxxxxxxx',
+           cache=VehicleDataCache(clock=self.clock)
+        )
+        self.vehicle = TeslaVehicle(1111, self.api)
+
+    def test_cached_until_command(self):
+        with mock.patch.object(self.api, 'get') as get, \
+                mock.patch.object(self.api, 'post') as post:
+            get.return_value = response(vehicle_data(80))
+            post.return_value = response({'result': True})
+            self.vehicle.get_vehicle_data()
+            self.vehicle.get_vehicle_data()
+            self.assertEqual(get.call_count, 1)
+            self.vehicle.charge_start()
+            get.return_value = response(vehicle_data(81))
+            data = self.vehicle.get_vehicle_data()
+            self.assertEqual(get.call_count, 2)
+            self.assertEqual(data['charge_state']['battery_level'], 81)
+
+    def test_stale_while_revalidate(self):
+        self.api.cache.stale_while_revalidate = True
+        refreshed = threading.Event()
+
+        def get(url):
+            if get.calls:
+                refreshed.set()
+            get.calls += 1
+            return response(vehicle_data(80 + get.calls))
+        get.calls = 0
+
+        with mock.patch.object(self.api, 'get', side_effect=get):
+            self.vehicle.get_vehicle_data()
+            self.clock.now = 1000
+            data = self.vehicle.get_vehicle_data()
+            self.assertEqual(data['charge_state']['battery_level'], 81)
+            self.assertTrue(refreshed.wait(1))
+        for _ in range(100):
+            data, fresh = self.api.cache.get(1111)
+            if fresh:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(data['charge_state']['battery_level'], 82)
+
+    def test_sub_state_served_from_full_data(self):
+        with mock.patch.object(self.api, 'get') as get:
+            get.return_value = response(vehicle_data(80))
+            self.vehicle.get_vehicle_data()
+            charge_state = self.vehicle.get_charge_state()
+            self.assertEqual(charge_state, {'battery_level': 80})
+            data = self.vehicle.get_vehicle_data(fields=['drive_state'])
+            self.assertEqual(sorted(data), ['drive_state', 'id', 'state'])
+            self.assertEqual(get.call_count, 1)
+
+            get.return_value = response({'gui_range_display': 'Rated'})
+            self.vehicle.get_gui_settings()
+            self.assertEqual(get.call_count, 2)
+            self.assertEqual(
+                self.api.cache.get(1111, ['gui_settings'])[0]['gui_settings'],
+                {'gui_range_display': 'Rated'})
+
+    def test_full_read_after_sub_state(self):
+        with mock.patch.object(self.api, 'get') as get:
+            get.return_value = response({'battery_level': 80})
+            self.vehicle.get_charge_state()
+            get.return_value = response(vehicle_data(81))
+            data = self.vehicle.get_vehicle_data()
+            self.assertEqual(get.call_count, 2)
+            self.assertEqual(
+                sorted(k for k, v in data.items() if isinstance(v, dict)),
+                ['charge_state', 'climate_state', 'drive_state',
+                 'vehicle_state'])
+
+            # a fields read is not a full response either
+            self.api.cache.clear()
+            self.vehicle.get_vehicle_data(fields=['drive_state'])
+            self.vehicle.get_vehicle_data()
+            self.assertEqual(get.call_count, 4)
+            self.vehicle.get_vehicle_data()
+            self.assertEqual(get.call_count, 4)
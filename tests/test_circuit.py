@@ -0,0 +1,146 @@
+from unittest import TestCase, mock
+
+from requests import Response
+
+from yauta.circuit import CircuitBreaker
+from yauta.exceptions import (
+    CircuitOpenException,
+    TeslaException,
+    VehicleOfflineException
+)
+from yauta.tesla import TeslaAPI
+from yauta.vehicle import TeslaVehicle
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def response(status, body=b'{"response": {"state": "online"}}'):
+    resp = Response()
+    resp.status_code = status
+    resp._content = body
+    return resp
+
+
+class CircuitBreakerTest(TestCase):
+    def test_opens_and_recovers(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(
+            failure_threshold=2, recovery_timeout=10, clock=clock)
+        breaker.check(1)
+        breaker.failure(1)
+        breaker.check(1)
+        breaker.failure(1)
+        self.assertEqual(breaker.state(1), 'open')
+        with self.assertRaises(CircuitOpenException):
+            breaker.check(1)
+        breaker.check(2)
+
+        clock.now = 10
+        self.assertEqual(breaker.state(1), 'half-open')
+        breaker.check(1)
+        with self.assertRaises(CircuitOpenException):
+            breaker.check(1)
+        breaker.failure(1)
+        self.assertEqual(breaker.state(1), 'open')
+
+        clock.now = 20
+        breaker.check(1)
+        breaker.success(1)
+        self.assertEqual(breaker.state(1), 'closed')
+        breaker.check(1)
+
+    def test_abandoned_trial(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(
+            failure_threshold=1, recovery_timeout=10, clock=clock)
+        breaker.failure(1)
+        clock.now = 10
+        self.assertTrue(breaker.check(1))
+        with self.assertRaises(CircuitOpenException):
+            breaker.check(1)
+        # a trial that never reports is given up on
+        clock.now = 20
+        self.assertTrue(breaker.check(1))
+        breaker.release(1)
+        self.assertTrue(breaker.check(1))
+        self.assertFalse(CircuitBreaker().check(1))
+
+    def test_interrupted_trial_is_released(self):
+        clock = FakeClock()
+        api = TeslaAPI(
+           email='xxxxxxxx',
+           password='xxxxxxxx',
+           client_id='xxxxxxxx',
+           client_secret='xxxxxxxx',
+           circuit_breaker=CircuitBreaker(
+               failure_threshold=1, recovery_timeout=10, clock=clock)
+        )
+        vehicle = TeslaVehicle(1111, api)
+        api.circuit_breaker.failure(1111)
+        clock.now = 10
+        with mock.patch.object(api, 'post', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                vehicle.honk_horn()
+        with mock.patch.object(api, 'post', return_value=response(200)):
+            vehicle.honk_horn()
+        self.assertEqual(api.circuit_breaker.state(1111), 'closed')
+
+
+class VehicleOfflineTest(TestCase):
+    def setUp(self):
+        self.api = TeslaAPI(
+           email='xxxxxxxx',
+           password='xxxxxxxx',
+           client_id='xxxxxxxx',
+           client_secret='xxxxxxxx',
+           circuit_breaker=CircuitBreaker(failure_threshold=2)
+        )
+        self.vehicle = TeslaVehicle(1111, self.api)
+
+    def test_fails_fast_when_asleep(self):
+        self.api.vehicle_states[1111] = 'asleep'
+        with mock.patch.object(self.api, 'get') as get:
+            with self.assertRaises(VehicleOfflineException):
+                self.vehicle.get_vehicle_data()
+            self.assertFalse(get.called)
+
+    def test_auto_wake(self):
+        self.api.vehicle_states[1111] = 'asleep'
+        self.api.auto_wake = True
+        with mock.patch.object(self.api, 'get') as get, \
+                mock.patch.object(self.api, 'post') as post:
+            post.return_value = response(200)
+            get.return_value = response(200, b'{"response": {"id": 1111}}')
+            self.assertEqual(self.vehicle.get_vehicle_data(), {'id': 1111})
+            post.assert_called_once_with('/api/1/vehicles/1111/wake_up')
+        self.assertEqual(self.api.vehicle_states[1111], 'online')
+
+    def test_408_marks_offline_and_trips_breaker(self):
+        with mock.patch.object(
+                self.api, 'post', return_value=response(408)) as post:
+            with self.assertRaises(VehicleOfflineException):
+                self.vehicle.honk_horn()
+            self.assertEqual(self.api.vehicle_states[1111], 'offline')
+            with self.assertRaises(VehicleOfflineException):
+                self.vehicle.flash_lights()
+            self.vehicle.api.vehicle_states.clear()
+            with self.assertRaises(VehicleOfflineException):
+                self.vehicle.wake_up()
+            self.assertEqual(post.call_count, 2)
+            with self.assertRaises(CircuitOpenException):
+                self.vehicle.wake_up()
+            self.assertEqual(post.call_count, 2)
+
+    def test_client_errors_do_not_trip_breaker(self):
+        with mock.patch.object(
+                self.api, 'post', return_value=response(400)):
+            for _ in range(3):
+                with self.assertRaises(TeslaException):
+                    self.vehicle.honk_horn()
+        self.assertEqual(self.api.circuit_breaker.state(1111), 'closed')
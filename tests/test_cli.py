@@ -0,0 +1,125 @@
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from unittest import TestCase
+
+from yauta import cli
+from yauta.daemon import Daemon, make_api
+from yauta.testing import FakeOwnerAPI
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class CLITest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.tokens = os.path.join(self.tmp.name, 'tokens.json')
+        self.socket = os.path.join(self.tmp.name, 'yauta.sock')
+        self.server = FakeOwnerAPI(fleet_size=2).start()
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp.cleanup()
+
+    def run_cli(self, *argv):
+        out = io.StringIO()
+        err = io.StringIO()
+        argv = [
+            '--email', 'xxxxxxxx', '--password', 'xxxxxxxx',
+            '--client-id', 'xxxxxxxx', '--client-secret', 'xxxxxxxx',
+            '--tokens', self.tokens, '--socket', self.socket,
+            '--url', self.server.url
+        ] + list(argv)
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            status = cli.main(argv)
+        return status, out.getvalue(), err.getvalue()
+
+    def test_help_does_not_import_http_stack(self):
+        code = (
+            'import sys\n'
+            'from yauta import cli\n'
+            'try:\n'
+            '    cli.main(["--help"])\n'
+            'except SystemExit:\n'
+            '    pass\n'
+            'print("requests" in sys.modules)\n'
+        )
+        out = subprocess.check_output(
+            [sys.executable, '-c', code], cwd=ROOT).decode('utf-8')
+        self.assertIn('usage: yauta', out)
+        self.assertEqual(out.splitlines()[-1], 'False')
+
+    def test_parse_args_list(self):
+        self.assertEqual(
+            cli.parse_args_list(['percent=80', 'wait=true', 'locale=en-US']),
+            {'percent': 80, 'wait': True, 'locale': 'en-US'})
+        with self.assertRaises(ValueError):
+            cli.parse_args_list(['percent'])
+
+    def test_in_process(self):
+        status, out, _ = self.run_cli('get-vehicles')
+        self.assertEqual(status, 0)
+        self.assertEqual([v['id'] for v in json.loads(out)], [1, 2])
+
+        # the token persisted by the first run is reused
+        status, out, _ = self.run_cli(
+            'vehicles', 'honk-horn', '--vehicle', '1')
+        self.assertEqual(status, 0)
+        self.assertEqual(json.loads(out)['result'], True)
+        self.assertEqual(self.server.requests['auth'], 1)
+
+        status, _, err = self.run_cli('vehicles', '_call', '--vehicle', '1')
+        self.assertEqual(status, 1)
+        self.assertIn('Unknown vehicle action: _call', err)
+
+    def test_daemon(self):
+        api = make_api(
+            'xxxxxxxx', 'xxxxxxxx', 'xxxxxxxx', 'xxxxxxxx', self.tokens,
+            cache=True, url=self.server.url)
+        daemon = Daemon(api, self.socket)
+        thread = threading.Thread(target=daemon.serve_forever)
+        thread.start()
+        try:
+            self.assertEqual(os.stat(self.socket).st_mode & 0o077, 0)
+            for _ in range(3):
+                status, out, _ = self.run_cli(
+                    'vehicles', 'get-details', '--vehicle', '2')
+                self.assertEqual(status, 0)
+                self.assertEqual(json.loads(out)['id'], 2)
+            status, out, _ = self.run_cli(
+                'vehicles', 'set-charge-limit', '--vehicle', '2', 'percent=80')
+            self.assertEqual(status, 0)
+
+            status, _, err = self.run_cli(
+                'vehicles', 'set-charge-limit', '--vehicle', '2', 'percent=1')
+            self.assertEqual(status, 1)
+            self.assertIn('TeslaException', err)
+
+            # another account runs in process instead of on the daemon
+            status, out, _ = self.run_cli(
+                '--email', 'other@example.com', 'get-access-token')
+            self.assertEqual(status, 0)
+            self.assertEqual(self.server.requests['auth'], 2)
+            other = FakeOwnerAPI(fleet_size=3).start()
+            self.addCleanup(other.stop)
+            status, out, _ = self.run_cli('--url', other.url, 'get-vehicles')
+            self.assertEqual(status, 0)
+            self.assertEqual(len(json.loads(out)), 3)
+            self.assertEqual(other.requests['vehicles'], 1)
+
+            self.assertEqual(self.run_cli('daemon', '--stop')[0], 0)
+        finally:
+            thread.join(5)
+            if thread.is_alive():
+                daemon.shutdown()
+            daemon.server_close()
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(os.path.exists(self.socket))
+        self.assertEqual(self.server.requests['auth'], 2)
+        # served from the daemon's cache after the first request
+        self.assertEqual(self.server.requests['vehicle_data'], 1)
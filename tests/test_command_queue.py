@@ -0,0 +1,124 @@
+from concurrent.futures import Future
+from unittest import TestCase, mock
+
+from yauta.command_queue import CommandQueue, coalesce, _Command
+from yauta.exceptions import TeslaException
+from yauta.tesla import TeslaAPI
+from yauta.vehicle import TeslaVehicle
+
+
+def commands(*names):
+    return [_Command(name, (), {}, Future()) for name in names]
+
+
+class CoalesceTest(TestCase):
+    def test_last_write_wins(self):
+        batch = commands('set_temps', 'honk_horn', 'set_temps')
+        batch[0].args = (18, 18)
+        batch[2].args = (21, 21)
+        calls = coalesce(batch)
+        self.assertEqual(
+            [(c.name, c.args) for c in calls],
+            [('honk_horn', ()), ('set_temps', (21, 21))])
+        self.assertEqual(len(calls[1].futures), 2)
+
+    def test_state_groups(self):
+        calls = coalesce(commands(
+            'set_charge_limit', 'charge_start', 'door_lock', 'door_unlock',
+            'door_lock', 'charge_max_range'))
+        self.assertEqual(
+            [c.name for c in calls],
+            ['charge_start', 'door_lock', 'charge_max_range'])
+
+    def test_volume_steps_merge(self):
+        calls = coalesce(commands(
+            'media_volume_up', 'media_volume_up', 'media_next_track',
+            'media_volume_down', 'media_volume_up', 'media_volume_up'))
+        self.assertEqual(
+            [c.name for c in calls],
+            ['media_next_track', 'media_volume_up', 'media_volume_up',
+             'media_volume_up'])
+        self.assertEqual(sum(len(c.futures) for c in calls), 6)
+
+        calls = coalesce(commands('media_volume_up', 'media_volume_down'))
+        self.assertEqual([c.name for c in calls], [None])
+        self.assertEqual(len(calls[0].futures), 2)
+
+
+class CommandQueueTest(TestCase):
+    def setUp(self):
+        api = TeslaAPI(
+           email='xxxxxxxx',
+           password='xxxxxxxx',
+           client_id='xxxxxxxx',
+           client_secret='xxxxxxxx'
+        )
+        self.vehicle = TeslaVehicle(1111, api)
+        self.sent = []
+
+        def call(method, url, data):
+            self.sent.append(url)
+            if url.endswith('honk_horn'):
+                raise TeslaException('honk failed')
+            return {'result': True, 'url': url, 'state': 'online'}
+
+        patcher = mock.patch.object(self.vehicle, '_call', side_effect=call)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_wakes_once_and_coalesces(self):
+        queue = CommandQueue(self.vehicle, batch_delay=0.1)
+        futures = [queue.media_volume_up() for _ in range(5)]
+        futures.append(queue.set_temps(18, 18))
+        futures.append(queue.set_temps(21, 21))
+        honk = queue.honk_horn()
+        queue.close()
+
+        self.assertEqual(self.sent, [
+            '/wake_up',
+            '/command/media_volume_up',
+            '/command/media_volume_up',
+            '/command/media_volume_up',
+            '/command/media_volume_up',
+            '/command/media_volume_up',
+            '/command/set_temps',
+            '/command/honk_horn'
+        ])
+        self.assertTrue(all(f.result()['result'] for f in futures))
+        self.assertEqual(
+            futures[5].result()['url'], '/command/set_temps')
+        with self.assertRaises(TeslaException):
+            honk.result()
+
+    def test_cancelled_commands_are_dropped(self):
+        queue = CommandQueue(self.vehicle, wake=False, batch_delay=0.1)
+        lock = queue.door_lock()
+        unlock = queue.door_unlock()
+        self.assertTrue(unlock.cancel())
+        self.assertEqual(lock.result()['url'], '/command/door_lock')
+        self.assertTrue(unlock.cancelled())
+        # the queue keeps running
+        self.assertTrue(queue.flash_lights().result()['result'])
+        queue.close()
+        self.assertEqual(
+            self.sent, ['/command/door_lock', '/command/flash_lights'])
+
+    def test_unknown_command(self):
+        queue = CommandQueue(self.vehicle, wake=False)
+        with self.assertRaises(TeslaException):
+            queue.submit('self_destruct')
+        with self.assertRaises(AttributeError):
+            queue.self_destruct
+        for name in ('get_vehicle_data', 'stream', 'wake_up'):
+            with self.assertRaises(TeslaException):
+                queue.submit(name)
+            with self.assertRaises(AttributeError):
+                getattr(queue, name)
+        with self.assertRaises(TeslaException):
+            queue.set_temps(20)
+        with self.assertRaises(TeslaException):
+            queue.set_charge_limit(5)
+        self.assertEqual(len(queue), 0)
+        queue.close()
+        with self.assertRaises(TeslaException):
+            queue.door_lock()
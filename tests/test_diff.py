@@ -0,0 +1,106 @@
+from unittest import TestCase
+
+from yauta.diff import Change, StateDiffer, as_patch, flatten
+from yauta.snapshot import VehicleSnapshot
+
+
+def vehicle_data(battery_level=80, inside_temp=20.0, latitude=37.0,
+                 locked=True, timestamp=1):
+    return {
+        'id': 1,
+        'state': 'online',
+        'charge_state': {
+            'battery_level': battery_level,
+            'charging_state': 'Stopped',
+            'timestamp': timestamp
+        },
+        'climate_state': {'inside_temp': inside_temp, 'timestamp': timestamp},
+        'drive_state': {
+            'latitude': latitude, 'longitude': -122.0, 'timestamp': timestamp
+        },
+        'vehicle_state': {'locked': locked, 'timestamp': timestamp}
+    }
+
+
+class StateDifferTest(TestCase):
+    def test_flatten_and_patch(self):
+        data = {'a': {'b': 1, 'c': {'d': [1, 2]}}, 'e': {}}
+        flat = flatten(data)
+        self.assertEqual(flat, {'a.b': 1, 'a.c.d': [1, 2], 'e': {}})
+        self.assertEqual(
+            as_patch(Change(p, None, v) for p, v in flat.items()), data)
+
+    def test_first_update_reports_everything(self):
+        differ = StateDiffer()
+        changes = differ.update(1, vehicle_data())
+        self.assertEqual(len(changes), 8)
+        self.assertTrue(all(c.old is None for c in changes))
+        self.assertNotIn('charge_state.timestamp', differ.state(1))
+
+    def test_only_changes_are_reported(self):
+        differ = StateDiffer()
+        differ.update(1, vehicle_data())
+        self.assertEqual(differ.update(1, vehicle_data(timestamp=2)), [])
+        self.assertEqual(
+            differ.update(1, vehicle_data(battery_level=79, locked=False)),
+            [Change('charge_state.battery_level', 80, 79),
+             Change('vehicle_state.locked', True, False)])
+
+    def test_deadband(self):
+        differ = StateDiffer(deadband={'climate_state.inside_temp': 1})
+        differ.update(1, vehicle_data())
+        # jitter is ignored, but drift is reported once it adds up
+        self.assertEqual(differ.update(1, vehicle_data(inside_temp=20.4)), [])
+        self.assertEqual(differ.update(1, vehicle_data(inside_temp=20.8)), [])
+        self.assertEqual(
+            differ.update(1, vehicle_data(inside_temp=21.2)),
+            [Change('climate_state.inside_temp', 20.0, 21.2)])
+        self.assertEqual(
+            differ.update(
+                1, vehicle_data(inside_temp=21.2, latitude=37.000001)), [])
+
+    def test_missing_fields(self):
+        differ = StateDiffer()
+        differ.update(1, vehicle_data())
+        # a partial poll leaves the other groups alone
+        partial = {'charge_state': {'battery_level': 80}}
+        self.assertEqual(
+            differ.update(1, partial),
+            [Change('charge_state.charging_state', 'Stopped', None)])
+        self.assertIn('drive_state.latitude', differ.state(1))
+
+    def test_subscribers(self):
+        differ = StateDiffer()
+        everything = []
+        charge = []
+
+        def on_charge(vehicle_id, changes):
+            charge.append((vehicle_id, changes))
+
+        differ.subscribe(lambda v, c: everything.append((v, c)))
+        differ.subscribe(on_charge, prefixes=['charge_state'])
+        differ.update(1, vehicle_data())
+        differ.update(2, vehicle_data())
+        differ.update(1, vehicle_data(locked=False))
+        self.assertEqual([v for v, _ in everything], [1, 2, 1])
+        self.assertEqual([v for v, _ in charge], [1, 2])
+        self.assertEqual(len(charge[0][1]), 2)
+
+        differ.unsubscribe(on_charge)
+        differ.update(1, vehicle_data(battery_level=10))
+        self.assertEqual(len(charge), 2)
+        self.assertEqual(len(everything), 4)
+
+    def test_snapshot(self):
+        differ = StateDiffer()
+        differ.update(1, vehicle_data())
+        snapshot = VehicleSnapshot.from_dict(vehicle_data(battery_level=50))
+        self.assertEqual(
+            differ.update(1, snapshot),
+            [Change('charge_state.battery_level', 80, 50)])
+
+    def test_reset(self):
+        differ = StateDiffer()
+        differ.update(1, vehicle_data())
+        differ.reset(1)
+        self.assertEqual(len(differ.update(1, vehicle_data())), 8)
@@ -0,0 +1,182 @@
+import random
+from unittest import TestCase
+
+import numpy
+
+from yauta.exceptions import TeslaException
+from yauta.fleet import FleetResult
+from yauta.geo import (
+    CircleFence,
+    FenceIndex,
+    GeofenceEngine,
+    PolygonFence,
+    TripSegmenter,
+    haversine
+)
+from yauta.testing import vehicle_data
+
+SQUARE = [(37.40, -122.10), (37.40, -122.08), (37.42, -122.08),
+          (37.42, -122.10)]
+
+
+def at(latitude, longitude, speed=None, shift_state=None, timestamp=0):
+    return {'drive_state': {
+        'latitude': latitude, 'longitude': longitude, 'speed': speed,
+        'shift_state': shift_state, 'gps_as_of': timestamp
+    }}
+
+
+class FenceTest(TestCase):
+    def test_circle(self):
+        fence = CircleFence('depot', 37.0, -122.0, radius=1000)
+        # a thousandth of a degree of latitude is about 111m
+        inside = fence.contains(
+            numpy.array([37.0, 37.008, 37.01, 38.0]),
+            numpy.array([-122.0, -122.0, -122.0, -122.0]))
+        self.assertEqual(list(inside), [True, True, False, False])
+        self.assertAlmostEqual(
+            float(haversine(37.0, -122.0, 37.01, -122.0)), 1112, delta=1)
+
+    def test_polygon(self):
+        fence = PolygonFence('site', SQUARE + [(37.41, -122.09)])
+        inside = fence.contains(
+            numpy.array([37.405, 37.411, 37.43, 37.405]),
+            numpy.array([-122.085, -122.097, -122.09, -122.11]))
+        # the last vertex cuts a notch into the west side of the square
+        self.assertEqual(list(inside), [True, False, False, False])
+        with self.assertRaises(TeslaException):
+            PolygonFence('line', SQUARE[:2])
+
+    def test_index_matches_brute_force(self):
+        rng = random.Random(1)
+        fences = [
+            CircleFence(i, rng.uniform(37, 38), rng.uniform(-123, -122),
+                        rng.uniform(100, 5000))
+            for i in range(300)
+        ]
+        for i in range(300, 400):
+            lat, lon = rng.uniform(37, 38), rng.uniform(-123, -122)
+            fences.append(PolygonFence(i, [
+                (lat, lon), (lat + 0.03, lon + 0.01), (lat + 0.01, lon + 0.04)
+            ]))
+        index = FenceIndex(fences, cell_size=0.02)
+        latitudes = numpy.array([rng.uniform(37, 38) for _ in range(2000)])
+        longitudes = numpy.array(
+            [rng.uniform(-123, -122) for _ in range(2000)])
+
+        point_index, fence_ids = index.locate(latitudes, longitudes)
+        found = set(zip(point_index.tolist(), fence_ids.tolist()))
+        expected = {
+            (int(p), f.id) for f in fences
+            for p in numpy.flatnonzero(f.contains(latitudes, longitudes))
+        }
+        self.assertTrue(expected)
+        self.assertEqual(found, expected)
+
+        self.assertTrue(index.remove(0))
+        self.assertFalse(index.remove(0))
+        self.assertNotIn(0, index.locate(latitudes, longitudes)[1].tolist())
+        self.assertEqual(len(FenceIndex().locate([37.0], [-122.0])[0]), 0)
+
+
+class GeofenceEngineTest(TestCase):
+    def setUp(self):
+        self.events = []
+        self.engine = GeofenceEngine([
+            CircleFence('depot', 37.0, -122.0, radius=500),
+            PolygonFence('site', SQUARE)
+        ], on_event=self.events.append)
+
+    def test_enter_and_exit(self):
+        engine = self.engine
+        # the first position only sets where the vehicle is
+        self.assertEqual(engine.update(1, at(37.0, -122.0, timestamp=1)), [])
+        self.assertEqual(engine.inside(1), {'depot'})
+
+        engine.update_positions(
+            [1, 2], [37.41, 37.0], [-122.09, -122.0], [2, 2])
+        self.assertEqual(
+            [(e.vehicle_id, e.fence_id, e.kind, e.timestamp)
+             for e in self.events],
+            [(1, 'depot', 'exit', 2.0), (1, 'site', 'enter', 2.0)])
+        self.assertEqual(engine.vehicles_in('depot'), [2])
+
+        self.assertTrue(engine.remove_fence('site'))
+        self.assertEqual(engine.inside(1), frozenset())
+        self.assertEqual(engine.update(1, at(37.41, -122.09)), [])
+
+    def test_update_many(self):
+        engine = self.engine
+        data = vehicle_data(1, 'online')
+        data['drive_state'].update(latitude=37.0, longitude=-122.0)
+        engine.update_many({
+            1: FleetResult(1, data, None, 0.1),
+            2: FleetResult(2, None, TeslaException('asleep'), 0.1),
+            3: {'charge_state': {}}
+        })
+        self.assertEqual(engine.inside(1), {'depot'})
+        self.assertEqual(engine.inside(2), frozenset())
+        self.assertEqual(engine.update_many({}), [])
+
+
+class TripSegmenterTest(TestCase):
+    def setUp(self):
+        self.trips = []
+        self.segmenter = TripSegmenter(
+            stop_timeout=300, min_distance=100, on_trip=self.trips.append)
+
+    def drive(self, vehicle_id, samples):
+        for sample in samples:
+            self.segmenter.update(vehicle_id, at(*sample))
+
+    def test_trip_ends_after_parking(self):
+        self.drive(1, [
+            (37.00, -122.0, None, 'P', 0),
+            (37.00, -122.0, 5, 'D', 10),
+            (37.01, -122.0, 40, 'D', 70),
+            # a short stop does not split the drive
+            (37.01, -122.0, 0, 'P', 100),
+            (37.02, -122.0, 30, 'D', 200),
+            (37.03, -122.0, 0, 'P', 300),
+            (37.03, -122.0, 0, 'P', 400),
+        ])
+        self.assertEqual(self.trips, [])
+        self.assertEqual(self.segmenter.driving, [1])
+
+        self.drive(1, [(37.03, -122.0, None, 'P', 600)])
+        [trip] = self.trips
+        self.assertEqual((trip.start, trip.end), (10, 300))
+        self.assertEqual(trip.start_position, (37.0, -122.0))
+        self.assertEqual(trip.end_position, (37.03, -122.0))
+        self.assertAlmostEqual(trip.distance, 3336, delta=2)
+        self.assertEqual((trip.max_speed, trip.samples), (40, 6))
+        self.assertEqual(self.segmenter.driving, [])
+
+    def test_new_trip_after_timeout(self):
+        self.drive(1, [
+            (37.00, -122.0, 30, 'D', 0),
+            (37.01, -122.0, 0, 'P', 60),
+            (37.01, -122.0, 10, 'D', 400),
+            (37.02, -122.0, 30, 'D', 460),
+        ])
+        self.assertEqual([(t.start, t.end) for t in self.trips], [(0, 60)])
+        self.assertEqual(self.segmenter.driving, [1])
+
+    def test_flush_and_noise(self):
+        self.drive(1, [
+            (37.00, -122.0, 30, 'D', 0),
+            (37.01, -122.0, 30, 'D', 60),
+        ])
+        # jitter in the driveway is not a trip
+        self.drive(2, [
+            (37.0, -122.0, None, 'R', 0),
+            (37.0001, -122.0, None, 'P', 30),
+        ])
+        self.assertEqual(self.segmenter.flush(now=200), [])
+        self.assertEqual(self.segmenter.driving, [1, 2])
+
+        # vehicle 1 went out of coverage mid-drive
+        [trip] = self.segmenter.flush(now=400)
+        self.assertEqual((trip.vehicle_id, trip.end), (1, 60))
+        self.assertEqual(self.trips, [trip])
+        self.assertEqual(self.segmenter.driving, [])
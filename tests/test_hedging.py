@@ -0,0 +1,215 @@
+import threading
+import time
+from unittest import TestCase
+
+from yauta.exceptions import TeslaDeadlineException
+from yauta.fleet import TeslaFleet
+from yauta.hedging import HedgePolicy
+from yauta.tesla import TeslaAPI
+from yauta.testing import FakeOwnerAPI
+from yauta.vehicle import TeslaVehicle
+
+URL = '/api/1/vehicles/1/vehicle_data'
+
+CREDENTIALS = {
+    'email': 'xxxxxxxx',
+    'password': 'xxxxxxxx',
+    'client_id': 'xxxxxxxx',
+    'client_secret': 'xxxxxxxx'
+}
+
+
+def first_call_slow(delay=0.5):
+    """
+    A send that takes `delay` the first time and answers at once after
+    """
+    calls = []
+    lock = threading.Lock()
+
+    def send(timeout):
+        with lock:
+            calls.append(timeout)
+            n = len(calls)
+        if n == 1:
+            time.sleep(delay)
+            return 'slow'
+        return 'fast'
+    send.calls = calls
+    return send
+
+
+class Response(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class HedgePolicyTest(TestCase):
+    def policy(self, **kwargs):
+        kwargs.setdefault('min_samples', 5)
+        policy = HedgePolicy(**kwargs)
+        for _ in range(5):
+            policy.observe('/api/1/vehicles/{id}/vehicle_data', 0.01)
+        return policy
+
+    def test_delay_follows_latencies(self):
+        policy = HedgePolicy(min_samples=10, quantile=0.9)
+        self.assertIsNone(policy.delay('/x'))
+        for i in range(1, 11):
+            policy.observe('/x', i / 100.0)
+        self.assertEqual(policy.delay('/x'), 0.1)
+        self.assertIsNone(policy.delay('/y'))
+
+    def test_slow_read_is_hedged(self):
+        policy = self.policy()
+        send = first_call_slow()
+        start = time.monotonic()
+        self.assertEqual(policy.call(URL, send), 'fast')
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual(len(send.calls), 2)
+        self.assertEqual((policy.hedged, policy.hedge_wins), (1, 1))
+
+    def test_hedges_are_budgeted(self):
+        policy = self.policy(budget=0.0, burst=1)
+        self.assertEqual(policy.call(URL, first_call_slow(0.1)), 'fast')
+        # out of budget, the slow read is waited for
+        self.assertEqual(policy.call(URL, first_call_slow(0.1)), 'slow')
+        self.assertEqual((policy.reads, policy.hedged), (2, 1))
+
+    def test_reads_are_not_queued(self):
+        policy = self.policy(burst=0)
+        caller = threading.current_thread()
+
+        def send(timeout):
+            time.sleep(0.2)
+            return threading.current_thread()
+
+        # nothing to hedge with, the read is sent by the caller
+        self.assertIs(policy.call(URL, send), caller)
+
+        policy = self.policy(burst=100)
+        threads = [
+            threading.Thread(target=policy.call, args=(URL, send))
+            for _ in range(64)
+        ]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # every read and hedge was in flight at once
+        self.assertLess(time.monotonic() - start, 0.35)
+        self.assertEqual(policy.hedged, 64)
+
+    def test_errors_are_not_hedged(self):
+        policy = self.policy()
+
+        def send(timeout):
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            policy.call(URL, send)
+        self.assertEqual(policy.hedged, 0)
+
+    def test_error_responses_do_not_win(self):
+        policy = self.policy()
+        ok, failed = Response(200), Response(503)
+        calls = []
+
+        def send(timeout):
+            calls.append(timeout)
+            if len(calls) == 1:
+                time.sleep(0.2)
+                return ok
+            return failed
+
+        self.assertIs(policy.call(URL, send), ok)
+        self.assertEqual((policy.hedged, policy.hedge_wins), (1, 0))
+        # only the successful read counts towards the latencies
+        latencies = policy._latencies['/api/1/vehicles/{id}/vehicle_data']
+        # recorded by a done callback, which can run after call returns
+        for _ in range(100):
+            if len(latencies) == 6:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(latencies), 6)
+        self.assertGreaterEqual(latencies[-1], 0.2)
+
+        # with nothing better, the error response is returned
+        self.assertIs(
+            policy.call(URL, lambda timeout: Response(408)).status_code, 408)
+        self.assertEqual(len(latencies), 6)
+
+    def test_deadline(self):
+        policy = HedgePolicy()
+        send = first_call_slow()
+        start = time.monotonic()
+        with self.assertRaises(TeslaDeadlineException):
+            policy.call(URL, send, deadline=start + 0.1)
+        self.assertLess(time.monotonic() - start, 0.3)
+        # the request itself was given what was left of the budget
+        self.assertLessEqual(send.calls[0], 0.1)
+
+
+class VehicleDeadlineTest(TestCase):
+    def setUp(self):
+        self.server = FakeOwnerAPI(fleet_size=2).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def api(self, **kwargs):
+        api = TeslaAPI(**dict(CREDENTIALS, **kwargs))
+        api.prefix_url = self.server.url
+        return api.initialize()
+
+    def test_timeout(self):
+        vehicle = TeslaVehicle(1, self.api())
+        self.assertEqual(vehicle.get_vehicle_data(timeout=1)['id'], 1)
+        self.server.latency = {'vehicle_data': 0.5}
+        start = time.monotonic()
+        with self.assertRaises(TeslaDeadlineException):
+            vehicle.get_vehicle_data(timeout=0.1)
+        # read timeouts are not retried
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual(self.server.requests['vehicle_data'], 2)
+
+    def test_retries_stay_within_timeout(self):
+        vehicle = TeslaVehicle(1, self.api())
+        fleet = TeslaFleet(self.api())
+        fleet.refresh()
+        self.server.errors = {503: 1.0}
+        start = time.monotonic()
+        with self.assertRaises(TeslaDeadlineException):
+            vehicle.get_vehicle_data(timeout=1)
+        # retried at once, the next backoff would have overrun the budget
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(self.server.requests['vehicle_data'], 2)
+
+        results = fleet.poll(timeout=1)
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertTrue(all(
+            isinstance(r.error, TeslaDeadlineException)
+            for r in results.values()))
+
+    def test_fleet_poll_timeout(self):
+        self.server.latency = {'vehicle_data': 0.5}
+        api = self.api(hedge=HedgePolicy())
+        start = time.monotonic()
+        results = TeslaFleet(api).poll(timeout=0.1)
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual(sorted(results), [1, 2])
+        self.assertTrue(all(
+            isinstance(r.error, TeslaDeadlineException)
+            for r in results.values()))
+
+    def test_hedged_reads(self):
+        api = self.api(hedge=HedgePolicy(min_samples=5, min_delay=0.05))
+        vehicle = TeslaVehicle(1, api)
+        for _ in range(5):
+            vehicle.get_vehicle_data()
+        self.assertEqual(api.hedge.hedged, 0)
+
+        self.server.latency = {'vehicle_data': 0.3}
+        self.assertEqual(vehicle.get_vehicle_data()['id'], 1)
+        self.assertEqual(api.hedge.hedged, 1)
+        self.assertEqual(self.server.requests['vehicle_data'], 7)
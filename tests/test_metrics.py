@@ -0,0 +1,157 @@
+import asyncio
+from unittest import TestCase
+
+from urllib3.util.retry import Retry
+
+from yauta.aio import AsyncTeslaAPI
+from yauta.metrics import Histogram, Metrics, endpoint_from_url
+from yauta.ratelimit import RateLimiter
+from yauta.tesla import TeslaAPI
+from yauta.testing import FakeOwnerAPI
+from yauta.transport import Transport
+from yauta.vehicle import TeslaVehicle
+
+CREDENTIALS = {
+    'email': 'xxxxxxxx',
+    'password': 'xxxxxxxx',
+    'client_id': 'xxxxxxxx',
+    'client_secret': 'xxxxxxxx'
+}
+
+
+class MetricsTest(TestCase):
+    def test_endpoint_from_url(self):
+        self.assertEqual(
+            endpoint_from_url(
+                'https://owner-api.teslamotors.com/api/1/vehicles/12345'
+                '/vehicle_data?endpoints=charge_state'),
+            '/api/1/vehicles/{id}/vehicle_data')
+        self.assertEqual(
+            endpoint_from_url('/api/1/vehicles'), '/api/1/vehicles')
+
+    def test_histogram(self):
+        histogram = Histogram((0.1, 1))
+        for value in (0.05, 0.5, 0.5, 5):
+            histogram.observe(value)
+        self.assertEqual(
+            histogram.cumulative(), [(0.1, 1), (1, 3), (float('inf'), 4)])
+        self.assertEqual(histogram.quantile(0.5), 1)
+        self.assertEqual(histogram.quantile(0.99), float('inf'))
+        self.assertEqual(histogram.sum, 6.05)
+
+    def test_prometheus(self):
+        metrics = Metrics(buckets=(0.1, 1))
+        events = []
+        metrics.add_hook(events.append)
+        metrics.observe_request('get', '/api/1/vehicles/1/data', 200, 0.05)
+        metrics.observe_request(
+            'get', '/api/1/vehicles/2/data', 503, 0.5, retries=2,
+            received=10)
+        metrics.observe_request('post', '/api/1/vehicles/2/data', None, 2)
+        metrics.observe_wake(12)
+        metrics.observe_wake(120, online=False)
+
+        self.assertEqual(
+            [(e.kind, e.status) for e in events],
+            [('request', 200), ('request', 503), ('request', None),
+             ('wake', None), ('wake', None)])
+        text = metrics.to_prometheus()
+        for line in (
+                '# TYPE yauta_request_duration_seconds histogram',
+                'yauta_request_duration_seconds_bucket{method="GET",'
+                'endpoint="/api/1/vehicles/{id}/data",le="0.1"} 1',
+                'yauta_request_duration_seconds_bucket{method="GET",'
+                'endpoint="/api/1/vehicles/{id}/data",le="+Inf"} 2',
+                'yauta_request_duration_seconds_count{method="GET",'
+                'endpoint="/api/1/vehicles/{id}/data"} 2',
+                'yauta_requests_total{method="GET",'
+                'endpoint="/api/1/vehicles/{id}/data",status="503"} 1',
+                'yauta_requests_total{method="POST",'
+                'endpoint="/api/1/vehicles/{id}/data",status="error"} 1',
+                'yauta_request_retries_total{method="GET",'
+                'endpoint="/api/1/vehicles/{id}/data"} 2',
+                'yauta_response_received_bytes_total{method="GET",'
+                'endpoint="/api/1/vehicles/{id}/data"} 10',
+                'yauta_wake_duration_seconds_count 1',
+                'yauta_wake_timeouts_total 1'):
+            self.assertIn(line, text.splitlines())
+
+        stats = metrics.endpoints()[('GET', '/api/1/vehicles/{id}/data')]
+        self.assertEqual(stats['count'], 2)
+        self.assertEqual(stats['statuses'], {200: 1, 503: 1})
+
+    def test_request_path(self):
+        metrics = Metrics()
+        with FakeOwnerAPI(retry_after=0) as server:
+            t = TeslaAPI(
+                metrics=metrics,
+                rate_limiter=RateLimiter(rate=1000, burst=1000, max_retries=2),
+                **CREDENTIALS)
+            t.prefix_url = server.url
+            t.initialize()
+            vehicle = TeslaVehicle(1, t)
+            vehicle.get_vehicle_data()
+            vehicle.wake_up(wait=True)
+            server.errors = {429: 1.0}
+            t.get('/api/1/vehicles')
+
+        endpoints = metrics.endpoints()
+        self.assertEqual(metrics.auth.count, 1)
+        self.assertEqual(endpoints[('POST', '/oauth/token')]['count'], 1)
+        data = endpoints[('GET', '/api/1/vehicles/{id}/vehicle_data')]
+        self.assertEqual(data['statuses'], {200: 1})
+        self.assertGreater(data['received'], 0)
+        # one logical request, throttled twice before giving up
+        vehicles = endpoints[('GET', '/api/1/vehicles')]
+        self.assertEqual(vehicles['statuses'], {429: 1})
+        self.assertEqual(vehicles['count'], 1)
+        self.assertEqual(vehicles['retries'], 2)
+        self.assertEqual(metrics.wake.count, 1)
+
+    def test_retried_requests_are_recorded_once(self):
+        metrics = Metrics()
+        retries = Retry(total=2, backoff_factor=0, status_forcelist=[503],
+                        raise_on_status=False)
+        with FakeOwnerAPI() as server:
+            t = TeslaAPI(
+                metrics=metrics, transport=Transport(max_retries=retries),
+                **CREDENTIALS)
+            t.prefix_url = server.url
+            t.initialize()
+            server.errors = {503: 1.0}
+            t.get('/api/1/vehicles')
+            self.assertEqual(server.requests['vehicles'], 3)
+            server.errors = {401: 1.0}
+            t.get('/api/1/vehicles/1')
+            self.assertEqual(server.requests['summary'], 2)
+            self.assertEqual(server.tokens, 2)
+
+        endpoints = metrics.endpoints()
+        vehicles = endpoints[('GET', '/api/1/vehicles')]
+        self.assertEqual((vehicles['count'], vehicles['retries']), (1, 2))
+        self.assertEqual(vehicles['statuses'], {503: 1})
+        summary = endpoints[('GET', '/api/1/vehicles/{id}')]
+        self.assertEqual((summary['count'], summary['retries']), (1, 1))
+        self.assertEqual(summary['statuses'], {401: 1})
+
+    def test_async_request_path(self):
+        metrics = Metrics()
+
+        async def run(server):
+            async with AsyncTeslaAPI(metrics=metrics, **CREDENTIALS) as t:
+                t.prefix_url = server.url
+                await t.initialize()
+                vehicles = await t.get_vehicles()
+                await vehicles[0].honk_horn()
+
+        with FakeOwnerAPI() as server:
+            asyncio.run(run(server))
+
+        endpoints = metrics.endpoints()
+        self.assertEqual(metrics.auth.count, 1)
+        self.assertEqual(endpoints[('GET', '/api/1/vehicles')]['count'], 1)
+        command = endpoints[('POST', '/api/1/vehicles/{id}/command/honk_horn')]
+        self.assertEqual(command['statuses'], {200: 1})
+        self.assertGreater(command['received'], 0)
+        token = endpoints[('POST', '/oauth/token')]
+        self.assertGreater(token['sent'], 0)
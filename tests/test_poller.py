@@ -0,0 +1,101 @@
+from unittest import TestCase
+
+from yauta.poller import (
+    AdaptivePoller,
+    MODE_ASLEEP,
+    MODE_CHARGING,
+    MODE_DRIVING,
+    MODE_IDLE,
+    MODE_PARKED,
+    vehicle_mode
+)
+from yauta.tesla import TeslaAPI
+from yauta.testing import FakeOwnerAPI
+
+
+class AdaptivePollerTest(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.server = FakeOwnerAPI(fleet_size=4, asleep=[1]).start()
+        self.server.vehicles[2].data['drive_state']['shift_state'] = 'D'
+        self.server.vehicles[3].data['charge_state']['charging_state'] = (
+            'Charging')
+        self.api = TeslaAPI(
+           email='xxxxxxxx',
+           password='xxxxxxxx',
+           client_id='xxxxxxxx',
+           client_secret='xxxxxxxx'
+        )
+        self.api.prefix_url = self.server.url
+        self.api.initialize()
+        self.polled = []
+
+    def tearDown(self):
+        self.server.stop()
+
+    def poller(self, **kwargs):
+        kwargs.setdefault('max_rate', 100)
+        kwargs.setdefault('burst', 100)
+        return AdaptivePoller(
+            self.api, clock=lambda: self.now,
+            on_data=lambda vid, data: self.polled.append(vid), **kwargs)
+
+    def step(self, poller, at):
+        self.now = at
+        del self.polled[:]
+        poller.step()
+        return sorted(self.polled)
+
+    def test_vehicle_mode(self):
+        self.assertEqual(
+            vehicle_mode({'drive_state': {'shift_state': 'R'}}),
+            MODE_DRIVING)
+        self.assertEqual(
+            vehicle_mode({'drive_state': {'speed': 30}}), MODE_DRIVING)
+        self.assertEqual(
+            vehicle_mode({'charge_state': {'charging_state': 'Charging'}}),
+            MODE_CHARGING)
+        self.assertEqual(
+            vehicle_mode({'drive_state': {'shift_state': 'P'}}), MODE_PARKED)
+
+    def test_intervals_follow_state(self):
+        poller = self.poller(idle_timeout=600, sleep_window=1800)
+        self.assertEqual(self.step(poller, 0), [2, 3, 4])
+        self.assertEqual(poller.modes, {
+            1: MODE_ASLEEP, 2: MODE_DRIVING, 3: MODE_CHARGING,
+            4: MODE_PARKED
+        })
+        self.assertEqual(self.step(poller, 10), [])
+        self.assertEqual(self.step(poller, 15), [2])
+        self.assertEqual(self.step(poller, 60), [2, 3])
+        self.assertEqual(self.step(poller, 300), [2, 3, 4])
+        # parked for long enough, left alone to fall asleep
+        self.assertEqual(self.step(poller, 600), [2, 3, 4])
+        self.assertEqual(poller.modes[4], MODE_IDLE)
+        self.assertEqual(self.step(poller, 900), [2, 3])
+        # still online once the window is over, so it is checked again
+        self.assertEqual(self.step(poller, 2400), [2, 3, 4])
+        self.assertEqual(poller.modes[4], MODE_IDLE)
+
+        # the asleep vehicle is never polled or woken
+        self.assertEqual(self.server.requests['wake_up'], 0)
+        self.server.vehicles[1].asleep = False
+        self.assertEqual(self.step(poller, 2460), [1, 2, 3])
+        self.assertEqual(poller.modes[1], MODE_PARKED)
+
+    def test_vehicle_falls_asleep(self):
+        poller = self.poller()
+        self.step(poller, 0)
+        self.server.vehicles[2].asleep = True
+        self.assertEqual(self.step(poller, 15), [])
+        self.assertEqual(poller.modes[2], MODE_ASLEEP)
+        self.assertEqual(self.step(poller, 60), [3])
+
+    def test_rate_cap(self):
+        poller = self.poller(max_rate=1, burst=2)
+        # the vehicle list takes one request, the driving vehicle the other
+        self.assertEqual(self.step(poller, 0), [2])
+        self.assertEqual(poller.next_due(), 1)
+        self.assertEqual(self.step(poller, 1), [3])
+        self.assertEqual(self.step(poller, 3), [4])
+        self.assertEqual(self.server.requests['vehicles'], 1)
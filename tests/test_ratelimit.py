@@ -0,0 +1,125 @@
+import threading
+import time
+from unittest import TestCase, mock
+
+from requests import Response, Session
+
+from yauta.ratelimit import (
+    RateLimiter,
+    TokenBucket,
+    parse_retry_after,
+    vehicle_id_from_url
+)
+from yauta.tesla import TeslaAPI
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def response(status, headers=None):
+    resp = Response()
+    resp.status_code = status
+    resp.headers.update(headers or {})
+    resp._content = b'{"response": []}'
+    return resp
+
+
+class TokenBucketTest(TestCase):
+    def test_reserve(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, burst=2, clock=clock)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0.5)
+        self.assertEqual(bucket.reserve(), 1.0)
+        clock.now = 10
+        self.assertEqual(bucket.reserve(), 0)
+
+    def test_block(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, burst=2, clock=clock)
+        bucket.block(5)
+        self.assertEqual(bucket.reserve(), 5.5)
+        clock.now = 6
+        self.assertEqual(bucket.reserve(), 0)
+
+
+class RateLimiterTest(TestCase):
+    def test_helpers(self):
+        self.assertEqual(parse_retry_after('3'), 3)
+        self.assertEqual(parse_retry_after(None), None)
+        self.assertEqual(parse_retry_after('soon'), None)
+        self.assertEqual(
+            parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0)
+        self.assertEqual(
+            vehicle_id_from_url('https://x/api/1/vehicles/1111/wake_up'),
+            '1111')
+        self.assertIsNone(vehicle_id_from_url('https://x/api/1/vehicles'))
+
+    def test_vehicle_buckets_are_separate(self):
+        clock = FakeClock()
+        limiter = RateLimiter(
+            rate=100, burst=100, vehicle_rate=1, vehicle_burst=1,
+            jitter=0, clock=clock)
+        self.assertEqual(limiter.reserve('1'), 0)
+        self.assertEqual(limiter.reserve('2'), 0)
+        self.assertEqual(limiter.reserve('1'), 1)
+        self.assertEqual(limiter.reserve(), 0)
+
+    def test_queue_depth(self):
+        limiter = RateLimiter(rate=20, burst=1, jitter=0)
+        depths = []
+        threads = [
+            threading.Thread(target=limiter.acquire) for _ in range(5)]
+        for t in threads:
+            t.start()
+        time.sleep(0.02)
+        depths.append(limiter.queue_depth)
+        for t in threads:
+            t.join()
+        self.assertGreater(depths[0], 0)
+        self.assertEqual(limiter.queue_depth, 0)
+
+    def test_api_retries_429(self):
+        limiter = RateLimiter(rate=100, burst=100, jitter=0)
+        api = TeslaAPI(
+           email='xxxxxxxx',
+           password='xxxxxxxx',
+           client_id='xxxxxxxx',
+           client_secret='xxxxxxxx',
+           rate_limiter=limiter
+        )
+        api.initialize('xxxxxxxx')
+        responses = [
+            response(429, {'Retry-After': '0.2'}),
+            response(200)
+        ]
+        with mock.patch.object(
+                Session, 'request', side_effect=responses) as request:
+            start = time.monotonic()
+            resp = api.get('/api/1/vehicles')
+            elapsed = time.monotonic() - start
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(request.call_count, 2)
+        self.assertGreaterEqual(elapsed, 0.2)
+
+    def test_api_gives_up_on_429(self):
+        api = TeslaAPI(
+           email='xxxxxxxx',
+           password='xxxxxxxx',
+           client_id='xxxxxxxx',
+           client_secret='xxxxxxxx',
+           rate_limiter=RateLimiter(rate=100, max_retries=2, jitter=0)
+        )
+        api.initialize('xxxxxxxx')
+        throttled = response(429, {'Retry-After': '0'})
+        with mock.patch.object(
+                Session, 'request', return_value=throttled) as request:
+            resp = api.get('/api/1/vehicles')
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(request.call_count, 3)
@@ -0,0 +1,113 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import numpy
+
+from yauta.exceptions import TeslaException
+from yauta.recorder import TelemetryRecorder
+from yauta.snapshot import VehicleSnapshot
+
+
+def vehicle_data(level, speed=None):
+    return {
+        'id': 1111,
+        'charge_state': {'battery_level': level, 'charger_power': 0},
+        'drive_state': {'speed': speed, 'latitude': 37.4},
+        'vehicle_state': {'odometer': 1000.0 + level}
+    }
+
+
+class TelemetryRecorderTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.recorder = TelemetryRecorder(self.tmp.name, buffer_size=4)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_record_and_query(self):
+        for i in range(10):
+            self.recorder.record(1111, vehicle_data(i, speed=i * 2), 100 + i)
+        self.recorder.record(2222, VehicleSnapshot(vehicle_data(50)), 100)
+
+        data = self.recorder.query(1111, start=103, end=106)
+        numpy.testing.assert_array_equal(data['timestamp'], [103, 104, 105])
+        numpy.testing.assert_array_equal(data['battery_level'], [3, 4, 5])
+        numpy.testing.assert_array_equal(data['speed'], [6, 8, 10])
+        self.assertTrue(numpy.isnan(data['inside_temp']).all())
+
+        data = self.recorder.query(2222, columns=['odometer'])
+        self.assertEqual(sorted(data), ['odometer', 'timestamp'])
+        numpy.testing.assert_array_equal(data['odometer'], [1050])
+        self.assertEqual(self.recorder.vehicles(), ['1111', '2222'])
+
+    def test_files_are_fixed_width(self):
+        for i in range(5):
+            self.recorder.record(1111, vehicle_data(i), 100 + i)
+        self.recorder.flush()
+        path = os.path.join(self.tmp.name, '1111', 'battery_level.f8')
+        self.assertEqual(os.path.getsize(path), 5 * 8)
+
+    def test_out_of_order_rejected(self):
+        self.recorder.record(1111, vehicle_data(1), 100)
+        with self.assertRaises(TeslaException):
+            self.recorder.record(1111, vehicle_data(1), 99)
+
+    def test_retention(self):
+        recorder = TelemetryRecorder(self.tmp.name, retention=5)
+        for i in range(10):
+            recorder.record(1111, vehicle_data(i), 100 + i)
+        recorder.compact(now=110)
+        data = recorder.query(1111)
+        numpy.testing.assert_array_equal(data['timestamp'], [105, 106, 107,
+                                                             108, 109])
+        numpy.testing.assert_array_equal(data['battery_level'], [5, 6, 7,
+                                                                 8, 9])
+
+    def test_compaction_swaps_every_column_at_once(self):
+        recorder = TelemetryRecorder(self.tmp.name, retention=5)
+        for i in range(10):
+            recorder.record(1111, vehicle_data(i), 100 + i)
+        before = recorder.query(1111)
+
+        # dying before the swap leaves the old columns in use
+        with mock.patch('yauta.recorder.os.replace', side_effect=OSError):
+            with self.assertRaises(OSError):
+                recorder.compact(now=110)
+        data = TelemetryRecorder(self.tmp.name).query(1111)
+        numpy.testing.assert_array_equal(data['timestamp'], range(100, 110))
+        numpy.testing.assert_array_equal(data['battery_level'], range(10))
+
+        recorder.compact(now=110)
+        recorder.compact(now=112)
+        recorder.record(1111, vehicle_data(10), 110)
+        data = recorder.query(1111)
+        numpy.testing.assert_array_equal(data['timestamp'], range(107, 111))
+        numpy.testing.assert_array_equal(data['battery_level'], range(7, 11))
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.tmp.name, '1111'))),
+            ['CURRENT', 'g2'])
+        # earlier query results stay readable
+        numpy.testing.assert_array_equal(before['timestamp'], range(100, 110))
+
+    def test_torn_append_is_cut_off(self):
+        for i in range(4):
+            self.recorder.record(1111, vehicle_data(i), 100 + i)
+        # an append that died after writing a row and a half of timestamps
+        path = os.path.join(self.tmp.name, '1111', 'timestamp.f8')
+        with open(path, 'ab') as f:
+            f.write(numpy.array([104, 105], dtype='<f8').tobytes()[:12])
+
+        for i in range(5, 9):
+            self.recorder.record(1111, vehicle_data(i), 100 + i)
+        data = self.recorder.query(1111)
+        numpy.testing.assert_array_equal(
+            data['timestamp'], [100, 101, 102, 103, 105, 106, 107, 108])
+        numpy.testing.assert_array_equal(
+            data['battery_level'], [0, 1, 2, 3, 5, 6, 7, 8])
+        self.assertEqual(os.path.getsize(path), 8 * 8)
+
+    def test_empty_query(self):
+        data = self.recorder.query(3333)
+        self.assertEqual(len(data['timestamp']), 0)
@@ -0,0 +1,154 @@
+import os
+import random
+import tempfile
+import threading
+from unittest import TestCase
+
+from yauta.exceptions import TeslaException
+from yauta.scheduler import (
+    CommandScheduler,
+    SqliteScheduleStore,
+    TimerWheel
+)
+from yauta.tesla import TeslaAPI
+from yauta.testing import FakeOwnerAPI
+
+
+class TimerWheelTest(TestCase):
+    def test_timers_expire_on_their_tick(self):
+        wheel = TimerWheel(slots=(4, 4, 4), now=3)
+        rng = random.Random(1)
+        dues = [rng.randrange(0, 200) for _ in range(300)]
+        for due in dues:
+            wheel.add(due, due)
+        self.assertEqual(len(wheel), 300)
+
+        expired = []
+        for now in range(3, 201):
+            for timer in wheel.advance(now):
+                self.assertEqual(timer.value, timer.due)
+                self.assertLessEqual(timer.due, now)
+                if timer.due > 3:
+                    self.assertEqual(timer.due, now)
+                expired.append(timer.due)
+        self.assertEqual(sorted(expired), sorted(dues))
+        self.assertEqual(len(wheel), 0)
+
+    def test_cancel(self):
+        wheel = TimerWheel(slots=(4, 4))
+        keep = wheel.add(10, 'keep')
+        drop = wheel.add(10, 'drop')
+        far = wheel.add(1000, 'far')
+        self.assertTrue(wheel.cancel(drop))
+        self.assertFalse(wheel.cancel(drop))
+        self.assertEqual([t.value for t in wheel.advance(10)], ['keep'])
+        self.assertFalse(keep.active)
+        self.assertTrue(far.active)
+        self.assertEqual([t.value for t in wheel.advance(1000)], ['far'])
+
+
+class CommandSchedulerTest(TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.server = FakeOwnerAPI(fleet_size=3, asleep=[2]).start()
+        self.api = TeslaAPI(
+            email='xxxxxxxx',
+            password='xxxxxxxx',
+            client_id='xxxxxxxx',
+            client_secret='xxxxxxxx'
+        )
+        self.api.prefix_url = self.server.url
+        self.api.initialize()
+        self.api.get_vehicles()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SqliteScheduleStore(
+            os.path.join(self.tmp.name, 'schedule.db'))
+        self.results = []
+        self.done = threading.Semaphore(0)
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp.cleanup()
+
+    def on_result(self, action, result, error):
+        self.results.append((action.vehicle_id, action.command, error))
+        self.done.release()
+
+    def scheduler(self, **kwargs):
+        scheduler = CommandScheduler(
+            self.api, store=self.store, on_result=self.on_result,
+            clock=lambda: self.now, **kwargs)
+        self.addCleanup(scheduler.close)
+        return scheduler
+
+    def step(self, scheduler, at, results=0):
+        self.now = at
+        sent = scheduler.step()
+        for _ in range(results):
+            self.assertTrue(self.done.acquire(timeout=5))
+        return sent
+
+    def test_commands_run_when_due(self):
+        scheduler = self.scheduler(wake_ahead=60)
+        scheduler.schedule(1, 'door_lock', at=1300)
+        scheduler.schedule(2, 'set_charge_limit', at=1300, percent=80)
+        with self.assertRaises(TeslaException):
+            scheduler.schedule(1, 'set_charge_limit', at=1300, percent=5)
+        with self.assertRaises(TeslaException):
+            scheduler.schedule(1, 'not_a_command', at=1300)
+
+        self.assertEqual(self.step(scheduler, 1200), 0)
+        # the sleeping vehicle is woken ahead of time, the awake one not
+        self.assertEqual(self.step(scheduler, 1240), 1)
+        scheduler.close()
+        self.assertEqual(self.server.requests['wake_up'], 1)
+        self.assertEqual(self.server.requests['command'], 0)
+
+        scheduler = self.scheduler(wake_ahead=60)
+        self.step(scheduler, 1300, results=2)
+        self.assertEqual(sorted(self.results), [
+            (1, 'door_lock', None), (2, 'set_charge_limit', None)])
+        self.assertEqual(self.server.requests['command'], 2)
+        self.assertEqual(len(scheduler), 0)
+        self.assertEqual(self.store.load(), [])
+
+    def test_cancel_and_recurring(self):
+        scheduler = self.scheduler(wake_ahead=0)
+        once = scheduler.schedule(1, 'door_lock', at=1100)
+        daily = scheduler.schedule(3, 'charge_start', at=1100, every=86400)
+        self.assertTrue(scheduler.cancel(once.id))
+        self.assertFalse(scheduler.cancel(once.id))
+
+        self.step(scheduler, 1100, results=1)
+        self.assertEqual(self.results, [(3, 'charge_start', None)])
+        [upcoming] = scheduler.actions()
+        self.assertEqual((upcoming.id, upcoming.at), (daily.id, 87500))
+        self.assertEqual([a.at for a in self.store.load()], [87500])
+
+    def test_restart_and_grace(self):
+        scheduler = self.scheduler(grace=600)
+        scheduler.schedule(1, 'door_lock', at=1100)
+        scheduler.schedule(3, 'flash_lights', at=2000)
+        scheduler.close()
+
+        # back up after both were due, only one is recent enough to send
+        self.now = 2500
+        scheduler = self.scheduler(grace=600)
+        self.assertEqual(len(scheduler), 2)
+        self.step(scheduler, 2500, results=2)
+        errors = {command: error for _, command, error in self.results}
+        self.assertIsNone(errors['flash_lights'])
+        self.assertIsInstance(errors['door_lock'], TeslaException)
+        self.assertEqual(self.server.requests['command'], 1)
+
+    def test_bursts_are_spread(self):
+        scheduler = self.scheduler(wake_ahead=0, max_rate=2, burst=2)
+        for i in range(6):
+            scheduler.schedule(1, 'flash_lights', at=1100)
+        self.assertEqual(self.step(scheduler, 1100, results=2), 2)
+        self.assertEqual(scheduler.next_due(), 0.5)
+        self.assertEqual(self.step(scheduler, 1100.5, results=1), 1)
+        # never more than the burst at once
+        self.assertEqual(self.step(scheduler, 1102, results=2), 2)
+        self.assertEqual(self.step(scheduler, 1102.5, results=1), 1)
+        self.assertEqual(len(scheduler), 0)
@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import time
+from unittest import TestCase, IsolatedAsyncioTestCase
+
+from yauta.aio import AsyncTeslaAPI, AsyncTeslaVehicle
+from yauta.exceptions import TeslaException
+from yauta.singleflight import SingleFlight, AsyncSingleFlight
+from yauta.tesla import TeslaAPI
+from yauta.testing import FakeOwnerAPI
+from yauta.vehicle import TeslaVehicle
+
+CREDENTIALS = {
+    'email': 'xxxxxxxx',
+    'password': 'xxxxxxxx',
+    'client_id': 'xxxxxxxx',
+    'client_secret': 'xxxxxxxx'
+}
+
+
+def concurrently(fn, count=10):
+    results = []
+
+    def call():
+        try:
+            results.append(fn())
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+class SingleFlightTest(TestCase):
+    def test_concurrent_calls_coalesce(self):
+        flight = SingleFlight()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.1)
+            return len(calls)
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(flight.do('key', slow)))
+            for _ in range(10)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [1] * 10)
+        self.assertEqual(flight.do('key', slow), 2)
+
+    def test_error_is_shared(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def fail():
+            started.set()
+            release.wait()
+            raise ValueError('boom')
+
+        errors = []
+
+        def call():
+            try:
+                flight.do('key', fail)
+            except ValueError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=call)
+        follower.start()
+        time.sleep(0.05)
+        release.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(len(errors), 2)
+        self.assertIs(errors[0], errors[1])
+
+
+class AsyncSingleFlightTest(IsolatedAsyncioTestCase):
+    async def test_concurrent_calls_coalesce(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return len(calls)
+
+        results = await asyncio.gather(
+            *[flight.do('key', slow) for _ in range(10)])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [1] * 10)
+
+
+class VehicleReadCoalescingTest(TestCase):
+    def setUp(self):
+        self.server = FakeOwnerAPI(latency=0.1).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def vehicle(self, **kwargs):
+        api = TeslaAPI(pool_size=10, **dict(CREDENTIALS, **kwargs))
+        api.prefix_url = self.server.url
+        return TeslaVehicle(1, api.initialize())
+
+    def test_identical_reads_share_a_request(self):
+        vehicle = self.vehicle()
+        results = concurrently(vehicle.get_vehicle_data)
+        self.assertEqual(self.server.requests['vehicle_data'], 1)
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(r['id'] == 1 for r in results))
+
+        # different fields are different reads, commands are never shared
+        concurrently(lambda: vehicle.get_vehicle_data(['charge_state']), 3)
+        concurrently(vehicle.get_drive_state, 3)
+        concurrently(vehicle.honk_horn, 3)
+        self.assertEqual(self.server.requests['vehicle_data'], 2)
+        self.assertEqual(self.server.requests['data_request'], 1)
+        self.assertEqual(self.server.requests['command'], 3)
+
+    def test_errors_are_shared(self):
+        vehicle = self.vehicle()
+        self.server.errors = {500: 1.0}
+        results = concurrently(vehicle.get_vehicle_data)
+        self.assertEqual(self.server.requests['vehicle_data'], 1)
+        self.assertTrue(all(isinstance(r, TeslaException) for r in results))
+
+    def test_coalescing_off(self):
+        vehicle = self.vehicle(coalesce_reads=False)
+        concurrently(vehicle.get_vehicle_data, 3)
+        self.assertEqual(self.server.requests['vehicle_data'], 3)
+
+    def test_async(self):
+        async def run():
+            async with AsyncTeslaAPI(**CREDENTIALS) as api:
+                api.prefix_url = self.server.url
+                await api.initialize()
+                vehicle = AsyncTeslaVehicle(1, api)
+                return await api.gather(
+                    vehicle.get_vehicle_data() for _ in range(10))
+
+        results = asyncio.run(run())
+        self.assertEqual(self.server.requests['vehicle_data'], 1)
+        self.assertTrue(all(r['id'] == 1 for r in results))
@@ -0,0 +1,91 @@
+import json
+import os
+import sys
+from unittest import TestCase, mock
+
+from yauta.snapshot import (
+    ChargeState,
+    ClimateState,
+    DriveState,
+    VehicleSnapshot,
+    VehicleState
+)
+from yauta.tesla import TeslaAPI
+from yauta.vehicle import TeslaVehicle
+
+VEHICLE_DATA = {
+    'id': 1111,
+    'vehicle_id': 1,
+    'display_name': None,
+    'state': 'online',
+    'charge_state': {
+        'battery_level': 80,
+        'charging_state': 'Disconnected',
+        'managed_charging_active': False
+    },
+    'climate_state': {'inside_temp': 20.5, 'outside_temp': 11.0},
+    'drive_state': {'latitude': 37.4, 'longitude': -122.1, 'speed': None},
+    'vehicle_state': {'odometer': 1234.5, 'locked': True},
+    'gui_settings': {'gui_distance_units': 'mi/hr'}
+}
+
+
+class VehicleSnapshotTest(TestCase):
+    def test_lazy_decode(self):
+        snapshot = VehicleSnapshot(VEHICLE_DATA)
+        self.assertTrue(isinstance(snapshot._charge_state, dict))
+        self.assertEqual(snapshot.charge_state.battery_level, 80)
+        self.assertTrue(isinstance(snapshot._charge_state, ChargeState))
+        self.assertTrue(isinstance(snapshot._drive_state, dict))
+
+    def test_attributes(self):
+        snapshot = VehicleSnapshot(VEHICLE_DATA, lazy=False)
+        self.assertTrue(isinstance(snapshot._drive_state, DriveState))
+        self.assertEqual(snapshot.id, 1111)
+        self.assertIsNone(snapshot.drive_state.speed)
+        self.assertIsNone(snapshot.drive_state.heading)
+        self.assertFalse(snapshot.charge_state.managed_charging_active)
+        self.assertEqual(
+            snapshot.gui_settings, {'gui_distance_units': 'mi/hr'})
+        with self.assertRaises(AttributeError):
+            snapshot.charge_state.nope
+        with self.assertRaises(AttributeError):
+            snapshot.charge_state.extra = 1
+
+    def test_to_dict_round_trip(self):
+        snapshot = VehicleSnapshot(VEHICLE_DATA)
+        snapshot.climate_state
+        self.assertEqual(snapshot.to_dict(), VEHICLE_DATA)
+        partial = VehicleSnapshot({'id': 1, 'charge_state': {}})
+        self.assertIsNone(partial.drive_state)
+        self.assertEqual(partial.to_dict(), {'id': 1, 'charge_state': {}})
+
+    def test_records_are_smaller_than_dicts(self):
+        path = os.path.join(
+            os.path.dirname(__file__), 'fixtures', 'vehicle_data.json')
+        with open(path) as f:
+            data = json.load(f)
+        for group, record in [('charge_state', ChargeState),
+                              ('climate_state', ClimateState),
+                              ('drive_state', DriveState),
+                              ('vehicle_state', VehicleState)]:
+            value = record.from_dict(data[group])
+            # every field of a real response is declared
+            self.assertIsNone(value._extra, group)
+            self.assertEqual(value.to_dict(), data[group])
+            self.assertLess(
+                sys.getsizeof(value), sys.getsizeof(data[group]) * 0.75,
+                group)
+
+    def test_get_vehicle_snapshot(self):
+        t = TeslaAPI(
+           email='xxxxxxxx',
+           password='xxxxxxxx',
+           client_id='xxxxxxxx',
+           client_secret='xxxxxxxx'
+        )
+        vehicle = TeslaVehicle(1111, t)
+        with mock.patch.object(t, 'get') as get:
+            get.return_value.json.return_value = {'response': VEHICLE_DATA}
+            snapshot = vehicle.get_vehicle_snapshot()
+        self.assertEqual(snapshot.vehicle_state.odometer, 1234.5)
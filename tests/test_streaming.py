@@ -0,0 +1,196 @@
+import asyncio
+import threading
+from unittest import TestCase, IsolatedAsyncioTestCase, mock
+
+from aiohttp import web
+
+from yauta.aio import AsyncTeslaAPI, AsyncTeslaVehicle
+from yauta.exceptions import TeslaException
+from yauta.streaming import StreamingClient
+from yauta.tesla import TeslaAPI
+from yauta.vehicle import TeslaVehicle
+
+
+class FakeStreamingServer(object):
+    """
+    Stand-in for the streaming websocket, run on its own thread
+
+    Rejects the token 'expired', otherwise sends `updates_per_connection`
+    updates and then disconnects the vehicle.
+    """
+
+    def __init__(self, updates_per_connection=2):
+        self.updates_per_connection = updates_per_connection
+        self.subscriptions = []
+        self.sent = 0
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.router.add_get('/streaming/', self.handle)
+        self.runner = web.AppRunner(app)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        self.loop.run_until_complete(site.start())
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = 'ws://127.0.0.1:%s/streaming/' % port
+        self._ready.set()
+        self.loop.run_forever()
+
+    async def handle(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        subscribe = await ws.receive_json()
+        self.subscriptions.append(subscribe)
+        tag = subscribe['tag']
+        if subscribe['token'] == 'expired':
+            await ws.send_json({
+                'msg_type': 'data:error',
+                'tag': tag,
+                'value': "Can't validate token. ",
+                'error_type': 'client_error'
+            })
+            await ws.close()
+            return ws
+        for _ in range(self.updates_per_connection):
+            self.sent += 1
+            await ws.send_json({
+                'msg_type': 'data:update',
+                'tag': tag,
+                'value': '%s,%s,,37.5,D' % (1000 + self.sent, self.sent)
+            })
+        await ws.send_json({
+            'msg_type': 'data:error',
+            'tag': tag,
+            'error_type': 'vehicle_disconnected'
+        })
+        await ws.close()
+        return ws
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(
+            self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+COLUMNS = ['speed', 'power', 'est_lat', 'shift_state']
+
+
+class StreamingTest(TestCase):
+    def setUp(self):
+        self.server = FakeStreamingServer()
+        self.api = TeslaAPI(
+           email='xxxxxxxx',
+           password='xxxxxxxx',
+           client_id='xxxxxxxx',
+           client_secret='xxxxxxxx'
+        )
+        self.api.access_token = 'expired'
+
+    def tearDown(self):
+        self.server.close()
+
+    def reauthenticate(self, stale_token=None):
+        self.api.access_token = 'fresh'
+
+    def test_parse(self):
+        client = StreamingClient(1, lambda: 'x', columns=COLUMNS)
+        self.assertEqual(client.parse('1000,55,,37.5,D'), {
+            'timestamp': 1000,
+            'speed': 55,
+            'power': None,
+            'est_lat': 37.5,
+            'shift_state': 'D'
+        })
+
+    def test_stream_generator_reconnects_and_refreshes(self):
+        vehicle = TeslaVehicle(1111, self.api, vehicle_id=1)
+        with mock.patch.object(
+                self.api, 'reauthenticate', self.reauthenticate):
+            stream = vehicle.stream(
+                COLUMNS, url=self.server.url, reconnect_delay=0.01)
+            records = [next(stream) for _ in range(5)]
+            stream.close()
+        self.assertEqual([r['speed'] for r in records], [1, 2, 3, 4, 5])
+        self.assertEqual(records[0]['timestamp'], 1001)
+        self.assertEqual(
+            [s['token'] for s in self.server.subscriptions[:2]],
+            ['expired', 'fresh'])
+        self.assertEqual(self.server.subscriptions[0]['tag'], '1')
+        self.assertEqual(
+            self.server.subscriptions[0]['value'],
+            'speed,power,est_lat,shift_state')
+
+    def test_stream_callback(self):
+        self.api.access_token = 'fresh'
+        vehicle = TeslaVehicle(1111, self.api, vehicle_id=1)
+        received = []
+        done = threading.Event()
+
+        def callback(record):
+            received.append(record)
+            if len(received) == 3:
+                done.set()
+
+        handle = vehicle.stream(
+            COLUMNS, callback=callback, url=self.server.url,
+            reconnect_delay=0.01)
+        self.assertTrue(done.wait(5))
+        handle.stop(5)
+        self.assertFalse(handle.is_alive())
+
+    def test_gives_up(self):
+        client = StreamingClient(
+            1, lambda: 'fresh', columns=COLUMNS,
+            url='ws://127.0.0.1:1/streaming/', reconnect_delay=0.01,
+            max_reconnects=2)
+        with self.assertRaises(TeslaException):
+            asyncio.run(client.stream().__anext__())
+
+    def test_gives_up_on_rejected_tokens(self):
+        refreshes = []
+        client = StreamingClient(
+            1, lambda: 'expired', refreshes.append, columns=COLUMNS,
+            url=self.server.url, reconnect_delay=0.01, max_refreshes=2)
+        with mock.patch('yauta.streaming.asyncio.sleep',
+                        wraps=asyncio.sleep) as sleep:
+            with self.assertRaises(TeslaException):
+                asyncio.run(client.stream().__anext__())
+        self.assertEqual(refreshes, ['expired', 'expired'])
+        self.assertEqual(len(self.server.subscriptions), 3)
+        # refreshes back off like any other reconnect
+        self.assertEqual(
+            [c.args[0] for c in sleep.call_args_list], [0.01, 0.02])
+
+
+class AsyncStreamingTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.server = FakeStreamingServer()
+
+    def tearDown(self):
+        self.server.close()
+
+    async def test_stream(self):
+        api = AsyncTeslaAPI(
+            email='xxxxxxx',
+            password='xxxxxxx',
+            client_id='xxxxxxxx',
+            client_secret='xxxxxxxx'
+        )
+        await api.initialize('fresh')
+        vehicle = AsyncTeslaVehicle(1111, api, vehicle_id=1)
+        records = []
+        stream = vehicle.stream(
+            COLUMNS, url=self.server.url, reconnect_delay=0.01)
+        async for record in stream:
+            records.append(record)
+            if len(records) == 3:
+                break
+        await stream.aclose()
+        await api.close()
+        self.assertEqual([r['speed'] for r in records], [1, 2, 3])
@@ -0,0 +1,101 @@
+from unittest import TestCase
+
+import numpy
+
+from yauta.exceptions import TeslaException
+from yauta.fleet import FleetResult
+from yauta.snapshot import VehicleSnapshot
+from yauta.table import FleetTable
+from yauta.testing import vehicle_data
+
+
+def fleet(size):
+    fleet = {}
+    for i in range(1, size + 1):
+        data = vehicle_data(i, 'online')
+        data['charge_state']['battery_level'] = i * 10
+        data['vehicle_state']['locked'] = i % 2 == 0
+        if i % 3 == 0:
+            data['charge_state']['charging_state'] = 'Charging'
+        fleet[i] = data
+    return fleet
+
+
+class FleetTableTest(TestCase):
+    def setUp(self):
+        self.table = FleetTable(capacity=2)
+        self.table.update_many(fleet(8), timestamp=100)
+
+    def test_filter(self):
+        table = self.table
+        self.assertEqual(len(table), 8)
+        self.assertEqual(
+            list(table.filter(
+                battery_level__lt=50, charging_state='Disconnected')),
+            [1, 2, 4])
+        self.assertEqual(list(table.filter(locked=False)), [1, 3, 5, 7])
+        self.assertEqual(
+            list(table.filter(charging_state__in=['Charging', 'Starting'])),
+            [3, 6])
+        self.assertEqual(list(table.filter(charging_state='Unknown')), [])
+        self.assertEqual(table.count(battery_level__ge=50), 4)
+        self.assertEqual(table.count(shift_state__isnull=True), 8)
+        with self.assertRaises(TeslaException):
+            table.filter(charging_state__lt='B')
+        with self.assertRaises(TeslaException):
+            table.filter(no_such_column=1)
+
+    def test_update_in_place(self):
+        table = self.table
+        table.update(2, {'charge_state': {'battery_level': 95}}, timestamp=200)
+        # groups left out of the update keep their values
+        row = table.row(2)
+        self.assertEqual(row['battery_level'], 95)
+        self.assertIs(row['locked'], True)
+        self.assertEqual(row['updated_at'], 200)
+        self.assertEqual(len(table), 8)
+
+        table.update(9, VehicleSnapshot.from_dict(vehicle_data(9, 'online')))
+        self.assertIn(9, table)
+        self.assertIsNone(table.row(10))
+
+        self.assertTrue(table.remove(1))
+        self.assertFalse(table.remove(1))
+        self.assertEqual(sorted(table.ids), [2, 3, 4, 5, 6, 7, 8, 9])
+        self.assertEqual(table.row(9)['battery_level'], 9)
+        self.assertEqual(
+            dict(zip(table.ids, table.column('battery_level')))[2], 95)
+
+    def test_sort_and_aggregate(self):
+        table = self.table
+        table.update(3, {'charge_state': {'battery_level': None}})
+        self.assertEqual(
+            list(table.sort('battery_level')), [1, 2, 4, 5, 6, 7, 8, 3])
+        self.assertEqual(
+            list(table.sort('battery_level', descending=True, limit=3)),
+            [8, 7, 6])
+        self.assertEqual(
+            list(table.sort('battery_level', limit=2, locked=True)), [2, 4])
+
+        self.assertEqual(table.aggregate('battery_level', 'count'), 7)
+        self.assertEqual(table.aggregate('battery_level', 'max'), 80)
+        self.assertEqual(
+            table.aggregate('battery_level', 'mean', locked=True), 50)
+        self.assertTrue(numpy.isnan(
+            table.aggregate('battery_level', 'mean', state='asleep')))
+        self.assertEqual(table.aggregate('locked', 'sum'), 4)
+        with self.assertRaises(TeslaException):
+            table.aggregate('battery_level', 'mode')
+
+        self.assertEqual(
+            table.value_counts('charging_state'),
+            {'Disconnected': 6, 'Charging': 2})
+        self.assertEqual(table.value_counts('locked'), {True: 4, False: 4})
+
+    def test_update_many_skips_failures(self):
+        table = FleetTable()
+        table.update_many({
+            1: FleetResult(1, vehicle_data(1, 'online'), None, 0.1),
+            2: FleetResult(2, None, TeslaException('asleep'), 0.1)
+        })
+        self.assertEqual(list(table.ids), [1])
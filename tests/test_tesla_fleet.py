@@ -0,0 +1,121 @@
+import os
+from unittest import TestCase
+
+from yauta.cache import COMMAND_INVALIDATES
+from yauta.exceptions import TeslaException, VehicleOfflineException
+from yauta.fleet import BroadcastReport, FleetResult, TeslaFleet
+from yauta.tesla import TeslaAPI
+from yauta.testing import FakeOwnerAPI
+from yauta.vehicle import COMMANDS, TeslaVehicle
+
+from .common import yauta_vcr
+
+
+class TeslaFleetTest(TestCase):
+    def setUp(self):
+        access_token = os.environ.get('TESLA_ACCESS_TOKEN', 'xxxxxxxx')
+        self.api = TeslaAPI(
+           email='xxxxxxxx',
+           password='xxxxxxxx',
+           client_id='xxxxxxxx',
+           client_secret='xxxxxxxx'
+        )
+        self.api.initialize(access_token=access_token)
+
+    @yauta_vcr.use_cassette('test_tesla_fleet_poll.yml')
+    def test_vehicles_route_independently(self):
+        vehicles = self.api.get_vehicles()
+        self.assertEqual(self.api.prefix_url, TeslaAPI.BASE_URL)
+        self.assertEqual(
+            [v.prefix_url for v in vehicles],
+            ['/api/1/vehicles/1111',
+             '/api/1/vehicles/2222',
+             '/api/1/vehicles/3333']
+        )
+
+    @yauta_vcr.use_cassette('test_tesla_fleet_poll.yml')
+    def test_poll(self):
+        fleet = TeslaFleet(self.api, max_workers=3)
+        results = fleet.poll()
+        self.assertEqual(sorted(results), [1111, 2222, 3333])
+        self.assertEqual(
+            results[1111].result['charge_state']['battery_level'], 80)
+        self.assertEqual(
+            results[2222].result['charge_state']['battery_level'], 55)
+        self.assertIsNone(results[3333].result)
+        self.assertTrue(isinstance(results[3333].error, TeslaException))
+        self.assertTrue(all(r.elapsed >= 0 for r in results.values()))
+
+
+class TeslaFleetBroadcastTest(TestCase):
+    def setUp(self):
+        self.server = FakeOwnerAPI(fleet_size=4, asleep=[3, 4]).start()
+        self.api = TeslaAPI(
+           email='xxxxxxxx',
+           password='xxxxxxxx',
+           client_id='xxxxxxxx',
+           client_secret='xxxxxxxx',
+           pool_size=4
+        )
+        self.api.prefix_url = self.server.url
+        self.api.initialize()
+        self.fleet = TeslaFleet(self.api, max_workers=4)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_broadcast(self):
+        report = self.fleet.broadcast('door_lock')
+        self.assertEqual(sorted(report.succeeded), [1, 2])
+        self.assertEqual(sorted(report.failed), [3, 4])
+        self.assertFalse(report.ok)
+        self.assertTrue(all(
+            isinstance(e, VehicleOfflineException)
+            for e in report.reasons().values()))
+        summary = report.summary()
+        self.assertEqual(
+            (summary['vehicles'], summary['succeeded'], summary['failed']),
+            (4, 2, 2))
+        # asleep vehicles fail without a request
+        self.assertEqual(self.server.requests['command'], 2)
+
+    def test_broadcast_wake_and_filter(self):
+        report = self.fleet.broadcast(
+            'set_charge_limit', vehicle_filter=lambda v: v.id != 1,
+            wake=True, percent=80)
+        self.assertTrue(report.ok)
+        self.assertEqual(sorted(report.results), [2, 3, 4])
+        self.assertEqual(self.server.requests['wake_up'], 2)
+
+    def test_broadcast_validates_once(self):
+        for command, params in (
+                ('set_charge_limit', {'percent': 5}),
+                ('actuate_trunk', {'position': 'side'}),
+                ('remote_seat_heater_request', {'heater': 9, 'level': 1}),
+                ('set_charge_limit', {'limit': 80}),
+                ('door_lock', {'percent': 80}),
+                ('self_destruct', {}),
+                ('_call', {}),
+                # public methods that are not commands
+                ('get_vehicle_data', {}),
+                ('stream', {}),
+                ('wake_up', {})):
+            with self.assertRaises(TeslaException):
+                self.fleet.broadcast(command, **params)
+        self.assertEqual(self.server.requests['vehicles'], 0)
+        self.assertEqual(self.server.requests['command'], 0)
+
+    def test_commands_are_vehicle_methods(self):
+        for command in COMMANDS:
+            self.assertTrue(callable(getattr(TeslaVehicle, command)))
+        self.assertEqual(set(COMMAND_INVALIDATES), COMMANDS)
+
+    def test_rejected_command_fails(self):
+        report = BroadcastReport('door_lock', {
+            1: FleetResult(None, {'result': True, 'reason': ''}, None, 0.1),
+            2: FleetResult(
+                None, {'result': False, 'reason': 'user_present'}, None, 0.2)
+        }, 0.2)
+        self.assertEqual(list(report.succeeded), [1])
+        self.assertEqual(report.reasons(), {2: 'user_present'})
+        self.assertEqual(report.summary()['slowest'], 0.2)
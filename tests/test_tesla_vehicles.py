@@ -1,7 +1,11 @@
 import os
-from unittest import TestCase
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, mock
 
+from yauta.exceptions import TeslaException, TeslaWakeTimeoutException
 from yauta.tesla import TeslaAPI
+from yauta.testing import FakeOwnerAPI
 from yauta.vehicle import TeslaVehicle
 
 from .common import yauta_vcr
@@ -22,3 +26,84 @@ class TeslaVehicleTest(TestCase):
         vehicle = TeslaVehicle(vehicle_id, t)
         data = vehicle.get_vehicle_data()
         self.assertTrue(data)
+
+    @yauta_vcr.use_cassette('test_tesla_vehicle_wake_up_wait.yml')
+    @mock.patch('yauta.vehicle.time.sleep')
+    def test_wake_up_wait(self, sleep):
+        access_token = os.environ.get('TESLA_ACCESS_TOKEN', 'xxxxxxxx')
+        t = TeslaAPI(
+           email='xxxxxxxx',
+           password='xxxxxxxx',
+           client_id='xxxxxxxx',
+           client_secret='xxxxxxxx'
+        )
+        t.initialize(access_token=access_token)
+        vehicle = TeslaVehicle(1111, t)
+        resp = vehicle.wake_up(wait=True)
+        self.assertEqual(resp['state'], 'online')
+        self.assertEqual([c[0][0] for c in sleep.call_args_list], [1, 1.5])
+
+    def test_wake_up_timeout(self):
+        t = TeslaAPI(
+           email='xxxxxxxx',
+           password='xxxxxxxx',
+           client_id='xxxxxxxx',
+           client_secret='xxxxxxxx'
+        )
+        vehicle = TeslaVehicle(1111, t)
+        with mock.patch.object(
+                vehicle, '_call', return_value={'state': 'asleep'}):
+            with self.assertRaises(TeslaWakeTimeoutException):
+                vehicle.wake_up(wait=True, timeout=0)
+
+    @mock.patch('yauta.vehicle.WAKE_POLL_INITIAL', 0.05)
+    def test_concurrent_wakes_share_one_request(self):
+        with FakeOwnerAPI(asleep=1.0, wake_delay=0.6,
+                          latency={'wake_up': 0.2}) as server:
+            t = TeslaAPI(
+               email='xxxxxxxx',
+               password='xxxxxxxx',
+               client_id='xxxxxxxx',
+               client_secret='xxxxxxxx'
+            )
+            t.prefix_url = server.url
+            t.initialize()
+            vehicle = TeslaVehicle(1, t)
+            start = time.monotonic()
+            with ThreadPoolExecutor(max_workers=3) as pool:
+                woken = pool.submit(vehicle.wake_up)
+                online = pool.submit(vehicle.wake_up, wait=True, timeout=5)
+                hurried = pool.submit(
+                    vehicle.wake_up, wait=True, timeout=0.4)
+                with self.assertRaises(TeslaWakeTimeoutException):
+                    hurried.result()
+                # the shortest timeout is the caller's own
+                self.assertLess(time.monotonic() - start, 0.6)
+                self.assertEqual(online.result()['state'], 'online')
+                self.assertEqual(woken.result()['state'], 'asleep')
+            self.assertEqual(server.requests['wake_up'], 1)
+
+    def test_get_sub_states(self):
+        t = TeslaAPI(
+           email='xxxxxxxx',
+           password='xxxxxxxx',
+           client_id='xxxxxxxx',
+           client_secret='xxxxxxxx'
+        )
+        vehicle = TeslaVehicle(1111, t)
+        with mock.patch.object(t, 'get') as get:
+            get.return_value.json.return_value = {
+                'response': {'battery_level': 80}}
+            self.assertEqual(
+                vehicle.get_charge_state(), {'battery_level': 80})
+            get.assert_called_with(
+                '/api/1/vehicles/1111/data_request/charge_state')
+            vehicle.get_drive_state()
+            get.assert_called_with(
+                '/api/1/vehicles/1111/data_request/drive_state')
+            vehicle.get_vehicle_data(fields=['charge_state', 'drive_state'])
+            get.assert_called_with(
+                '/api/1/vehicles/1111/vehicle_data'
+                '?endpoints=charge_state%3Bdrive_state')
+        with self.assertRaises(TeslaException):
+            vehicle.get_vehicle_data(fields=['nope'])
@@ -0,0 +1,62 @@
+import time
+from unittest import TestCase
+
+from yauta.exceptions import TeslaException, VehicleOfflineException
+from yauta.fleet import TeslaFleet
+from yauta.ratelimit import RateLimiter
+from yauta.tesla import TeslaAPI
+from yauta.testing import FakeOwnerAPI
+from yauta.vehicle import TeslaVehicle
+
+
+def api(server, **kwargs):
+    t = TeslaAPI(
+       email='xxxxxxxx',
+       password='xxxxxxxx',
+       client_id='xxxxxxxx',
+       client_secret='xxxxxxxx',
+       **kwargs
+    )
+    t.prefix_url = server.url
+    return t.initialize()
+
+
+class FakeOwnerAPITest(TestCase):
+    def test_fleet_poll(self):
+        with FakeOwnerAPI(fleet_size=20, latency=0.05) as server:
+            fleet = TeslaFleet(api(server, pool_size=20), max_workers=20)
+            start = time.monotonic()
+            results = fleet.poll(fields=['charge_state'])
+            elapsed = time.monotonic() - start
+        self.assertEqual(len(results), 20)
+        self.assertTrue(all(r.error is None for r in results.values()))
+        self.assertEqual(
+            sorted(results[1].result),
+            ['charge_state', 'display_name', 'id', 'state', 'vehicle_id',
+             'vin'])
+        self.assertLess(elapsed, 0.05 * 20)
+        self.assertEqual(server.requests['vehicle_data'], 20)
+
+    def test_sleeping_vehicle(self):
+        with FakeOwnerAPI(asleep=[1], wake_delay=0.2) as server:
+            vehicle = api(server).get_vehicles()[0]
+            with self.assertRaises(VehicleOfflineException):
+                vehicle.get_vehicle_data()
+            self.assertEqual(server.requests['vehicle_data'], 0)
+            self.assertEqual(
+                vehicle.wake_up(wait=True, timeout=5)['state'], 'online')
+            self.assertTrue(vehicle.get_charge_state()['battery_level'])
+            self.assertEqual(server.requests['wake_up'], 1)
+
+    def test_error_injection(self):
+        with FakeOwnerAPI(errors={500: 1.0}) as server:
+            vehicle = TeslaVehicle(1, api(server))
+            with self.assertRaises(TeslaException):
+                vehicle.honk_horn()
+
+        with FakeOwnerAPI(errors={429: 0.5}, retry_after=0, seed=1) as server:
+            t = api(server, rate_limiter=RateLimiter(
+                rate=1000, burst=1000, max_retries=10))
+            for _ in range(10):
+                self.assertEqual(len(t.get_vehicles()), 1)
+            self.assertGreater(server.requests['vehicles'], 10)
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+from unittest import TestCase, IsolatedAsyncioTestCase, mock
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from requests import Response, Session
+
+from yauta.aio import AsyncTeslaAPI
+from yauta.tesla import TeslaAPI
+from yauta.tokens import (
+    FileTokenStore,
+    MemoryTokenStore,
+    SqliteTokenStore,
+    TokenStore,
+    token_from_response
+)
+
+
+def response(status, body):
+    resp = Response()
+    resp.status_code = status
+    resp._content = json.dumps(body).encode()
+    return resp
+
+
+class FakeOwnerAPI(object):
+    """
+    Answers requests for a single valid access token, `token_N` where N
+    is the number of token grants made so far
+    """
+
+    def __init__(self):
+        self.grants = []
+        self.lock = threading.Lock()
+
+    @property
+    def token(self):
+        return 'token_%s' % len(self.grants)
+
+    def request(self, session, method, url, *args, **kwargs):
+        if '/oauth/token' in url:
+            time.sleep(0.05)
+            with self.lock:
+                self.grants.append(kwargs['data']['grant_type'])
+                return response(200, {
+                    'access_token': self.token,
+                    'refresh_token': 'refresh_%s' % len(self.grants),
+                    'expires_in': 3888000,
+                    'created_at': int(time.time())
+                })
+        if session.headers['Authorization'] != 'Bearer %s' % self.token:
+            return response(401, {})
+        return response(200, {'response': []})
+
+
+class TokenStoreTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_stores_round_trip(self):
+        token = token_from_response({
+            'access_token': 'a',
+            'refresh_token': 'r',
+            'expires_in': 100,
+            'created_at': 1000
+        })
+        self.assertEqual(token['expires_at'], 1100)
+        stores = [
+            MemoryTokenStore(),
+            FileTokenStore(os.path.join(self.tmp.name, 'tokens.json')),
+            SqliteTokenStore(os.path.join(self.tmp.name, 'tokens.db'))
+        ]
+        for store in stores:
+            self.assertIsNone(store.load('me@example.com'))
+            store.save('me@example.com', token)
+            self.assertEqual(store.load('me@example.com'), token)
+            store.delete('me@example.com')
+            self.assertIsNone(store.load('me@example.com'))
+
+    def test_incomplete_store(self):
+        class ReadOnlyTokenStore(TokenStore):
+            def load(self, key):
+                return None
+
+        with self.assertRaises(TypeError):
+            ReadOnlyTokenStore()
+
+    def test_file_store_is_private(self):
+        path = os.path.join(self.tmp.name, 'tokens.json')
+        FileTokenStore(path).save('me@example.com', {'access_token': 'a'})
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+
+
+class TeslaAPITokenTest(TestCase):
+    def setUp(self):
+        self.owner_api = FakeOwnerAPI()
+        patcher = mock.patch.object(
+            Session, 'request',
+            lambda session, *args, **kwargs: self.owner_api.request(
+                session, *args, **kwargs))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = MemoryTokenStore()
+
+    def api(self):
+        return TeslaAPI(
+           email='me@example.com',
+           password='xxxxxxxx',
+           client_id='xxxxxxxx',
+           client_secret='xxxxxxxx',
+           token_store=self.store
+        )
+
+    def test_initialize_uses_stored_token(self):
+        self.api().initialize()
+        self.assertEqual(self.owner_api.grants, ['password'])
+        api = self.api().initialize()
+        self.assertEqual(self.owner_api.grants, ['password'])
+        self.assertEqual(api.access_token, 'token_1')
+        self.assertEqual(api.refresh_token, 'refresh_1')
+
+    def test_initialize_refreshes_expiring_token(self):
+        self.store.save('me@example.com', {
+            'access_token': 'token_0',
+            'refresh_token': 'refresh_0',
+            'expires_at': time.time() + 60
+        })
+        api = self.api().initialize()
+        self.assertEqual(self.owner_api.grants, ['refresh_token'])
+        self.assertEqual(api.access_token, 'token_1')
+        self.assertEqual(self.store.load('me@example.com')['access_token'],
+                         'token_1')
+
+    def test_concurrent_401_refreshes_once(self):
+        api = self.api().initialize()
+        # the server revokes the token
+        self.owner_api.grants.append('revoked')
+        statuses = []
+
+        def call():
+            statuses.append(api.get('/api/1/vehicles').status_code)
+
+        threads = [threading.Thread(target=call) for _ in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(
+            self.owner_api.grants, ['password', 'revoked', 'refresh_token'])
+        self.assertEqual(statuses, [200] * 10)
+
+
+class AsyncTeslaAPITokenTest(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.grants = []
+
+        async def token(request):
+            await asyncio.sleep(0.05)
+            self.grants.append((await request.post())['grant_type'])
+            return web.json_response({
+                'access_token': 'token_%s' % len(self.grants),
+                'refresh_token': 'refresh',
+                'expires_in': 3888000
+            })
+
+        async def vehicles(request):
+            expected = 'Bearer token_%s' % len(self.grants)
+            if request.headers['Authorization'] != expected:
+                raise web.HTTPUnauthorized()
+            return web.json_response({'response': [], 'count': 0})
+
+        app = web.Application()
+        app.router.add_post('/oauth/token', token)
+        app.router.add_get('/api/1/vehicles', vehicles)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.api = AsyncTeslaAPI(
+            email='me@example.com',
+            password='xxxxxxx',
+            client_id='xxxxxxxx',
+            client_secret='xxxxxxxx'
+        )
+        self.api.prefix_url = str(self.server.make_url('')).rstrip('/')
+
+    async def asyncTearDown(self):
+        await self.api.close()
+        await self.server.close()
+
+    async def test_concurrent_401_refreshes_once(self):
+        await self.api.initialize()
+        self.grants.append('revoked')
+        results = await asyncio.gather(
+            *[self.api.get_vehicles() for _ in range(10)])
+        self.assertEqual(results, [[]] * 10)
+        self.assertEqual(
+            self.grants, ['password', 'revoked', 'refresh_token'])
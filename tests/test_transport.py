@@ -0,0 +1,103 @@
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from requests import Timeout
+from requests.exceptions import RetryError
+from requests.packages.urllib3.util.retry import Retry
+
+from yauta.tesla import TeslaAPI
+from yauta.testing import FakeOwnerAPI
+from yauta.transport import DeadlineTimeout, Transport
+
+
+def account(i):
+    return {
+        'email': 'owner%s@example.com' % i,
+        'password': 'xxxxxxxx',
+        'client_id': 'xxxxxxxx',
+        'client_secret': 'xxxxxxxx'
+    }
+
+
+class TransportTest(TestCase):
+    def setUp(self):
+        self.server = FakeOwnerAPI(fleet_size=2, latency=0.02).start()
+        self.transport = Transport(pool_size=4, block=True)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.stop()
+
+    def api(self, i):
+        api = TeslaAPI(transport=self.transport, **account(i))
+        api.prefix_url = self.server.url
+        return api.initialize()
+
+    def test_sessions_share_connections(self):
+        apis = [self.api(i) for i in range(20)]
+        self.assertEqual(self.server.tokens, 20)
+        # every account is authenticated with its own token
+        self.assertEqual(
+            len(set(a.headers['Authorization'] for a in apis)), 20)
+        self.assertTrue(all(
+            a.get_adapter(self.server.url) is self.transport.adapter
+            for a in apis))
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(
+                lambda a: len(a.get_vehicles()), apis * 3))
+        self.assertEqual(results, [2] * 60)
+        # sockets follow the pool size, not the number of accounts
+        self.assertLessEqual(self.server.connections, 4)
+
+    def test_closing_a_session_keeps_the_pool(self):
+        first, second = self.api(1), self.api(2)
+        first.close()
+        self.assertEqual(len(second.get_vehicles()), 2)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_socket_options_and_timeout(self):
+        self.assertIn(
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+            self.transport.socket_options)
+        self.transport.close()
+        self.transport = Transport(timeout=(1, 0.1), max_retries=0)
+        api = self.api(1)
+        self.server.latency = 0.5
+        with self.assertRaises(Timeout):
+            api.get_vehicles()
+        # a timeout given with the call wins over the default
+        self.assertEqual(
+            api.get('/api/1/vehicles', timeout=2).status_code, 200)
+
+    def test_retries_bounded_by_deadline(self):
+        api = self.api(1)
+        self.server.errors = {503: 1.0}
+        start = time.monotonic()
+        with self.assertRaises(RetryError):
+            api.get('/api/1/vehicles', timeout=DeadlineTimeout(1))
+        # the second retry would have backed off past the deadline
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(self.server.requests['vehicles'], 2)
+        self.assertIsNone(self.transport.adapter.max_retries.deadline)
+
+        # a Retry of the caller's own is not retried with a deadline
+        self.transport.close()
+        self.transport = Transport(max_retries=Retry(
+            total=2, status_forcelist=[503], raise_on_status=False))
+        api = self.api(2)
+        resp = api.get('/api/1/vehicles', timeout=DeadlineTimeout(1))
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(self.server.requests['vehicles'], 3)
+
+    def test_own_transport_closed_with_session(self):
+        api = TeslaAPI(**account(1))
+        api.prefix_url = self.server.url
+        api.initialize()
+        api.get_vehicles()
+        pools = api.transport.adapter.poolmanager.pools
+        self.assertEqual(len(pools), 1)
+        api.close()
+        self.assertEqual(len(pools), 0)
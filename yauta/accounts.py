@@ -0,0 +1,335 @@
+import itertools
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+import zlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import wait
+
+from yauta.exceptions import TeslaException
+from yauta.fleet import FleetResult, TeslaFleet
+from yauta.singleflight import SingleFlight
+from yauta.tesla import TeslaAPI
+from yauta.tokens import SqliteTokenStore
+from yauta.transport import Transport
+
+# keys of an account dict passed on to TeslaAPI
+API_KEYS = ('client_id', 'client_secret', 'email', 'password')
+
+AccountResult = namedtuple(
+    'AccountResult', ['account', 'result', 'error', 'elapsed'])
+AccountResult.__doc__ = """
+Outcome of running a task against a single account
+
+account: key of the account, see account_key
+result: return value of the task, None if it raised
+error: the exception raised by the task, None if it succeeded
+elapsed: (float) seconds the task took in its worker
+"""
+
+
+class WorkerCrashedException(TeslaException):
+    """
+    The worker process running a task died more often than allowed
+    """
+
+
+def account_key(account: dict) -> str:
+    """
+    Accounts are identified by their `key`, or their email when they do
+    not have one
+    """
+    return account.get('key') or account['email']
+
+
+def shard(key: str, shards: int) -> int:
+    """
+    Stable shard for an account, the same across runs and processes so
+    an account keeps going to the same worker
+    """
+    return zlib.crc32(key.encode('utf-8')) % shards
+
+
+def make_api(account: dict, token_store=None, transport=None) -> TeslaAPI:
+    """
+    Default api_factory, build and initialize a TeslaAPI from an account
+    dict of client_id, client_secret, email, password and optionally
+    access_token
+    """
+    api = TeslaAPI(
+        token_store=token_store,
+        transport=transport,
+        **{k: account.get(k) for k in API_KEYS}
+    )
+    return api.initialize(access_token=account.get('access_token'))
+
+
+def vehicle_data(api, fields=None) -> dict:
+    """
+    Task polling vehicle_data for every vehicle on an account
+
+    returns
+    dict of vehicle id to FleetResult, with the vehicle id in place of
+    the vehicle
+    """
+    results = TeslaFleet(api).poll(fields=fields)
+    return {
+        vid: FleetResult(vid, r.result, _portable(r.error), r.elapsed)
+        for vid, r in results.items()
+    }
+
+
+def _portable(error):
+    """
+    Exceptions go back to the parent pickled, replace those that can't be
+    """
+    if error is None:
+        return None
+    try:
+        pickle.dumps(error)
+    except Exception:
+        return TeslaException('%s: %s' % (type(error).__name__, error))
+    return error
+
+
+def _worker(conn, accounts, threads, api_factory, token_db):
+    """
+    Worker process main loop, runs tasks for its shard of accounts and
+    sends a result back per account as soon as it is done
+    """
+    token_store = SqliteTokenStore(token_db) if token_db else None
+    # one pool for all the accounts of the worker, sized for its threads
+    transport = Transport(pool_size=threads)
+    apis = {}
+    # accounts are initialized concurrently, a thread only waits for the
+    # account it needs
+    api_flight = SingleFlight()
+    send_lock = threading.Lock()
+
+    def make_api_for(key):
+        api = apis.get(key)
+        if api is None:
+            api = apis[key] = api_factory(
+                accounts[key], token_store, transport)
+        return api
+
+    def api_for(key):
+        api = apis.get(key)
+        if api is None:
+            api = api_flight.do(key, make_api_for, key)
+        return api
+
+    def run(job, key, fn, args):
+        start = time.monotonic()
+        try:
+            result, error = fn(api_for(key), *args), None
+        except Exception as e:
+            result, error = None, _portable(e)
+        message = (job, key, result, error, time.monotonic() - start)
+        with send_lock:
+            conn.send(message)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+            if message is None:
+                break
+            job, keys, fn, args = message
+            for key in keys:
+                pool.submit(run, job, key, fn, args)
+
+
+class _Worker(object):
+
+    def __init__(self, index, accounts):
+        self.index = index
+        self.accounts = accounts
+        self.process = None
+        self.conn = None
+
+
+class AccountPool(object):
+    """
+    Run tasks across many accounts, sharded over worker processes
+
+        with AccountPool(accounts, processes=8) as pool:
+            for r in pool.imap(vehicle_data):
+                print(r.account, r.error or len(r.result))
+
+    Each account is assigned to one worker process by a stable hash of
+    its key, and each worker keeps a TeslaAPI per account for its whole
+    life so tokens stay warm between tasks. Within a worker accounts are
+    served by `threads` threads, and share one Transport of `threads`
+    connections, so the sockets a worker keeps open follow its threads
+    rather than its accounts. Results are pickled back to the parent
+    over one pipe per worker as each account finishes.
+
+    A task is a picklable callable taking a TeslaAPI plus any extra
+    arguments, such as vehicle_data. Give `token_db` (a sqlite path
+    shared by the workers) to persist tokens, so restarted workers and
+    later pools skip the password grant.
+
+    A worker that dies is restarted with the same shard, and the accounts
+    it had not finished are sent to it again, up to `max_restarts` times
+    per task after which they fail with WorkerCrashedException.
+
+    input
+    accounts: list of account dicts, see make_api and account_key
+    processes: number of workers, defaults to the number of cpus
+    api_factory: picklable callable taking an account dict, a token
+    store (or None) and a Transport, and returning an initialized
+    TeslaAPI
+    """
+
+    def __init__(self, accounts, processes=None, threads=8,
+                 api_factory=make_api, token_db=None, max_restarts=3,
+                 context=None):
+        self.processes = processes or os.cpu_count() or 1
+        self.threads = threads
+        self.api_factory = api_factory
+        self.token_db = token_db
+        self.max_restarts = max_restarts
+        self._context = context or multiprocessing.get_context()
+        self._jobs = itertools.count()
+        self._lock = threading.Lock()
+
+        shards = [{} for _ in range(self.processes)]
+        for account in accounts:
+            key = account_key(account)
+            shards[shard(key, self.processes)][key] = account
+        self._workers = [
+            _Worker(i, s) for i, s in enumerate(shards) if s
+        ]
+        self.restarts = 0
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        for worker in self._workers:
+            if worker.process is None:
+                self._spawn(worker)
+        return self
+
+    def _spawn(self, worker):
+        parent, child = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker,
+            args=(child, worker.accounts, self.threads, self.api_factory,
+                  self.token_db),
+            daemon=True)
+        process.start()
+        child.close()
+        worker.process = process
+        worker.conn = parent
+
+    def _restart(self, worker):
+        worker.conn.close()
+        worker.process.join()
+        self.restarts += 1
+        self._spawn(worker)
+
+    def close(self):
+        for worker in self._workers:
+            if worker.process is None:
+                continue
+            try:
+                worker.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            worker.process.join(5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join()
+            worker.conn.close()
+            worker.process = None
+
+    def imap(self, fn, *args):
+        """
+        Run `fn(api, *args)` for every account
+
+        Only one task runs at a time, other callers wait for it to finish.
+
+        returns
+        iterator of AccountResult in the order accounts finish
+        """
+        with self._lock:
+            self.start()
+            job = next(self._jobs)
+            pending = {}
+            for worker in self._workers:
+                keys = list(worker.accounts)
+                worker.conn.send((job, keys, fn, args))
+                pending[worker] = set(keys)
+            restarts = dict.fromkeys(pending, 0)
+
+            while any(pending.values()):
+                waiting = [w for w, keys in pending.items() if keys]
+                ready = wait(
+                    [w.conn for w in waiting] +
+                    [w.process.sentinel for w in waiting])
+                for worker in waiting:
+                    died = worker.process.sentinel in ready
+                    if died or worker.conn in ready:
+                        for result in self._receive(worker, job, pending):
+                            yield result
+                    if died and pending[worker]:
+                        for result in self._recover(
+                                worker, job, fn, args, pending, restarts):
+                            yield result
+
+    def _receive(self, worker, job, pending):
+        while True:
+            try:
+                if not worker.conn.poll():
+                    return
+                message = worker.conn.recv()
+            except (EOFError, OSError):
+                return
+            job_id, key, result, error, elapsed = message
+            if job_id != job:
+                # left over from a task whose iterator was abandoned
+                continue
+            pending[worker].discard(key)
+            yield AccountResult(key, result, error, elapsed)
+
+    def _recover(self, worker, job, fn, args, pending, restarts):
+        self._restart(worker)
+        restarts[worker] += 1
+        keys = pending[worker]
+        if restarts[worker] > self.max_restarts:
+            for key in sorted(keys):
+                yield AccountResult(key, None, WorkerCrashedException(
+                    'Worker for account %s crashed %s times'
+                    % (key, restarts[worker])), 0.0)
+            keys.clear()
+            return
+        worker.conn.send((job, list(keys), fn, args))
+
+    def map(self, fn, *args) -> dict:
+        """
+        Run `fn(api, *args)` for every account
+
+        returns
+        dict of account key to AccountResult
+        """
+        return {r.account: r for r in self.imap(fn, *args)}
+
+    def poll(self, fields=None) -> dict:
+        """
+        Poll vehicle_data for every vehicle on every account
+
+        returns
+        dict of account key to AccountResult, whose result is a dict of
+        vehicle id to FleetResult
+        """
+        return self.map(vehicle_data, fields)
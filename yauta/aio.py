@@ -0,0 +1,476 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlencode
+
+import aiohttp
+
+from yauta.exceptions import (
+    TeslaAuthException,
+    TeslaDeadlineException,
+    TeslaException,
+    TeslaWakeTimeoutException
+)
+from yauta.ratelimit import parse_retry_after, vehicle_id_from_url
+from yauta.singleflight import AsyncSingleFlight
+from yauta.tokens import (
+    OAUTH_URL,
+    REFRESH_MARGIN,
+    is_expiring,
+    password_grant,
+    refresh_grant,
+    token_from_response
+)
+from yauta.snapshot import VehicleSnapshot
+from yauta.tesla import TeslaAPI
+from yauta.transport import (
+    RETRY_TOTAL,
+    RETRY_BACKOFF_FACTOR,
+    RETRY_STATUS_FORCELIST
+)
+from yauta.vehicle import (
+    TeslaVehicle,
+    METHOD_GET,
+    METHOD_POST,
+    STATE_ONLINE,
+    WAKE_TIMEOUT,
+    WAKE_POLL_INITIAL,
+    WAKE_POLL_BACKOFF,
+    WAKE_POLL_MAX
+)
+
+
+class AsyncTeslaAPI(object):
+    """
+    asyncio flavour of TeslaAPI
+
+    All requests made through a single AsyncTeslaAPI share one pooled
+    aiohttp connector, and the number of requests in flight at any time
+    is bounded by `concurrency`, so it is safe to fan out over thousands
+    of vehicles from a single event loop:
+
+        async with AsyncTeslaAPI(...) as api:
+            await api.initialize()
+            vehicles = await api.get_vehicles()
+            results = await api.gather(
+                v.get_vehicle_data() for v in vehicles)
+
+    Pass an aiohttp `session` to share its connector between several
+    accounts; it is left open when the api is closed.
+    """
+
+    BASE_URL = TeslaAPI.BASE_URL
+
+    def __init__(self, client_id, client_secret, email, password,
+                 concurrency=100, pool_size=100, session=None,
+                 token_store=None, refresh_margin=REFRESH_MARGIN,
+                 rate_limiter=None, auto_wake=False, circuit_breaker=None,
+                 metrics=None, coalesce_reads=True):
+        self.prefix_url = AsyncTeslaAPI.BASE_URL
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.email = email
+        self.password = password
+        self.headers = {}
+        self.access_token = None
+        self.refresh_token = None
+        self.expires_at = None
+        self.token_store = token_store
+        self.refresh_margin = refresh_margin
+        self._auth_lock = asyncio.Lock()
+        # VehicleDataCache is not supported on the asyncio client
+        self.cache = None
+        self.rate_limiter = rate_limiter
+        self.auto_wake = auto_wake
+        self.circuit_breaker = circuit_breaker
+        self.metrics = metrics
+        self.vehicle_states = {}
+        self.concurrency = concurrency
+        self.pool_size = pool_size
+        self._session = session
+        self._own_session = session is None
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.wake_flight = AsyncSingleFlight()
+        self.read_flight = AsyncSingleFlight() if coalesce_reads else None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and self._own_session:
+            await self._session.close()
+            self._session = None
+
+    async def initialize(self, access_token=None):
+        """
+        See TeslaAPI.initialize
+        """
+        try:
+            if access_token:
+                self._set_token({'access_token': access_token}, save=False)
+                return self
+
+            token = None
+            if self.token_store is not None:
+                token = self.token_store.load(self.email)
+            if token is None:
+                token = await self._fetch_token(None)
+            elif is_expiring(token.get('expires_at'), self.refresh_margin):
+                token = await self._fetch_token(token.get('refresh_token'))
+            else:
+                self._set_token(token, save=False)
+                return self
+            self._set_token(token)
+        except aiohttp.ClientResponseError as e:
+            raise TeslaAuthException(
+                'Unable to initialize, token fetch failed: %s' % e
+            )
+        return self
+
+    async def _fetch_token(self, refresh_token):
+        start = time.monotonic()
+        try:
+            return await self._grant_token(refresh_token)
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe_auth(time.monotonic() - start)
+
+    async def _grant_token(self, refresh_token):
+        url = OAUTH_URL + '?grant_type=password'
+        if refresh_token:
+            payload = refresh_grant(
+                self.client_id, self.client_secret, refresh_token)
+            try:
+                return token_from_response(
+                    await self.post(OAUTH_URL, data=payload))
+            except aiohttp.ClientResponseError:
+                if not self.password:
+                    raise
+        payload = password_grant(
+            self.client_id, self.client_secret, self.email, self.password)
+        return token_from_response(await self.post(url, data=payload))
+
+    def _set_token(self, token, save=True):
+        self.access_token = token['access_token']
+        self.refresh_token = token.get('refresh_token')
+        self.expires_at = token.get('expires_at')
+        self.headers['Authorization'] = 'Bearer %s' % self.access_token
+        if save and self.token_store is not None:
+            self.token_store.save(self.email, token)
+
+    async def reauthenticate(self, stale_token=None):
+        """
+        See TeslaAPI.reauthenticate, only one coroutine re-authenticates
+        at a time
+        """
+        async with self._auth_lock:
+            if stale_token is not None and self.access_token != stale_token:
+                return self.access_token
+            try:
+                self._set_token(await self._fetch_token(self.refresh_token))
+            except aiohttp.ClientResponseError as e:
+                raise TeslaAuthException(
+                    'Unable to re-authenticate, token fetch failed: %s' % e
+                )
+            return self.access_token
+
+    def _can_reauthenticate(self):
+        return bool(self.refresh_token or self.password)
+
+    async def request(self, method, url, **kwargs):
+        """
+        Make a request against the api and return the decoded json body
+
+        Mirrors the urllib3 Retry mounted on TeslaAPI: retryable status
+        codes are retried with exponential backoff, and the concurrency
+        slot is released while backing off. Authentication and rate
+        limiting are handled as in TeslaAPI.request, and the request is
+        recorded once, with its final status, if there are metrics.
+
+        raises aiohttp.ClientResponseError on a non retryable failure
+        """
+        authenticated = self.access_token is not None and OAUTH_URL not in url
+        token = self.access_token
+        if authenticated and is_expiring(self.expires_at, self.refresh_margin):
+            token = await self.reauthenticate(token)
+
+        limiter = self.rate_limiter
+        vehicle_id = vehicle_id_from_url(url)
+        url = self.prefix_url + url
+        attempt = 0
+        throttles = 0
+        reauthenticated = False
+        start = time.monotonic()
+        while True:
+            if limiter is not None:
+                await limiter.acquire_async(vehicle_id)
+            retries = attempt + throttles + int(reauthenticated)
+            async with self._semaphore:
+                try:
+                    async with self.session.request(
+                            method, url, headers=self.headers,
+                            **kwargs) as resp:
+                        unauthorized = (
+                            resp.status == 401 and authenticated and
+                            not reauthenticated and
+                            self._can_reauthenticate())
+                        throttled = (
+                            resp.status == 429 and limiter is not None and
+                            throttles < limiter.max_retries)
+                        retry = (
+                            resp.status in RETRY_STATUS_FORCELIST and
+                            attempt < RETRY_TOTAL)
+                        if not (unauthorized or throttled or retry):
+                            body = await resp.read()
+                            self._observe(
+                                method, url, resp.status, start, retries,
+                                kwargs, len(body))
+                            resp.raise_for_status()
+                            return await resp.json(content_type=None)
+                        retry_after = resp.headers.get('Retry-After')
+                except aiohttp.ClientConnectionError:
+                    self._observe(method, url, None, start, retries, kwargs)
+                    raise
+            if unauthorized:
+                try:
+                    await self.reauthenticate(token)
+                except Exception:
+                    self._observe(method, url, None, start, retries, kwargs)
+                    raise
+                reauthenticated = True
+            elif throttled:
+                limiter.throttled(parse_retry_after(retry_after), throttles)
+                throttles += 1
+            else:
+                await asyncio.sleep(RETRY_BACKOFF_FACTOR * (2 ** attempt))
+                attempt += 1
+
+    def _observe(self, method, url, status, start, retries, kwargs,
+                 received=0):
+        metrics = self.metrics
+        if metrics is None:
+            return
+        if kwargs.get('data') is not None:
+            data = kwargs['data']
+            sent = len(urlencode(data) if isinstance(data, dict) else data)
+        elif kwargs.get('json') is not None:
+            sent = len(json.dumps(kwargs['json']))
+        else:
+            sent = 0
+        metrics.observe_request(
+            method, url, status, time.monotonic() - start, retries,
+            sent, received)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def patch(self, url, **kwargs):
+        return await self.request('PATCH', url, **kwargs)
+
+    async def get_vehicles(self):
+        """
+        Returns list of all vehicles
+
+        input:
+        None
+
+        returns:
+        list of AsyncTeslaVehicle objects
+        """
+        vehicles_url = '/api/1/vehicles'
+        vehicles = (await self.get(vehicles_url))['response']
+        for v in vehicles:
+            self.vehicle_states[v['id']] = v.get('state')
+        return [
+            AsyncTeslaVehicle(v['id'], self, v.get('vehicle_id'))
+            for v in vehicles
+        ]
+
+    async def gather(self, aws, return_exceptions=True):
+        """
+        Run awaitables concurrently, bounded by the api concurrency limit
+
+        input:
+        aws: iterable of awaitables, e.g. vehicle commands
+        return_exceptions: (bool) return exceptions in place of results
+        instead of raising the first one
+
+        returns:
+        list of results in the same order as `aws`
+        """
+        return await asyncio.gather(*aws, return_exceptions=return_exceptions)
+
+
+class AsyncTeslaVehicle(TeslaVehicle):
+    """
+    asyncio flavour of TeslaVehicle
+
+    Every command defined on TeslaVehicle is available here and returns
+    an awaitable, since they all funnel through `_call`. Argument
+    validation still happens eagerly when the command is called. Reads
+    are coroutines of their own, they do not go through the api cache.
+    """
+
+    async def _call(self, method: str, url: str, data: dict,
+                    timeout: float = None) -> dict:
+        flight = self.api.read_flight
+        if method == METHOD_GET and flight is not None:
+            call = flight.do((self.id, url), self._request, method, url, data)
+        else:
+            call = self._request(method, url, data)
+        if timeout is None:
+            return await call
+        try:
+            return await asyncio.wait_for(call, timeout)
+        except asyncio.TimeoutError:
+            raise TeslaDeadlineException(
+                'No response from %s%s within %ss'
+                % (self.prefix_url, url, timeout))
+
+    async def _request(self, method: str, url: str, data: dict) -> dict:
+        if self._needs_wake(url):
+            await self.wake_up(wait=True)
+        breaker = self.api.circuit_breaker
+        trial = breaker is not None and breaker.check(self.id)
+        try:
+            return await self._send(method, url, data)
+        finally:
+            if trial:
+                breaker.release(self.id)
+
+    async def _send(self, method: str, url: str, data: dict) -> dict:
+        breaker = self.api.circuit_breaker
+        kwargs = {}
+        if data:
+            kwargs['data'] = data
+        try:
+            resp = await self.api.request(
+                method, self.prefix_url + url, **kwargs)
+        except aiohttp.ClientResponseError as e:
+            self._after_call(url, e.status)
+            raise TeslaException(
+                'Unable to complete request to: %s - %s' % (url, e))
+        except aiohttp.ClientError:
+            if breaker is not None:
+                breaker.failure(self.id)
+            raise
+
+        self._after_call(url, 200)
+        response = resp['response']
+        self._record_state(url, response)
+        return response
+
+    async def get_vehicle_data(self, fields: list = None,
+                               timeout: float = None) -> dict:
+        """
+        Get detailed vehicle data, see TeslaVehicle.get_vehicle_data
+        """
+
+        url = self._vehicle_data_url(fields)
+        return await self._call(METHOD_GET, url, None, timeout)
+
+    async def _get_group(self, group):
+        return (await self.get_vehicle_data([group]))[group]
+
+    async def get_charge_state(self) -> dict:
+        """
+        Get charge_state only
+        """
+
+        return await self._get_group('charge_state')
+
+    async def get_climate_state(self) -> dict:
+        """
+        Get climate_state only
+        """
+
+        return await self._get_group('climate_state')
+
+    async def get_drive_state(self) -> dict:
+        """
+        Get drive_state only
+        """
+
+        return await self._get_group('drive_state')
+
+    async def get_vehicle_state(self) -> dict:
+        """
+        Get vehicle_state only
+        """
+
+        return await self._get_group('vehicle_state')
+
+    async def get_gui_settings(self) -> dict:
+        """
+        Get gui_settings only
+        """
+
+        return await self._get_group('gui_settings')
+
+    async def get_vehicle_snapshot(self, fields: list = None):
+        """
+        Get detailed vehicle data as a compact VehicleSnapshot
+        """
+
+        return VehicleSnapshot.from_dict(await self.get_vehicle_data(fields))
+
+    async def stream(self, columns: list = None, **kwargs):
+        """
+        Stream telemetry from the vehicle
+
+        Async generator version of TeslaVehicle.stream
+        """
+
+        if self.vehicle_id is None:
+            self.vehicle_id = (await self.get_state())['vehicle_id']
+        client = self._streaming_client(columns, **kwargs)
+        async for record in client.stream():
+            yield record
+
+    async def wake_up(self, wait: bool = False,
+                      timeout: float = WAKE_TIMEOUT) -> dict:
+        """
+        Wake up vehicle
+
+        See TeslaVehicle.wake_up, waiting is done without blocking the
+        event loop.
+        """
+
+        url = '/wake_up'
+        data = None
+        method = METHOD_POST
+        flight = self.api.wake_flight
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        resp = await flight.do(self.id, self._call, method, url, data)
+        if not wait:
+            return resp
+
+        deadline = start + timeout
+        delay = WAKE_POLL_INITIAL
+        while resp['state'] != STATE_ONLINE:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                self._observe_wake(loop.time() - start, False)
+                raise TeslaWakeTimeoutException(
+                    'Vehicle %s did not wake up within %ss, state: %s'
+                    % (self.id, timeout, resp['state']))
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * WAKE_POLL_BACKOFF, WAKE_POLL_MAX)
+            resp = await flight.do((self.id, 'state'), self.get_state)
+        self._observe_wake(loop.time() - start, True)
+        return resp
@@ -0,0 +1,223 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+CHARGE_STATE = 'charge_state'
+CLIMATE_STATE = 'climate_state'
+DRIVE_STATE = 'drive_state'
+VEHICLE_STATE = 'vehicle_state'
+
+DEFAULT_TTL = {
+    CHARGE_STATE: 60,
+    CLIMATE_STATE: 60,
+    DRIVE_STATE: 10,
+    VEHICLE_STATE: 60
+}
+
+# field groups whose cached values are made stale by a command, commands
+# that are not listed here invalidate every group
+COMMAND_INVALIDATES = {
+    'honk_horn': (),
+    'flash_lights': (),
+    'remote_start_drive': (VEHICLE_STATE, DRIVE_STATE),
+    'speed_limit_set_limit': (VEHICLE_STATE,),
+    'speed_limit_activate': (VEHICLE_STATE,),
+    'speed_limit_deactivate': (VEHICLE_STATE,),
+    'speed_limit_clear_pin': (VEHICLE_STATE,),
+    'set_valet_mode': (VEHICLE_STATE,),
+    'reset_valet_pin': (VEHICLE_STATE,),
+    'door_unlock': (VEHICLE_STATE,),
+    'door_lock': (VEHICLE_STATE,),
+    'actuate_trunk': (VEHICLE_STATE,),
+    'sun_roof_control': (VEHICLE_STATE,),
+    'charge_port_door_open': (CHARGE_STATE,),
+    'charge_port_door_close': (CHARGE_STATE,),
+    'charge_start': (CHARGE_STATE,),
+    'charge_stop': (CHARGE_STATE,),
+    'charge_standard': (CHARGE_STATE,),
+    'charge_max_range': (CHARGE_STATE,),
+    'set_charge_limit': (CHARGE_STATE,),
+    'auto_conditioning_start': (CLIMATE_STATE,),
+    'auto_conditioning_stop': (CLIMATE_STATE,),
+    'set_temps': (CLIMATE_STATE,),
+    'remote_seat_heater_request': (CLIMATE_STATE,),
+    'media_toggle_playback': (VEHICLE_STATE,),
+    'media_next_track': (VEHICLE_STATE,),
+    'media_prev_track': (VEHICLE_STATE,),
+    'media_next_fav': (VEHICLE_STATE,),
+    'media_prev_fav': (VEHICLE_STATE,),
+    'media_volume_up': (VEHICLE_STATE,),
+    'media_volume_down': (VEHICLE_STATE,),
+    'navigation_request': (DRIVE_STATE,),
+    'schedule_software_update': (VEHICLE_STATE,),
+    'cancel_software_update': (VEHICLE_STATE,)
+}
+
+
+class _Entry(object):
+
+    __slots__ = ('data', 'fetched', 'complete')
+
+    def __init__(self):
+        self.data = {}
+        self.fetched = {}
+        # field groups of the last full response, None until one is put
+        self.complete = None
+
+
+class VehicleDataCache(object):
+    """
+    Size bounded LRU cache of vehicle_data responses, keyed by vehicle id
+
+    Each field group of the response (charge_state, climate_state, ...)
+    expires independently after its ttl, groups without a ttl of their
+    own use `default_ttl`. A cached response is fresh only while every
+    group being asked for is fresh. A full response can only be served
+    once one has been put, field groups cached one at a time never add up
+    to it.
+
+    With `stale_while_revalidate`, stale responses are still returned
+    immediately and refreshed on a background thread.
+
+    Responses are shared between callers and should not be mutated.
+
+    input
+    maxsize: (int) number of vehicles to keep
+    ttl: (dict) field group to seconds, merged over DEFAULT_TTL
+    default_ttl: (float) seconds for field groups missing from `ttl`
+    stale_while_revalidate: (bool) serve stale data while refreshing
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, default_ttl=60,
+                 stale_while_revalidate=False, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = dict(DEFAULT_TTL, **(ttl or {}))
+        self.default_ttl = default_ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _is_fresh(self, entry, groups, now):
+        if groups is None:
+            groups = entry.complete
+        for group in groups:
+            fetched = entry.fetched.get(group)
+            if fetched is None:
+                return False
+            if now - fetched > self.ttl.get(group, self.default_ttl):
+                return False
+        return True
+
+    def get(self, vehicle_id, groups=None):
+        """
+        Look up the cached response for a vehicle
+
+        input
+        vehicle_id: id of the vehicle
+        groups: optional list of field groups the caller needs, defaults
+        to the full response
+
+        returns
+        tuple of (data, fresh), data is None when nothing is cached, or
+        when the full response is asked for and none has been put
+        """
+        with self._lock:
+            entry = self._entries.get(vehicle_id)
+            if entry is None or not entry.data:
+                return None, False
+            if groups is None and entry.complete is None:
+                return None, False
+            self._entries.move_to_end(vehicle_id)
+            fresh = self._is_fresh(entry, groups, self.clock())
+            return dict(entry.data), fresh
+
+    def put(self, vehicle_id, data, groups=None):
+        """
+        Store a response, refreshing the field groups it contains
+
+        input
+        vehicle_id: id of the vehicle
+        data: the response
+        groups: the field groups that were asked for, None when `data` is
+        a full vehicle_data response
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(vehicle_id)
+            if entry is None:
+                entry = self._entries[vehicle_id] = _Entry()
+            self._entries.move_to_end(vehicle_id)
+            entry.data.update(data)
+            received = [k for k, v in data.items() if isinstance(v, dict)]
+            for key in received:
+                entry.fetched[key] = now
+            if groups is None:
+                entry.complete = received
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, vehicle_id, groups=None):
+        """
+        Mark field groups of a vehicle as stale
+
+        input
+        vehicle_id: id of the vehicle
+        groups: list of field groups, defaults to all of them
+        """
+        with self._lock:
+            entry = self._entries.get(vehicle_id)
+            if entry is None:
+                return
+            if groups is None:
+                entry.fetched.clear()
+            for group in groups or ():
+                entry.fetched.pop(group, None)
+
+    def invalidate_command(self, vehicle_id, command):
+        """
+        Invalidate the field groups affected by a vehicle command
+        """
+        groups = COMMAND_INVALIDATES.get(command)
+        if groups == ():
+            return
+        self.invalidate(vehicle_id, groups)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def revalidate(self, vehicle_id, fetch, groups=None):
+        """
+        Refresh a vehicle's entry on a background thread
+
+        Only one refresh runs per vehicle at a time, failures are logged
+        and leave the stale entry in place.
+
+        input
+        vehicle_id: id of the vehicle
+        fetch: callable returning the new response
+        groups: the field groups fetch asks for, see put
+        """
+        with self._lock:
+            if vehicle_id in self._refreshing:
+                return
+            self._refreshing.add(vehicle_id)
+
+        def refresh():
+            try:
+                self.put(vehicle_id, fetch(), groups)
+            except Exception:
+                log.exception('Unable to refresh vehicle %s', vehicle_id)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(vehicle_id)
+
+        threading.Thread(target=refresh, daemon=True).start()
@@ -0,0 +1,104 @@
+import threading
+import time
+
+from yauta.exceptions import CircuitOpenException
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half-open'
+
+
+class _Circuit(object):
+
+    __slots__ = ('failures', 'opened_at', 'trial_at')
+
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = None
+        # when the trial call in flight was let through
+        self.trial_at = None
+
+
+class CircuitBreaker(object):
+    """
+    Per vehicle circuit breaker
+
+    After `failure_threshold` consecutive failed calls to a vehicle its
+    circuit opens and calls fail immediately with CircuitOpenException.
+    Once `recovery_timeout` seconds have passed a single trial call is
+    let through: success closes the circuit, failure opens it again. A
+    trial that reports neither, say because it was interrupted, is given
+    up on after another `recovery_timeout` so the circuit can't stay
+    stuck; callers should release() it when they can.
+
+    input
+    failure_threshold: (int) consecutive failures that open the circuit
+    recovery_timeout: (float) seconds before a trial call is allowed
+    """
+
+    def __init__(self, failure_threshold=5, recovery_timeout=60,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.clock = clock
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def state(self, key) -> str:
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None or circuit.opened_at is None:
+                return STATE_CLOSED
+            if (circuit.trial_at is not None or
+                    self.clock() - circuit.opened_at >=
+                    self.recovery_timeout):
+                return STATE_HALF_OPEN
+            return STATE_OPEN
+
+    def check(self, key) -> bool:
+        """
+        Call before making a call to `key`
+
+        raises CircuitOpenException if the call should not be made
+        returns
+        True when the call is the half open trial, which should end in
+        success, failure or release
+        """
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None or circuit.opened_at is None:
+                return False
+            now = self.clock()
+            if now - circuit.opened_at >= self.recovery_timeout and (
+                    circuit.trial_at is None or
+                    now - circuit.trial_at >= self.recovery_timeout):
+                circuit.trial_at = now
+                return True
+        raise CircuitOpenException(
+            'Circuit for vehicle %s is open after %s failures'
+            % (key, circuit.failures))
+
+    def success(self, key):
+        with self._lock:
+            self._circuits.pop(key, None)
+
+    def failure(self, key):
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None:
+                circuit = self._circuits[key] = _Circuit()
+            circuit.failures += 1
+            if (circuit.trial_at is not None or
+                    circuit.failures >= self.failure_threshold):
+                circuit.opened_at = self.clock()
+                circuit.trial_at = None
+
+    def release(self, key):
+        """
+        Give up a trial call without an outcome, the next call becomes
+        the trial
+        """
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is not None:
+                circuit.trial_at = None
@@ -0,0 +1,237 @@
+"""
+yauta command line interface
+
+Requests are sent to a running `yauta daemon` when there is one, which
+keeps an authenticated session warm so each call is a single round trip
+to the api. Without a daemon, or when the daemon is for another account
+or url, they run in process, with tokens persisted between runs.
+
+Only the standard library is imported here, the http stack is loaded on
+demand by yauta.daemon.
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+
+DEFAULT_TOKEN_PATH = '~/.config/yauta/tokens.json'
+SOCKET_NAME = 'yauta.sock'
+
+VEHICLE_ACTIONS = (
+    'get-details', 'get-charge-state', 'get-climate-state',
+    'get-drive-state', 'get-vehicle-state', 'get-gui-settings', 'get-state',
+    'wake-up', 'honk-horn', 'flash-lights', 'door-lock', 'door-unlock',
+    'charge-start', 'charge-stop', 'set-charge-limit',
+    'auto-conditioning-start', 'auto-conditioning-stop', 'set-temps'
+)
+
+
+class DaemonUnavailable(Exception):
+    pass
+
+
+def default_socket_path():
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime:
+        return os.path.join(runtime, SOCKET_NAME)
+    return os.path.join(
+        os.path.expanduser(os.path.dirname(DEFAULT_TOKEN_PATH)), SOCKET_NAME)
+
+
+def parse_args_list(pairs):
+    """
+    Parse key=value arguments, values are json when they parse as json
+    and strings otherwise
+
+    returns
+    dict of argument name to value
+    """
+    args = {}
+    for pair in pairs or ():
+        key, sep, value = pair.partition('=')
+        if not sep:
+            raise ValueError('Expected key=value, got: %s' % pair)
+        try:
+            args[key.replace('-', '_')] = json.loads(value)
+        except ValueError:
+            args[key.replace('-', '_')] = value
+    return args
+
+
+def send(path, request, timeout=None):
+    """
+    Send a request to the daemon listening on `path`
+
+    raises DaemonUnavailable if no daemon is listening
+    returns
+    the decoded reply
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        try:
+            sock.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            raise DaemonUnavailable(str(e))
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        sock.close()
+    return json.loads(b''.join(chunks).decode('utf-8'))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='yauta', description='yet another unofficial tesla api')
+    parser.add_argument(
+        '--email', default=os.environ.get('TESLA_EMAIL'))
+    parser.add_argument(
+        '--password', default=os.environ.get('TESLA_PASSWORD'))
+    parser.add_argument(
+        '--client-id', default=os.environ.get('TESLA_CLIENT_ID'))
+    parser.add_argument(
+        '--client-secret', default=os.environ.get('TESLA_CLIENT_SECRET'))
+    parser.add_argument(
+        '--tokens', default=os.environ.get('YAUTA_TOKENS', DEFAULT_TOKEN_PATH),
+        help='file tokens are kept in between runs')
+    parser.add_argument(
+        '--url', default=os.environ.get('YAUTA_URL'),
+        help='base url of the api, for testing against a stand-in')
+    parser.add_argument(
+        '--socket', default=os.environ.get('YAUTA_SOCKET'),
+        help='unix socket of the daemon')
+    parser.add_argument(
+        '--no-daemon', action='store_true',
+        help='run in process even if a daemon is running')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    commands.add_parser('init', help='fetch a token with the password grant')
+    commands.add_parser('get-access-token', help='print the access token')
+    set_token = commands.add_parser(
+        'set-access-token', help='use an existing access token')
+    set_token.add_argument('token')
+    commands.add_parser('get-vehicles', help='list vehicles on the account')
+
+    vehicles = commands.add_parser(
+        'vehicles', help='run an action against a vehicle',
+        description='Any TeslaVehicle method can be given as the action, '
+                    'with dashes for underscores. Common actions: %s'
+                    % ', '.join(VEHICLE_ACTIONS))
+    vehicles.add_argument('action')
+    vehicles.add_argument('--vehicle', required=True, help='vehicle id')
+    vehicles.add_argument(
+        'args', nargs='*', metavar='key=value',
+        help='arguments to the action, e.g. percent=80 wait=true')
+
+    daemon = commands.add_parser(
+        'daemon', help='serve requests from a warm session')
+    daemon.add_argument(
+        '--stop', action='store_true', help='stop the running daemon')
+    daemon.add_argument(
+        '--no-cache', action='store_true',
+        help='always fetch vehicle data instead of caching it')
+    return parser
+
+
+def _request(args):
+    request = {
+        'command': args.command,
+        'account': {'email': args.email, 'url': args.url}
+    }
+    if args.command == 'set-access-token':
+        request['token'] = args.token
+    elif args.command == 'vehicles':
+        request['vehicle'] = args.vehicle
+        request['action'] = args.action
+        request['args'] = parse_args_list(args.args)
+    return request
+
+
+def _make_api(args, cache=False):
+    from yauta.daemon import make_api
+    return make_api(
+        args.email, args.password, args.client_id, args.client_secret,
+        args.tokens, cache=cache, url=args.url)
+
+
+def run_daemon(args, path):
+    try:
+        send(path, {'command': 'ping'}, timeout=1)
+    except DaemonUnavailable:
+        pass
+    else:
+        raise SystemExit('A daemon is already listening on %s' % path)
+
+    from yauta.daemon import Daemon
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    server = Daemon(_make_api(args, cache=not args.no_cache), path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    # argparse leaves key=value arguments given after --vehicle over
+    if extra and args.command == 'vehicles':
+        args.args += extra
+    elif extra:
+        parser.error('unrecognized arguments: %s' % ' '.join(extra))
+    path = args.socket or default_socket_path()
+
+    if args.command == 'daemon':
+        if args.stop:
+            try:
+                send(path, {'command': 'stop'})
+            except DaemonUnavailable:
+                raise SystemExit('No daemon is listening on %s' % path)
+            return 0
+        run_daemon(args, path)
+        return 0
+
+    try:
+        request = _request(args)
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+    reply = None
+    if not args.no_daemon:
+        try:
+            reply = send(path, request)
+        except DaemonUnavailable:
+            pass
+    if reply is not None and reply.get('account_mismatch'):
+        reply = None
+    if reply is None:
+        from yauta.daemon import Executor
+        try:
+            reply = {'result': Executor(_make_api(args)).execute(request)}
+        except Exception as e:
+            reply = {'error': '%s: %s' % (type(e).__name__, e)}
+
+    if 'error' in reply:
+        sys.stderr.write('%s\n' % reply['error'])
+        return 1
+    result = reply['result']
+    if isinstance(result, str):
+        sys.stdout.write('%s\n' % result)
+    else:
+        sys.stdout.write('%s\n' % json.dumps(result, indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from yauta.exceptions import TeslaException
+from yauta.vehicle import COMMANDS, WAKE_TIMEOUT, validate_command
+
+# commands that set the same piece of vehicle state, within a batch only
+# the last command of each group is sent
+SUPERSEDING_GROUPS = (
+    ('door_lock', 'door_unlock'),
+    ('charge_start', 'charge_stop'),
+    ('charge_port_door_open', 'charge_port_door_close'),
+    ('charge_standard', 'charge_max_range', 'set_charge_limit'),
+    ('auto_conditioning_start', 'auto_conditioning_stop'),
+    ('set_temps',),
+    ('speed_limit_set_limit',),
+    ('sun_roof_control',)
+)
+SUPERSEDES = {
+    command: group for group in SUPERSEDING_GROUPS for command in group
+}
+
+# relative commands that are merged into their net number of steps
+VOLUME_STEPS = {'media_volume_up': 1, 'media_volume_down': -1}
+
+# how long a vehicle is assumed to stay awake after a successful call
+AWAKE_INTERVAL = 60
+
+
+class _Command(object):
+
+    __slots__ = ('name', 'args', 'kwargs', 'futures')
+
+    def __init__(self, name, args, kwargs, future):
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+        self.futures = [future] if future is not None else []
+
+
+def coalesce(commands: list) -> list:
+    """
+    Collapse a batch of queued commands into the calls that need making
+
+    Superseded commands are dropped in favour of the last command of
+    their group, and volume steps are merged into their net steps at the
+    position of the last one. The futures of dropped commands are
+    carried by the command that replaces them; if volume steps cancel
+    out, the merged command has no steps and is not sent.
+    """
+    last = {}
+    for i, command in enumerate(commands):
+        if command.name in SUPERSEDES:
+            last[SUPERSEDES[command.name]] = i
+        elif command.name in VOLUME_STEPS:
+            last['volume'] = i
+
+    calls = []
+    carried = {}
+    volume = 0
+    for i, command in enumerate(commands):
+        if command.name in SUPERSEDES:
+            key = SUPERSEDES[command.name]
+        elif command.name in VOLUME_STEPS:
+            key = 'volume'
+            volume += VOLUME_STEPS[command.name]
+        else:
+            calls.append(command)
+            continue
+
+        if last[key] != i:
+            carried.setdefault(key, []).extend(command.futures)
+            continue
+        command.futures = carried.pop(key, []) + command.futures
+        if key == 'volume':
+            name = 'media_volume_up' if volume > 0 else 'media_volume_down'
+            for _ in range(abs(volume) - 1):
+                calls.append(_Command(name, (), {}, None))
+            command.name = name if volume else None
+        calls.append(command)
+    return calls
+
+
+class CommandQueue(object):
+    """
+    Queue of commands for a single vehicle, sent in order by one thread
+
+    The vehicle is woken once before a batch of commands is sent, and
+    the batch is coalesced first (see coalesce), so a burst of commands
+    costs as few calls as possible. Every submitted command gets a
+    concurrent.futures.Future for its result; commands that were merged
+    into another resolve with that command's result.
+
+        queue = CommandQueue(vehicle)
+        queue.set_temps(20, 20)
+        queue.set_temps(21, 21)
+        queue.media_volume_up().result()
+
+    input
+    vehicle: the TeslaVehicle to send commands to
+    wake: (bool) wake the vehicle before sending commands
+    wake_timeout: (float) seconds to wait for the vehicle to wake
+    batch_delay: (float) seconds to wait for more commands before
+    sending a batch
+    """
+
+    def __init__(self, vehicle, wake=True, wake_timeout=WAKE_TIMEOUT,
+                 batch_delay=0.05):
+        self.vehicle = vehicle
+        self.wake = wake
+        self.wake_timeout = wake_timeout
+        self.batch_delay = batch_delay
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._awake_at = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getattr__(self, name):
+        if name not in COMMANDS:
+            raise AttributeError(
+                'CommandQueue has no attribute %s' % name)
+        return lambda *args, **kwargs: self.submit(name, *args, **kwargs)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, command: str, *args, **kwargs) -> Future:
+        """
+        Queue a TeslaVehicle command
+
+        The command and its arguments are checked straight away, see
+        yauta.vehicle.validate_command. A future cancelled before its
+        batch is sent cancels the command.
+
+        input
+        command: (str) name of the TeslaVehicle method, e.g. 'set_temps'
+        args, kwargs: arguments for the command
+
+        returns
+        Future resolving to the command response
+        """
+        validate_command(command, kwargs, args)
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise TeslaException('CommandQueue is closed')
+            self._pending.append(_Command(command, args, kwargs, future))
+            self._condition.notify()
+        return future
+
+    def close(self, wait=True):
+        """
+        Stop accepting commands, pending commands are still sent
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if wait:
+            self._thread.join()
+
+    def _take(self):
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+            if not self._pending:
+                return None
+        if self.batch_delay:
+            time.sleep(self.batch_delay)
+        with self._condition:
+            batch = list(self._pending)
+            self._pending.clear()
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+            batch = self._start(batch)
+            if not batch:
+                continue
+            try:
+                self._wake()
+            except Exception as e:
+                for command in batch:
+                    for future in command.futures:
+                        future.set_exception(e)
+                continue
+            self._send(coalesce(batch))
+
+    def _start(self, batch):
+        """
+        Mark the futures of a batch as running, so they can no longer be
+        cancelled, dropping the commands whose futures already were
+        """
+        started = []
+        for command in batch:
+            command.futures = [
+                future for future in command.futures
+                if future.set_running_or_notify_cancel()
+            ]
+            if command.futures:
+                started.append(command)
+        return started
+
+    def _wake(self):
+        if not self.wake:
+            return
+        if (self._awake_at is not None and
+                time.monotonic() - self._awake_at < AWAKE_INTERVAL):
+            return
+        self.vehicle.wake_up(wait=True, timeout=self.wake_timeout)
+        self._awake_at = time.monotonic()
+
+    def _send(self, calls):
+        for command in calls:
+            result, error = None, None
+            if command.name is not None:
+                try:
+                    result = getattr(self.vehicle, command.name)(
+                        *command.args, **command.kwargs)
+                    self._awake_at = time.monotonic()
+                except Exception as e:
+                    error = e
+                    self._awake_at = None
+            for future in command.futures:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
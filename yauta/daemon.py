@@ -0,0 +1,181 @@
+import json
+import os
+import socketserver
+import threading
+
+from yauta.cache import VehicleDataCache
+from yauta.tesla import TeslaAPI
+from yauta.tokens import FileTokenStore
+from yauta.vehicle import TeslaVehicle
+
+# vehicle methods the cli cannot call, their results are not json
+EXCLUDED_ACTIONS = ('stream', 'get_vehicle_snapshot')
+
+
+def make_api(email, password, client_id, client_secret, token_path,
+             cache=False, url=None, **kwargs):
+    """
+    Build a TeslaAPI for the cli, with tokens persisted to `token_path` so
+    that only the first run needs the password grant
+    """
+    api = TeslaAPI(
+        client_id=client_id,
+        client_secret=client_secret,
+        email=email,
+        password=password,
+        token_store=FileTokenStore(token_path),
+        cache=VehicleDataCache() if cache else None,
+        **kwargs
+    )
+    if url:
+        api.prefix_url = url
+    return api
+
+
+class Executor(object):
+    """
+    Runs cli requests against a TeslaAPI
+
+    A request is a dict with a `command`, one of init, get-access-token,
+    set-access-token, get-vehicles or vehicles, and for vehicles a
+    `vehicle` id, an `action` naming a TeslaVehicle method (dashes for
+    underscores, get-details being get_vehicle_data) and its `args`.
+    """
+
+    def __init__(self, api):
+        self.api = api
+        self._vehicles = {}
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    def _initialize(self):
+        with self._lock:
+            if not self._initialized:
+                self.api.initialize()
+                self._initialized = True
+
+    def vehicle(self, vehicle_id):
+        vehicle_id = int(vehicle_id)
+        vehicle = self._vehicles.get(vehicle_id)
+        if vehicle is None:
+            vehicle = self._vehicles[vehicle_id] = TeslaVehicle(
+                vehicle_id, self.api)
+        return vehicle
+
+    def execute(self, request):
+        """
+        returns
+        json serializable result of the request
+        """
+        command = request['command']
+        if command == 'set-access-token':
+            token = {'access_token': request['token']}
+            self.api._set_token(token)
+            self._initialized = True
+            return 'ok'
+        if command == 'init':
+            self.api._set_token(self.api._fetch_token(None))
+            self._initialized = True
+            return 'ok'
+
+        self._initialize()
+        if command == 'get-access-token':
+            return self.api.access_token
+        if command == 'get-vehicles':
+            vehicles = self.api.get_vehicles()
+            for v in vehicles:
+                self._vehicles[v.id] = v
+            return [{
+                'id': v.id,
+                'vehicle_id': v.vehicle_id,
+                'state': self.api.vehicle_states.get(v.id)
+            } for v in vehicles]
+        if command == 'vehicles':
+            return self._vehicle_action(
+                self.vehicle(request['vehicle']), request['action'],
+                request.get('args') or {})
+        raise ValueError('Unknown command: %s' % command)
+
+    def _vehicle_action(self, vehicle, action, args):
+        if action == 'get-details':
+            action = 'get-vehicle-data'
+        name = action.replace('-', '_')
+        method = getattr(vehicle, name, None)
+        if (name.startswith('_') or name in EXCLUDED_ACTIONS or
+                not callable(method)):
+            raise ValueError('Unknown vehicle action: %s' % action)
+        return method(**args)
+
+
+def _account(email, url):
+    return email, (url or TeslaAPI.BASE_URL).rstrip('/')
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line.decode('utf-8'))
+            command = request.get('command')
+            if command == 'ping':
+                reply = {'result': 'pong'}
+            elif command == 'stop':
+                threading.Thread(target=self.server.shutdown).start()
+                reply = {'result': 'stopping'}
+            elif not self.server.serves(request.get('account')):
+                reply = {
+                    'error': 'The daemon is running for another account',
+                    'account_mismatch': True
+                }
+            else:
+                reply = {'result': self.server.executor.execute(request)}
+        except Exception as e:
+            reply = {'error': '%s: %s' % (type(e).__name__, e)}
+        self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+
+
+class Daemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serves cli requests over a unix socket, keeping one authenticated
+    TeslaAPI with its connection pool, vehicle states and data cache warm
+    between cli invocations
+
+    Each connection carries one request and one reply, each a line of
+    json. The socket is only accessible to the user running the daemon.
+    Requests may name the `account` they are for, a dict of `email` and
+    `url`, those for any other account are refused with an
+    `account_mismatch` reply.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, api, path):
+        self.executor = Executor(api)
+        self.path = path
+        if os.path.exists(path):
+            # left behind by a daemon that did not shut down cleanly
+            os.unlink(path)
+        umask = os.umask(0o077)
+        try:
+            super(Daemon, self).__init__(path, _Handler)
+        finally:
+            os.umask(umask)
+
+    def serves(self, account) -> bool:
+        """
+        returns
+        whether the daemon's api is for `account`, True when not given
+        """
+        if account is None:
+            return True
+        api = self.executor.api
+        return _account(account.get('email'), account.get('url')) == (
+            _account(api.email, api.prefix_url))
+
+    def server_close(self):
+        super(Daemon, self).server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
@@ -0,0 +1,193 @@
+import numbers
+import threading
+from collections import namedtuple
+
+# changes smaller than these are sensor jitter and are not reported. Keys
+# are full paths or bare field names, which apply in every group and give
+# way to a full path
+DEFAULT_DEADBAND = {
+    'drive_state.latitude': 0.00001,
+    'drive_state.longitude': 0.00001,
+    'drive_state.heading': 2,
+    'charge_state.battery_range': 0.5,
+    'charge_state.est_battery_range': 0.5,
+    'charge_state.ideal_battery_range': 0.5,
+    'charge_state.charger_voltage': 2,
+    'climate_state.inside_temp': 0.5,
+    'climate_state.outside_temp': 0.5,
+    'vehicle_state.odometer': 0.1
+}
+
+# fields that change on every poll without saying anything about the
+# vehicle, matched by field name
+DEFAULT_IGNORE = ('timestamp', 'gps_as_of')
+
+SEPARATOR = '.'
+
+Change = namedtuple('Change', ['path', 'old', 'new'])
+Change.__doc__ = """
+A single field that changed between two polls of a vehicle
+
+path: dotted path of the field, e.g. 'charge_state.battery_level'
+old: last reported value, None if the field is new
+new: current value, None if the field is gone
+"""
+
+
+def flatten(data, prefix='') -> dict:
+    """
+    Flatten nested dicts into a dict of dotted path to value, anything
+    that is not a dict (including lists) is a leaf
+    """
+    flat = {}
+    for key, value in data.items():
+        path = prefix + key
+        if isinstance(value, dict) and value:
+            flat.update(flatten(value, path + SEPARATOR))
+        else:
+            flat[path] = value
+    return flat
+
+
+def as_patch(changes) -> dict:
+    """
+    Turn changes back into a nested dict of their new values
+    """
+    patch = {}
+    for change in changes:
+        keys = change.path.split(SEPARATOR)
+        node = patch
+        for key in keys[:-1]:
+            node = node.setdefault(key, {})
+        node[keys[-1]] = change.new
+    return patch
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+class StateDiffer(object):
+    """
+    Reduce successive vehicle_data responses to the fields that changed
+
+        differ = StateDiffer()
+        differ.subscribe(store, prefixes=['charge_state'])
+        for vehicle_id, r in fleet.poll().items():
+            if r.error is None:
+                differ.update(vehicle_id, r.result)
+
+    The first update for a vehicle reports every field. After that,
+    numeric fields only change once they have moved by at least their
+    dead-band from the last value reported, so slow drift is still
+    reported eventually. Groups missing from a response, as when polling
+    a subset of fields, are left as they were.
+
+    Subscribers are called with (vehicle_id, changes) from the thread
+    calling update, and only when they have changes to see.
+    """
+
+    def __init__(self, deadband=None, ignore=DEFAULT_IGNORE):
+        self.deadband = dict(DEFAULT_DEADBAND, **(deadband or {}))
+        self.ignore = frozenset(ignore or ())
+        self._state = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback, prefixes=None):
+        """
+        input:
+        callback: callable taking a vehicle id and a list of Change
+        prefixes: optional list of paths, e.g. ['charge_state',
+        'drive_state.speed'], only changes under them are passed on
+        """
+        prefixes = tuple(prefixes) if prefixes else None
+        self._subscribers.append((callback, prefixes))
+
+    def unsubscribe(self, callback):
+        self._subscribers = [
+            s for s in self._subscribers if s[0] is not callback
+        ]
+
+    def _threshold(self, path):
+        threshold = self.deadband.get(path)
+        if threshold is None:
+            threshold = self.deadband.get(path.rpartition(SEPARATOR)[2])
+        return threshold
+
+    def _changed(self, path, old, new):
+        if old == new:
+            return False
+        if _is_number(old) and _is_number(new):
+            threshold = self._threshold(path)
+            if threshold is not None:
+                return abs(new - old) >= threshold
+        return True
+
+    def update(self, vehicle_id, data) -> list:
+        """
+        Compare a response with what was last reported for the vehicle
+
+        input:
+        vehicle_id: id of the vehicle
+        data: vehicle_data response, or a VehicleSnapshot
+
+        returns:
+        list of Change, empty if nothing changed
+        """
+        if hasattr(data, 'to_dict'):
+            data = data.to_dict()
+        current = {
+            path: value for path, value in flatten(data).items()
+            if path.rpartition(SEPARATOR)[2] not in self.ignore
+        }
+
+        changes = []
+        with self._lock:
+            state = self._state.setdefault(vehicle_id, {})
+            for path, new in current.items():
+                old = state.get(path)
+                if path not in state or self._changed(path, old, new):
+                    state[path] = new
+                    changes.append(Change(path, old, new))
+            groups = set(data)
+            for path in list(state):
+                if (path not in current and
+                        path.split(SEPARATOR, 1)[0] in groups):
+                    changes.append(Change(path, state.pop(path), None))
+
+        if changes:
+            self._publish(vehicle_id, changes)
+        return changes
+
+    def _publish(self, vehicle_id, changes):
+        for callback, prefixes in self._subscribers:
+            if prefixes is None:
+                callback(vehicle_id, changes)
+                continue
+            matched = [
+                c for c in changes
+                if any(c.path == p or c.path.startswith(p + SEPARATOR)
+                       for p in prefixes)
+            ]
+            if matched:
+                callback(vehicle_id, matched)
+
+    def state(self, vehicle_id) -> dict:
+        """
+        returns
+        dict of path to the value last reported for the vehicle
+        """
+        with self._lock:
+            return dict(self._state.get(vehicle_id, {}))
+
+    def reset(self, vehicle_id=None):
+        """
+        Forget a vehicle, or every vehicle, so its next update reports
+        every field
+        """
+        with self._lock:
+            if vehicle_id is None:
+                self._state.clear()
+            else:
+                self._state.pop(vehicle_id, None)
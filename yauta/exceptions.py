@@ -8,3 +8,27 @@ class TeslaAuthException(TeslaException):
     """
     Tesla Auth exception
     """
+
+
+class VehicleOfflineException(TeslaException):
+    """
+    Vehicle is asleep or unreachable
+    """
+
+
+class TeslaWakeTimeoutException(VehicleOfflineException):
+    """
+    Vehicle did not come online before the wake timeout
+    """
+
+
+class CircuitOpenException(TeslaException):
+    """
+    Vehicle has failed too often recently, the call was not attempted
+    """
+
+
+class TeslaDeadlineException(TeslaException):
+    """
+    Call was not answered within its deadline
+    """
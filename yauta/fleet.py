@@ -0,0 +1,224 @@
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from yauta.vehicle import (
+    STATE_ONLINE,
+    WAKE_TIMEOUT,
+    validate_command
+)
+
+FleetResult = namedtuple(
+    'FleetResult', ['vehicle', 'result', 'error', 'elapsed'])
+FleetResult.__doc__ = """
+Outcome of running an operation against a single vehicle
+
+vehicle: the TeslaVehicle the operation ran against
+result: return value of the operation, None if it raised
+error: the exception raised by the operation, None if it succeeded
+elapsed: (float) wall clock seconds the operation took
+"""
+
+
+def succeeded(result: FleetResult) -> bool:
+    """
+    True if the operation did not raise and, for commands, the vehicle
+    did not answer with `result: false`
+    """
+    if result.error is not None:
+        return False
+    response = result.result
+    return not (isinstance(response, dict) and response.get('result') is False)
+
+
+class BroadcastReport(object):
+    """
+    Per vehicle outcome of a TeslaFleet.broadcast
+
+    command: name of the command sent
+    results: dict of vehicle id to FleetResult
+    elapsed: (float) wall clock seconds for the whole broadcast
+    """
+
+    def __init__(self, command, results, elapsed):
+        self.command = command
+        self.results = results
+        self.elapsed = elapsed
+
+    @property
+    def succeeded(self) -> dict:
+        return {
+            vid: r for vid, r in self.results.items() if succeeded(r)
+        }
+
+    @property
+    def failed(self) -> dict:
+        return {
+            vid: r for vid, r in self.results.items() if not succeeded(r)
+        }
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+    def reasons(self) -> dict:
+        """
+        returns
+        dict of vehicle id to why the command failed on that vehicle,
+        either the exception or the reason the vehicle gave
+        """
+        return {
+            vid: r.error if r.error is not None else r.result.get('reason')
+            for vid, r in self.failed.items()
+        }
+
+    def summary(self) -> dict:
+        """
+        returns
+        dict of counts and per vehicle timings, in seconds
+        """
+        timings = sorted(r.elapsed for r in self.results.values())
+        return {
+            'command': self.command,
+            'vehicles': len(self.results),
+            'succeeded': len(self.succeeded),
+            'failed': len(self.failed),
+            'elapsed': self.elapsed,
+            'fastest': timings[0] if timings else None,
+            'slowest': timings[-1] if timings else None
+        }
+
+    def __repr__(self):
+        return '<BroadcastReport %s: %s/%s succeeded in %.2fs>' % (
+            self.command, len(self.succeeded), len(self.results),
+            self.elapsed)
+
+
+class TeslaFleet(object):
+    """
+    Run operations across every vehicle on an account concurrently
+
+    Each TeslaVehicle routes its own requests, so they can safely share
+    the underlying TeslaAPI session from multiple threads. Create the
+    TeslaAPI with a `pool_size` of at least `max_workers` so that
+    connections are reused rather than discarded.
+    """
+
+    def __init__(self, api, max_workers=10, vehicles=None):
+        self.api = api
+        self.max_workers = max_workers
+        self._vehicles = vehicles
+
+    @property
+    def vehicles(self):
+        if self._vehicles is None:
+            self.refresh()
+        return self._vehicles
+
+    def refresh(self):
+        """
+        Reload the list of vehicles from the api
+
+        returns:
+        list of TeslaVehicle objects
+        """
+        self._vehicles = self.api.get_vehicles()
+        return self._vehicles
+
+    def _run(self, fn, vehicle):
+        start = time.monotonic()
+        try:
+            result, error = fn(vehicle), None
+        except Exception as e:
+            result, error = None, e
+        return FleetResult(vehicle, result, error, time.monotonic() - start)
+
+    def map(self, fn, vehicles=None) -> dict:
+        """
+        Call `fn(vehicle)` for each vehicle using the thread pool
+
+        A failure on one vehicle does not affect the others, the
+        exception is recorded on that vehicle's FleetResult instead.
+
+        input:
+        fn: callable taking a TeslaVehicle
+        vehicles: optional list of vehicles, defaults to the whole fleet
+
+        returns:
+        dict of vehicle id to FleetResult
+        """
+        if vehicles is None:
+            vehicles = self.vehicles
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = pool.map(lambda v: self._run(fn, v), vehicles)
+            return {r.vehicle.id: r for r in results}
+
+    def poll(self, vehicles=None, fields=None, timeout=None) -> dict:
+        """
+        Fetch vehicle_data for every vehicle
+
+        input:
+        fields: optional list of field groups to fetch, e.g.
+        ['charge_state'], defaults to all of them
+        timeout: (float) seconds each vehicle has to answer in, retries
+        included, slower ones fail with TeslaDeadlineException rather
+        than hold up the sweep
+
+        returns:
+        dict of vehicle id to FleetResult
+        """
+        return self.map(
+            lambda v: v.get_vehicle_data(fields, timeout), vehicles)
+
+    def wake_all(self, timeout=WAKE_TIMEOUT, vehicles=None) -> dict:
+        """
+        Wake every vehicle in parallel and wait for them to come online
+
+        input:
+        timeout: (float) seconds to wait for each vehicle
+
+        returns:
+        dict of vehicle id to FleetResult, vehicles that did not wake in
+        time have a TeslaWakeTimeoutException as their error
+        """
+        return self.map(
+            lambda v: v.wake_up(wait=True, timeout=timeout), vehicles)
+
+    def broadcast(self, command, vehicle_filter=None, wake=False,
+                  wake_timeout=WAKE_TIMEOUT, **params) -> BroadcastReport:
+        """
+        Send a command to many vehicles concurrently
+
+            report = fleet.broadcast('set_charge_limit', percent=80)
+            report.reasons()
+
+        The command name and its arguments are checked once before
+        anything is sent, so invalid arguments raise TeslaException
+        instead of failing on every vehicle.
+
+        input:
+        command: (str) name of a TeslaVehicle command, e.g. 'door_lock'
+        vehicle_filter: optional callable taking a TeslaVehicle, only
+        vehicles it returns True for receive the command
+        wake: (bool) wake vehicles that are not known to be online first
+        wake_timeout: (float) seconds to wait for each vehicle to wake
+        params: arguments to the command
+
+        returns:
+        BroadcastReport
+        """
+        validate_command(command, params)
+
+        vehicles = self.vehicles
+        if vehicle_filter is not None:
+            vehicles = [v for v in vehicles if vehicle_filter(v)]
+        states = self.api.vehicle_states
+
+        def send(vehicle):
+            if wake and states.get(vehicle.id) != STATE_ONLINE:
+                vehicle.wake_up(wait=True, timeout=wake_timeout)
+            return getattr(vehicle, command)(**params)
+
+        start = time.monotonic()
+        results = self.map(send, vehicles)
+        return BroadcastReport(command, results, time.monotonic() - start)
@@ -0,0 +1,568 @@
+import math
+import threading
+import time
+from collections import namedtuple
+
+import numpy
+
+from yauta.exceptions import TeslaException
+from yauta.poller import DRIVING_SHIFT_STATES
+
+# mean earth radius in meters
+EARTH_RADIUS = 6371008.8
+METERS_PER_DEGREE = EARTH_RADIUS * math.pi / 180
+
+# side of a spatial index cell in degrees, about 5km of latitude
+CELL_SIZE = 0.05
+
+ENTER = 'enter'
+EXIT = 'exit'
+
+FenceEvent = namedtuple(
+    'FenceEvent', ['vehicle_id', 'fence_id', 'kind', 'timestamp'])
+FenceEvent.__doc__ = """
+A vehicle entering or leaving a geofence
+
+kind: 'enter' or 'exit'
+timestamp: (float) epoch seconds of the position that crossed the fence
+"""
+
+Trip = namedtuple('Trip', [
+    'vehicle_id', 'start', 'end', 'start_position', 'end_position',
+    'distance', 'max_speed', 'samples'
+])
+Trip.__doc__ = """
+A drive from the first moving sample to the first parked one
+
+start, end: (float) epoch seconds
+start_position, end_position: (latitude, longitude)
+distance: (float) meters between samples along the way
+max_speed: highest speed reported, in the api's units
+samples: (int) positions the trip was built from
+"""
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Great circle distance in meters, works on numbers or numpy arrays
+    """
+    lat1, lon1, lat2, lon2 = (
+        numpy.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = (numpy.sin((lat2 - lat1) / 2) ** 2 +
+         numpy.cos(lat1) * numpy.cos(lat2) *
+         numpy.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1)))
+
+
+def position_from(data: dict):
+    """
+    Read the position of a vehicle_data response
+
+    returns
+    (latitude, longitude, speed, shift_state, timestamp) with timestamp
+    in epoch seconds, or None if the response has no position
+    """
+    drive_state = data.get('drive_state') or {}
+    latitude = drive_state.get('latitude')
+    longitude = drive_state.get('longitude')
+    if latitude is None or longitude is None:
+        return None
+    timestamp = drive_state.get('gps_as_of')
+    if timestamp is None:
+        timestamp = drive_state.get('timestamp')
+        timestamp = time.time() if timestamp is None else timestamp / 1000.0
+    return (latitude, longitude, drive_state.get('speed'),
+            drive_state.get('shift_state'), float(timestamp))
+
+
+class CircleFence(object):
+    """
+    Geofence of everything within `radius` meters of a point
+    """
+
+    def __init__(self, id, latitude: float, longitude: float,
+                 radius: float):
+        self.id = id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.radius = radius
+        dlat = radius / METERS_PER_DEGREE
+        dlon = radius / (METERS_PER_DEGREE * max(
+            math.cos(math.radians(latitude)), 0.01))
+        self.bounds = (latitude - dlat, longitude - dlon,
+                       latitude + dlat, longitude + dlon)
+
+    def contains(self, latitudes, longitudes):
+        """
+        returns
+        numpy bool array of which points are inside the fence
+        """
+        return haversine(
+            latitudes, longitudes, self.latitude, self.longitude
+        ) <= self.radius
+
+
+class PolygonFence(object):
+    """
+    Geofence of a simple polygon, given as a list of (latitude,
+    longitude) vertices. Edges are straight in latitude and longitude,
+    which is close enough for fences of a few kilometers.
+    """
+
+    def __init__(self, id, points):
+        if len(points) < 3:
+            raise TeslaException(
+                'Polygon fence %s needs at least 3 points' % id)
+        self.id = id
+        self.points = [tuple(p) for p in points]
+        vertices = numpy.array(self.points, dtype=float)
+        self._lat1 = vertices[:, 0]
+        self._lon1 = vertices[:, 1]
+        self._lat2 = numpy.roll(self._lat1, -1)
+        self._lon2 = numpy.roll(self._lon1, -1)
+        self.bounds = (self._lat1.min(), self._lon1.min(),
+                       self._lat1.max(), self._lon1.max())
+
+    def contains(self, latitudes, longitudes):
+        """
+        returns
+        numpy bool array of which points are inside the fence, by ray
+        casting against every edge at once
+        """
+        lat = numpy.asarray(latitudes, dtype=float)[:, None]
+        lon = numpy.asarray(longitudes, dtype=float)[:, None]
+        straddles = (self._lat1 > lat) != (self._lat2 > lat)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            crossing = (self._lon2 - self._lon1) * (lat - self._lat1) / (
+                self._lat2 - self._lat1) + self._lon1
+        crosses = straddles & (lon < crossing)
+        return (numpy.count_nonzero(crosses, axis=1) % 2) == 1
+
+
+_Built = namedtuple('_Built', [
+    'fences', 'cells', 'owners', 'ids', 'circle', 'latitude', 'longitude',
+    'radius', 'edge_start', 'edge_count', 'edges'
+])
+
+
+class FenceIndex(object):
+    """
+    Grid index of geofences
+
+    Each fence is listed under every grid cell its bounding box touches,
+    as sorted arrays, so finding the fences a batch of points may be in
+    is a binary search per point with no Python loop. Only those
+    candidates are then checked exactly, all of them in one vectorized
+    step for circles and one for polygons.
+
+    input
+    cell_size: (float) side of a grid cell in degrees, around the size of
+    a typical fence works best
+    """
+
+    def __init__(self, fences=(), cell_size=CELL_SIZE):
+        self.cell_size = float(cell_size)
+        self._columns = int(math.ceil(360 / self.cell_size)) + 2
+        self._fences = {}
+        self._built = None
+        for fence in fences:
+            self.add(fence)
+
+    def __len__(self):
+        return len(self._fences)
+
+    def __contains__(self, fence_id):
+        return fence_id in self._fences
+
+    def add(self, fence):
+        """
+        Add a CircleFence or PolygonFence, replacing any with the same id
+        """
+        self._fences[fence.id] = fence
+        self._built = None
+
+    def remove(self, fence_id) -> bool:
+        if self._fences.pop(fence_id, None) is None:
+            return False
+        self._built = None
+        return True
+
+    def get(self, fence_id):
+        return self._fences.get(fence_id)
+
+    def _cells(self, latitudes, longitudes):
+        rows = numpy.floor((numpy.asarray(latitudes) + 90) / self.cell_size)
+        columns = numpy.floor(
+            (numpy.asarray(longitudes) + 180) / self.cell_size)
+        return rows.astype(numpy.int64) * self._columns + columns.astype(
+            numpy.int64)
+
+    def _build(self):
+        fences = list(self._fences.values())
+        cells = []
+        owners = []
+        for i, fence in enumerate(fences):
+            min_lat, min_lon, max_lat, max_lon = fence.bounds
+            rows = numpy.arange(
+                math.floor((min_lat + 90) / self.cell_size),
+                math.floor((max_lat + 90) / self.cell_size) + 1)
+            columns = numpy.arange(
+                math.floor((min_lon + 180) / self.cell_size),
+                math.floor((max_lon + 180) / self.cell_size) + 1)
+            covered = (rows[:, None] * self._columns + columns).ravel()
+            cells.append(covered)
+            owners.append(numpy.full(len(covered), i))
+        if cells:
+            cells = numpy.concatenate(cells)
+            owners = numpy.concatenate(owners)
+        else:
+            cells = numpy.empty(0, numpy.int64)
+            owners = numpy.empty(0, numpy.int64)
+        order = numpy.argsort(cells, kind='stable')
+
+        # circle parameters and polygon edges of every fence, polygon edges
+        # flattened with the edges of fence i at edge_start[i]
+        circles = [isinstance(f, CircleFence) for f in fences]
+        edges = [
+            numpy.empty((0, 4)) if c else numpy.column_stack(
+                (f._lat1, f._lon1, f._lat2, f._lon2))
+            for f, c in zip(fences, circles)
+        ]
+        edge_count = numpy.array([len(e) for e in edges], dtype=numpy.int64)
+        edges = numpy.concatenate(edges) if edges else numpy.empty((0, 4))
+        self._built = _Built(
+            fences, cells[order], owners[order],
+            numpy.array([f.id for f in fences] or [None], dtype=object),
+            numpy.array(circles, dtype=bool),
+            numpy.array([f.latitude if c else 0.0
+                         for f, c in zip(fences, circles)]),
+            numpy.array([f.longitude if c else 0.0
+                         for f, c in zip(fences, circles)]),
+            numpy.array([f.radius if c else 0.0
+                         for f, c in zip(fences, circles)]),
+            numpy.cumsum(edge_count) - edge_count, edge_count, edges.T)
+        return self._built
+
+    def candidates(self, latitudes, longitudes):
+        """
+        returns
+        (point indexes, fence indexes, fences) of every point and fence
+        whose cells overlap, fence indexes pointing into fences
+        """
+        built = self._built or self._build()
+        points = self._cells(latitudes, longitudes)
+        lo = numpy.searchsorted(built.cells, points, side='left')
+        hi = numpy.searchsorted(built.cells, points, side='right')
+        counts = hi - lo
+        total = int(counts.sum())
+        point_index = numpy.repeat(numpy.arange(len(points)), counts)
+        offsets = numpy.arange(total) - numpy.repeat(
+            numpy.cumsum(counts) - counts, counts)
+        fence_index = built.owners[numpy.repeat(lo, counts) + offsets]
+        return point_index, fence_index, built.fences
+
+    def locate(self, latitudes, longitudes):
+        """
+        Find the fences a batch of points are in
+
+        returns
+        (point indexes, fence ids) arrays, one entry per point inside a
+        fence
+        """
+        latitudes = numpy.asarray(latitudes, dtype=float)
+        longitudes = numpy.asarray(longitudes, dtype=float)
+        point_index, fence_index, fences = self.candidates(
+            latitudes, longitudes)
+        built = self._built
+        inside = numpy.zeros(len(point_index), bool)
+
+        circle = built.circle[fence_index]
+        pairs = numpy.flatnonzero(circle)
+        points, owners = point_index[pairs], fence_index[pairs]
+        inside[pairs] = haversine(
+            latitudes[points], longitudes[points],
+            built.latitude[owners], built.longitude[owners]
+        ) <= built.radius[owners]
+
+        # every polygon pair against each edge of its polygon, as in
+        # PolygonFence.contains, summing the crossings of each pair
+        pairs = numpy.flatnonzero(~circle)
+        owners = fence_index[pairs]
+        counts = built.edge_count[owners]
+        pair = numpy.repeat(numpy.arange(len(pairs)), counts)
+        edge = numpy.repeat(built.edge_start[owners], counts) + (
+            numpy.arange(int(counts.sum())) - numpy.repeat(
+                numpy.cumsum(counts) - counts, counts))
+        lat1, lon1, lat2, lon2 = built.edges[:, edge]
+        points = point_index[pairs][pair]
+        lat, lon = latitudes[points], longitudes[points]
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            crossing = (lon2 - lon1) * (lat - lat1) / (lat2 - lat1) + lon1
+        crosses = ((lat1 > lat) != (lat2 > lat)) & (lon < crossing)
+        inside[pairs] = numpy.bincount(
+            pair, weights=crosses, minlength=len(pairs)) % 2 == 1
+        return point_index[inside], built.ids[fence_index[inside]]
+
+
+class GeofenceEngine(object):
+    """
+    Track which geofences every vehicle is in and report crossings
+
+        engine = GeofenceEngine([
+            CircleFence('depot', 37.49, -121.94, radius=300),
+            PolygonFence('site-7', [(37.40, -122.10), ...])
+        ], on_event=print)
+        poller = AdaptivePoller(t, on_data=engine.update)
+
+    Positions are processed in batches through a FenceIndex, so the cost
+    of an update depends on the fences near the vehicle rather than on
+    how many fences there are. A vehicle's first position sets which
+    fences it is in without raising events.
+
+    input
+    fences: CircleFence and PolygonFence to start with
+    cell_size: see FenceIndex
+    on_event: optional callable taking each FenceEvent
+    """
+
+    def __init__(self, fences=(), cell_size=CELL_SIZE, on_event=None):
+        self.index = FenceIndex(fences, cell_size)
+        self.on_event = on_event
+        self._inside = {}
+        self._lock = threading.Lock()
+
+    def add_fence(self, fence):
+        with self._lock:
+            self.index.add(fence)
+
+    def remove_fence(self, fence_id) -> bool:
+        """
+        Remove a fence, vehicles inside it exit without an event
+        """
+        with self._lock:
+            if not self.index.remove(fence_id):
+                return False
+            for vehicle_id, fences in self._inside.items():
+                if fence_id in fences:
+                    self._inside[vehicle_id] = fences - {fence_id}
+            return True
+
+    def inside(self, vehicle_id) -> frozenset:
+        """
+        returns
+        ids of the fences the vehicle was last seen in
+        """
+        return self._inside.get(vehicle_id, frozenset())
+
+    def vehicles_in(self, fence_id) -> list:
+        return sorted(
+            v for v, fences in self._inside.items() if fence_id in fences)
+
+    def update_positions(self, vehicle_ids, latitudes, longitudes,
+                         timestamps) -> list:
+        """
+        Process a batch of positions, in time order for each vehicle
+
+        returns
+        list of FenceEvent, in batch order
+        """
+        latitudes = numpy.asarray(latitudes, dtype=float)
+        longitudes = numpy.asarray(longitudes, dtype=float)
+        with self._lock:
+            point_index, fence_ids = self.index.locate(latitudes, longitudes)
+            found = [set() for _ in vehicle_ids]
+            for i, fence_id in zip(point_index.tolist(), fence_ids.tolist()):
+                found[i].add(fence_id)
+
+            events = []
+            for i, vehicle_id in enumerate(vehicle_ids):
+                now = frozenset(found[i])
+                before = self._inside.get(vehicle_id)
+                self._inside[vehicle_id] = now
+                if before is None or before == now:
+                    continue
+                timestamp = float(timestamps[i])
+                events.extend(
+                    FenceEvent(vehicle_id, f, EXIT, timestamp)
+                    for f in sorted(before - now, key=str))
+                events.extend(
+                    FenceEvent(vehicle_id, f, ENTER, timestamp)
+                    for f in sorted(now - before, key=str))
+        if self.on_event is not None:
+            for event in events:
+                self.on_event(event)
+        return events
+
+    def update_many(self, results: dict) -> list:
+        """
+        Process vehicle_data for many vehicles, a dict of vehicle id to
+        vehicle_data or the FleetResults of TeslaFleet.poll
+
+        returns
+        list of FenceEvent
+        """
+        ids, latitudes, longitudes, timestamps = [], [], [], []
+        for vehicle_id, data in results.items():
+            if hasattr(data, 'error'):
+                if data.error is not None:
+                    continue
+                data = data.result
+            position = position_from(data)
+            if position is None:
+                continue
+            ids.append(vehicle_id)
+            latitudes.append(position[0])
+            longitudes.append(position[1])
+            timestamps.append(position[4])
+        if not ids:
+            return []
+        return self.update_positions(ids, latitudes, longitudes, timestamps)
+
+    def update(self, vehicle_id, data) -> list:
+        """
+        Process one vehicle_data response, see update_many
+        """
+        return self.update_many({vehicle_id: data})
+
+
+class _Drive(object):
+
+    __slots__ = ('start', 'start_position', 'last', 'position', 'distance',
+                 'max_speed', 'samples', 'stopped_at', 'stopped_position')
+
+    def __init__(self, timestamp, position):
+        self.start = timestamp
+        self.start_position = position
+        self.last = timestamp
+        self.position = position
+        self.distance = 0.0
+        self.max_speed = 0
+        self.samples = 0
+        self.stopped_at = None
+        self.stopped_position = None
+
+
+class TripSegmenter(object):
+    """
+    Split each vehicle's stream of positions into trips as it arrives
+
+        segmenter = TripSegmenter(on_trip=save_trip)
+        poller = AdaptivePoller(t, on_data=segmenter.update)
+
+    A trip starts with the first sample in gear or moving, and ends at
+    the first parked sample once the vehicle has stayed parked for
+    `stop_timeout` seconds, so short stops don't split a drive. A trip
+    also ends when no position has come in for `stop_timeout` seconds
+    by the time flush is called. Trips shorter than `min_distance`
+    meters are dropped as GPS noise.
+
+    input
+    stop_timeout: (float) seconds parked that end a trip
+    min_distance: (float) meters a trip has to cover to be reported
+    on_trip: optional callable taking each finished Trip
+    """
+
+    def __init__(self, stop_timeout=300, min_distance=100, on_trip=None):
+        self.stop_timeout = stop_timeout
+        self.min_distance = min_distance
+        self.on_trip = on_trip
+        self._drives = {}
+        self._lock = threading.Lock()
+
+    @property
+    def driving(self) -> list:
+        """
+        returns
+        ids of the vehicles with a trip under way
+        """
+        return sorted(self._drives)
+
+    def _finish(self, vehicle_id, drive, end, position):
+        del self._drives[vehicle_id]
+        if drive.distance < self.min_distance:
+            return None
+        return Trip(vehicle_id, drive.start, end, drive.start_position,
+                    position, drive.distance, drive.max_speed,
+                    drive.samples)
+
+    def add_position(self, vehicle_id, latitude, longitude, speed,
+                     shift_state, timestamp) -> Trip:
+        """
+        Add the next position of a vehicle
+
+        returns
+        the Trip this position finished, if any
+        """
+        position = (latitude, longitude)
+        moving = shift_state in DRIVING_SHIFT_STATES or bool(speed)
+        trip = None
+        with self._lock:
+            drive = self._drives.get(vehicle_id)
+            if drive is not None and drive.stopped_at is not None and (
+                    timestamp - drive.stopped_at >= self.stop_timeout):
+                trip = self._finish(
+                    vehicle_id, drive, drive.stopped_at,
+                    drive.stopped_position)
+                drive = None
+            if drive is None:
+                if not moving:
+                    return self._report(trip)
+                drive = self._drives[vehicle_id] = _Drive(timestamp, position)
+            else:
+                drive.distance += float(haversine(
+                    drive.position[0], drive.position[1],
+                    latitude, longitude))
+            drive.last = timestamp
+            drive.position = position
+            drive.samples += 1
+            if speed:
+                drive.max_speed = max(drive.max_speed, speed)
+            if moving:
+                drive.stopped_at = None
+                drive.stopped_position = None
+            elif drive.stopped_at is None:
+                drive.stopped_at = timestamp
+                drive.stopped_position = position
+        return self._report(trip)
+
+    def _report(self, trip):
+        if trip is not None and self.on_trip is not None:
+            self.on_trip(trip)
+        return trip
+
+    def update(self, vehicle_id, data) -> Trip:
+        """
+        Add the position of a vehicle_data response, see add_position
+        """
+        position = position_from(data)
+        if position is None:
+            return None
+        return self.add_position(vehicle_id, *position)
+
+    def flush(self, now=None) -> list:
+        """
+        Finish trips of vehicles that have been parked, or have not sent
+        a position, for `stop_timeout` seconds
+
+        returns
+        list of the Trips finished
+        """
+        if now is None:
+            now = time.time()
+        trips = []
+        with self._lock:
+            for vehicle_id, drive in list(self._drives.items()):
+                if drive.stopped_at is not None:
+                    if now - drive.stopped_at < self.stop_timeout:
+                        continue
+                    end, position = drive.stopped_at, drive.stopped_position
+                elif now - drive.last >= self.stop_timeout:
+                    end, position = drive.last, drive.position
+                else:
+                    continue
+                trip = self._finish(vehicle_id, drive, end, position)
+                if trip is not None:
+                    trips.append(trip)
+        for trip in trips:
+            self._report(trip)
+        return trips
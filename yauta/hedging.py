@@ -0,0 +1,185 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+from yauta.exceptions import TeslaDeadlineException
+from yauta.metrics import endpoint_from_url
+
+
+def _succeeded(response) -> bool:
+    status = getattr(response, 'status_code', None)
+    return status is None or 200 <= status < 300
+
+
+class HedgePolicy(object):
+    """
+    Hedge slow idempotent reads with a second request
+
+        t = TeslaAPI(..., hedge=HedgePolicy(quantile=0.95, budget=0.05))
+
+    A read that has not been answered after the `quantile` of the recent
+    latencies of its endpoint is sent again, and whichever response
+    comes back first is used; the other is left to finish in the
+    background and dropped. Error responses don't count as answers, they
+    are only returned when no request succeeds. Latencies of successful
+    reads are kept per endpoint, the last `window` of them, and no read
+    is hedged until `min_samples` have been seen.
+
+    Hedges are paid for out of a budget so they can't pile load on an
+    api that is slow for everyone: every read earns `budget` of a hedge,
+    up to `burst` saved, and a hedge costs one. At most about `budget`
+    of the reads are therefore sent twice.
+
+    Reads made with a deadline through a HedgePolicy return, or raise
+    TeslaDeadlineException, once it has passed, whatever retries the
+    requests are still going through.
+
+    A read that can't be hedged, with too few latencies or no hedge
+    left in the budget, and that has no deadline is sent on the
+    caller's thread. Otherwise the read, and its hedge, are each sent on
+    a thread of their own while the caller waits, so however many
+    threads read through the api at once, no read or hedge waits for
+    another to finish.
+
+    input
+    quantile: (float) latency quantile to wait for before hedging
+    budget: (float) hedges earned per read
+    burst: (float) most hedges that can be saved up
+    min_delay: (float) seconds to wait at least before hedging
+    """
+
+    def __init__(self, quantile=0.95, budget=0.05, burst=10, window=200,
+                 min_samples=20, min_delay=0.0):
+        self.quantile = quantile
+        self.budget = budget
+        self.burst = burst
+        self.window = window
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._latencies = {}
+        self._tokens = float(burst)
+        self._lock = threading.Lock()
+        # reads sent, reads hedged and hedges that answered first
+        self.reads = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def observe(self, endpoint: str, elapsed: float):
+        with self._lock:
+            latencies = self._latencies.get(endpoint)
+            if latencies is None:
+                latencies = self._latencies[endpoint] = deque(
+                    maxlen=self.window)
+            latencies.append(elapsed)
+
+    def delay(self, endpoint: str) -> float:
+        """
+        returns
+        seconds to wait for a read of `endpoint` before hedging it, None
+        while there are too few latencies to tell
+        """
+        with self._lock:
+            latencies = self._latencies.get(endpoint)
+            if not latencies or len(latencies) < self.min_samples:
+                return None
+            ordered = sorted(latencies)
+        index = min(len(ordered) - 1, int(self.quantile * len(ordered)))
+        return max(self.min_delay, ordered[index])
+
+    def _earn(self):
+        with self._lock:
+            self.reads += 1
+            self._tokens = min(self.burst, self._tokens + self.budget)
+
+    def _can_hedge(self):
+        with self._lock:
+            return self._tokens >= 1
+
+    def _take(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.hedged += 1
+            return True
+
+    def _submit(self, endpoint, send, deadline):
+        start = time.monotonic()
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - start
+
+        def observe(future):
+            if future.exception() is None and _succeeded(future.result()):
+                self.observe(endpoint, time.monotonic() - start)
+
+        def run():
+            try:
+                future.set_result(send(timeout))
+            except BaseException as e:
+                future.set_exception(e)
+
+        future = Future()
+        future.add_done_callback(observe)
+        future.set_running_or_notify_cancel()
+        threading.Thread(target=run, name='yauta-hedge', daemon=True).start()
+        return future
+
+    def call(self, url: str, send, deadline: float = None):
+        """
+        Send a read, hedging it if it is slow
+
+        input
+        url: the url read, reduced to its endpoint to track latencies
+        send: callable taking a timeout in seconds (or None) and making
+        the request
+        deadline: time.monotonic() by which the read has to be answered
+
+        returns
+        the first successful response `send` returned. When every request
+        failed, the first failure: the error response returned or the
+        exception raised
+        """
+        endpoint = endpoint_from_url(url)
+        self._earn()
+        delay = self.delay(endpoint)
+        if delay is not None and not self._can_hedge():
+            delay = None
+        if delay is None and deadline is None:
+            start = time.monotonic()
+            result = send(None)
+            if _succeeded(result):
+                self.observe(endpoint, time.monotonic() - start)
+            return result
+
+        first = self._submit(endpoint, send, deadline)
+        pending = {first}
+        hedge = delay is not None
+        errors = []
+        while pending:
+            timeout = delay if hedge else None
+            if deadline is not None:
+                remaining = max(0.0, deadline - time.monotonic())
+                timeout = remaining if timeout is None else min(
+                    timeout, remaining)
+            done, pending = wait(pending, timeout, FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and _succeeded(
+                        future.result()):
+                    if future is not first:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+                errors.append(future)
+            if not pending:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TeslaDeadlineException(
+                    'No response from %s within the deadline' % endpoint)
+            if hedge and not done:
+                hedge = False
+                if self._take():
+                    pending.add(self._submit(endpoint, send, deadline))
+        # the result, or raises the exception, of the first to fail
+        return errors[0].result()
@@ -0,0 +1,326 @@
+import re
+import threading
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# upper bounds in seconds, an implicit +Inf bucket follows
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60
+)
+WAKE_BUCKETS = (1, 2.5, 5, 10, 15, 20, 30, 45, 60, 90, 120)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_VEHICLE_ID = re.compile(r'(/vehicles/)\d+')
+
+# passed to every hook. kind is 'request', 'auth' or 'wake', fields that
+# do not apply to the kind are None
+MetricEvent = namedtuple('MetricEvent', [
+    'kind', 'method', 'endpoint', 'status', 'elapsed', 'retries', 'sent',
+    'received'
+])
+
+
+def endpoint_from_url(url: str) -> str:
+    """
+    Reduce a request url to an endpoint label, the host, query string
+    and vehicle id are dropped so every vehicle shares one series
+    """
+    path = url.split('?', 1)[0]
+    if '://' in path:
+        path = '/' + path.split('://', 1)[1].partition('/')[2]
+    return _VEHICLE_ID.sub(r'\1{id}', path)
+
+
+class Histogram(object):
+    """
+    Cumulative histogram in the Prometheus sense, not thread safe on its
+    own, Metrics guards it
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        returns
+        list of (upper bound, count of observations <= bound) including
+        the +Inf bucket
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        """
+        Estimate a quantile as the upper bound of the bucket holding it
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+
+
+class _EndpointStats(object):
+
+    def __init__(self, buckets):
+        self.latency = Histogram(buckets)
+        self.statuses = {}
+        self.retries = 0
+        self.sent = 0
+        self.received = 0
+
+
+class Metrics(object):
+    """
+    Latency, status, retry and transfer metrics for requests made by a
+    TeslaAPI or AsyncTeslaAPI, plus authentication and wake durations
+
+        metrics = Metrics()
+        t = TeslaAPI(..., metrics=metrics)
+        ...
+        print(metrics.to_prometheus())
+
+    Requests are grouped by method and endpoint (see endpoint_from_url).
+    A status of None counts requests that failed without a response.
+    Hooks added with add_hook are called with a MetricEvent for every
+    observation, on the thread that made the request.
+
+    Leaving `metrics` unset on the api skips all of this.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, wake_buckets=WAKE_BUCKETS,
+                 namespace='yauta'):
+        self.buckets = tuple(buckets)
+        self.namespace = namespace
+        self._wake_buckets = tuple(wake_buckets)
+        self._lock = threading.Lock()
+        self._hooks = []
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+            self.auth = Histogram(self.buckets)
+            self.wake = Histogram(self._wake_buckets)
+            self.wake_timeouts = 0
+
+    def add_hook(self, hook):
+        """
+        input:
+        hook: callable taking a MetricEvent
+        """
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self._hooks.remove(hook)
+
+    def _emit(self, event):
+        for hook in self._hooks:
+            hook(event)
+
+    def observe_request(self, method, url, status, elapsed, retries=0,
+                        sent=0, received=0):
+        """
+        Record a request, including any retries made for it
+
+        input:
+        method: http method
+        url: request url or path
+        status: final status code, None if no response was received
+        elapsed: seconds from the first attempt to the final response
+        retries: number of attempts after the first
+        sent: request body bytes
+        received: response body bytes
+        """
+        endpoint = endpoint_from_url(url)
+        key = (method.upper(), endpoint)
+        with self._lock:
+            stats = self._endpoints.get(key)
+            if stats is None:
+                stats = self._endpoints[key] = _EndpointStats(self.buckets)
+            stats.latency.observe(elapsed)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.retries += retries
+            stats.sent += sent
+            stats.received += received
+        if self._hooks:
+            self._emit(MetricEvent(
+                'request', key[0], endpoint, status, elapsed, retries, sent,
+                received))
+
+    def observe_auth(self, elapsed):
+        """
+        Record the time taken to fetch a token
+        """
+        with self._lock:
+            self.auth.observe(elapsed)
+        if self._hooks:
+            self._emit(MetricEvent(
+                'auth', None, None, None, elapsed, None, None, None))
+
+    def observe_wake(self, elapsed, online=True):
+        """
+        Record the time from a wake_up to the vehicle coming online, or
+        to giving up on it
+        """
+        with self._lock:
+            if online:
+                self.wake.observe(elapsed)
+            else:
+                self.wake_timeouts += 1
+        if self._hooks:
+            self._emit(MetricEvent(
+                'wake', None, None, None, elapsed, None, None, None))
+
+    def endpoints(self) -> dict:
+        """
+        Summary of every endpoint seen so far
+
+        returns
+        dict of (method, endpoint) to dict of count, mean, p50, p99 (upper
+        bucket bounds, in seconds), statuses, retries, sent and received
+        """
+        with self._lock:
+            result = {}
+            for key, stats in self._endpoints.items():
+                latency = stats.latency
+                result[key] = {
+                    'count': latency.count,
+                    'mean': latency.sum / latency.count,
+                    'p50': latency.quantile(0.5),
+                    'p99': latency.quantile(0.99),
+                    'statuses': dict(stats.statuses),
+                    'retries': stats.retries,
+                    'sent': stats.sent,
+                    'received': stats.received
+                }
+            return result
+
+    def to_prometheus(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format
+        """
+        ns = self.namespace
+        lines = []
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+
+            name = '%s_request_duration_seconds' % ns
+            lines.append('# HELP %s Request latency including retries.' % name)
+            lines.append('# TYPE %s histogram' % name)
+            for (method, endpoint), stats in endpoints:
+                labels = 'method="%s",endpoint="%s"' % (
+                    method, _escape(endpoint))
+                _histogram_lines(lines, name, labels, stats.latency)
+
+            name = '%s_requests_total' % ns
+            lines.append('# HELP %s Requests by final status.' % name)
+            lines.append('# TYPE %s counter' % name)
+            for (method, endpoint), stats in endpoints:
+                for status, count in sorted(
+                        stats.statuses.items(), key=lambda s: s[0] or 0):
+                    lines.append(
+                        '%s{method="%s",endpoint="%s",status="%s"} %s' % (
+                            name, method, _escape(endpoint),
+                            'error' if status is None else status, count))
+
+            for suffix, attr, help_text in (
+                    ('request_retries_total', 'retries',
+                     'Attempts made after the first.'),
+                    ('request_sent_bytes_total', 'sent',
+                     'Request body bytes.'),
+                    ('response_received_bytes_total', 'received',
+                     'Response body bytes.')):
+                name = '%s_%s' % (ns, suffix)
+                lines.append('# HELP %s %s' % (name, help_text))
+                lines.append('# TYPE %s counter' % name)
+                for (method, endpoint), stats in endpoints:
+                    lines.append('%s{method="%s",endpoint="%s"} %s' % (
+                        name, method, _escape(endpoint),
+                        getattr(stats, attr)))
+
+            name = '%s_auth_duration_seconds' % ns
+            lines.append('# HELP %s Token fetch latency.' % name)
+            lines.append('# TYPE %s histogram' % name)
+            _histogram_lines(lines, name, '', self.auth)
+
+            name = '%s_wake_duration_seconds' % ns
+            lines.append(
+                '# HELP %s Time from wake_up to the vehicle online.' % name)
+            lines.append('# TYPE %s histogram' % name)
+            _histogram_lines(lines, name, '', self.wake)
+
+            name = '%s_wake_timeouts_total' % ns
+            lines.append(
+                '# HELP %s Vehicles that did not wake in time.' % name)
+            lines.append('# TYPE %s counter' % name)
+            lines.append('%s %s' % (name, self.wake_timeouts))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def _format_bound(bound):
+    if bound == float('inf'):
+        return '+Inf'
+    return repr(float(bound))
+
+
+def _histogram_lines(lines, name, labels, histogram):
+    sep = ',' if labels else ''
+    for bound, total in histogram.cumulative():
+        lines.append('%s_bucket{%s%sle="%s"} %s' % (
+            name, labels, sep, _format_bound(bound), total))
+    suffix = '{%s}' % labels if labels else ''
+    lines.append('%s_sum%s %s' % (name, suffix, histogram.sum))
+    lines.append('%s_count%s %s' % (name, suffix, histogram.count))
+
+
+def serve_metrics(metrics, port=9100, addr=''):
+    """
+    Serve `metrics` for Prometheus to scrape from a background thread
+
+    returns
+    the HTTPServer, call shutdown() on it to stop serving
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            body = metrics.to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = HTTPServer((addr, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
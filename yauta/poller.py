@@ -0,0 +1,259 @@
+import heapq
+import itertools
+import threading
+import time
+
+from yauta.exceptions import VehicleOfflineException
+from yauta.fleet import TeslaFleet
+from yauta.vehicle import OFFLINE_STATES, STATE_ONLINE
+
+MODE_DRIVING = 'driving'
+MODE_CHARGING = 'charging'
+MODE_PARKED = 'parked'
+# parked and idle, left alone so that it can fall asleep
+MODE_IDLE = 'idle'
+MODE_ASLEEP = 'asleep'
+
+# seconds between vehicle_data polls for each mode
+DEFAULT_INTERVALS = {
+    MODE_DRIVING: 15,
+    MODE_CHARGING: 60,
+    MODE_PARKED: 300
+}
+
+# among polls that are due at the same time, lower goes first
+MODE_PRIORITY = {
+    MODE_DRIVING: 0,
+    MODE_CHARGING: 1,
+    MODE_PARKED: 2
+}
+
+DEFAULT_FIELDS = ('charge_state', 'drive_state', 'vehicle_state')
+
+CHARGING_STATES = ('Charging', 'Starting')
+DRIVING_SHIFT_STATES = ('D', 'R', 'N')
+
+
+def vehicle_mode(data: dict) -> str:
+    """
+    Classify a vehicle_data response as driving, charging or parked
+    """
+    drive_state = data.get('drive_state') or {}
+    if (drive_state.get('shift_state') in DRIVING_SHIFT_STATES or
+            drive_state.get('speed')):
+        return MODE_DRIVING
+    charge_state = data.get('charge_state') or {}
+    if charge_state.get('charging_state') in CHARGING_STATES:
+        return MODE_CHARGING
+    return MODE_PARKED
+
+
+class _Schedule(object):
+
+    __slots__ = ('vehicle', 'mode', 'due', 'seq', 'active_at')
+
+    def __init__(self, vehicle, now):
+        self.vehicle = vehicle
+        self.mode = MODE_ASLEEP
+        self.due = None
+        self.seq = None
+        self.active_at = now
+
+
+class AdaptivePoller(object):
+    """
+    Poll vehicle_data for every vehicle on an account at a rate suited
+    to what each vehicle is doing
+
+        poller = AdaptivePoller(t, on_data=differ.update)
+        poller.run()
+
+    Driving and charging vehicles are polled often, parked ones rarely.
+    Once a vehicle has been parked for `idle_timeout` seconds it is not
+    polled at all for `sleep_window` seconds, so that it can fall asleep.
+    Sleeping vehicles are never woken: their state is watched through the
+    vehicle list every `list_interval` seconds, which does not wake them,
+    and polling resumes when they come online.
+
+    Polls are kept in a priority queue ordered by when they are due, and
+    the total rate of requests, including vehicle list checks, is capped
+    at `max_rate` per second with bursts of `burst`. Polls due at once
+    are sent concurrently through a TeslaFleet.
+
+    input
+    api: TeslaAPI, without auto_wake
+    intervals: dict of mode to seconds, merged into DEFAULT_INTERVALS
+    fields: field groups to poll, must include charge_state and
+    drive_state to tell the modes apart
+    on_data: optional callable taking a vehicle id and the data polled
+    """
+
+    def __init__(self, api, intervals=None, fields=DEFAULT_FIELDS,
+                 list_interval=60, idle_timeout=600, sleep_window=1800,
+                 max_rate=1.0, burst=5, max_workers=10, on_data=None,
+                 clock=time.monotonic):
+        self.api = api
+        self.intervals = dict(DEFAULT_INTERVALS, **(intervals or {}))
+        self.fields = list(fields) if fields else None
+        self.list_interval = list_interval
+        self.idle_timeout = idle_timeout
+        self.sleep_window = sleep_window
+        self.max_rate = float(max_rate)
+        self.burst = float(burst)
+        self.on_data = on_data
+        self.clock = clock
+        self.fleet = TeslaFleet(api, max_workers)
+        self._schedules = {}
+        self._queue = []
+        self._seq = itertools.count()
+        self._allowance = self.burst
+        self._allowance_at = clock()
+        self._list_due = None
+
+    @property
+    def modes(self) -> dict:
+        """
+        returns
+        dict of vehicle id to its current mode
+        """
+        return {vid: s.mode for vid, s in self._schedules.items()}
+
+    def _refill(self, now):
+        self._allowance = min(
+            self.burst,
+            self._allowance + (now - self._allowance_at) * self.max_rate)
+        self._allowance_at = now
+
+    def _take(self, now):
+        """
+        Take one request from the rate allowance, if there is one left
+        """
+        self._refill(now)
+        if self._allowance < 1:
+            return False
+        self._allowance -= 1
+        return True
+
+    def _schedule(self, schedule, mode, due):
+        schedule.mode = mode
+        schedule.due = due
+        if due is None or mode == MODE_IDLE:
+            # only check_states takes vehicles out of these modes
+            schedule.seq = None
+            return
+        schedule.seq = next(self._seq)
+        heapq.heappush(self._queue, (
+            due, MODE_PRIORITY[mode], schedule.seq, schedule.vehicle.id))
+
+    def check_states(self, now=None):
+        """
+        Refresh vehicle states from the vehicle list, starting to poll
+        vehicles that came online and stopping for those that went to
+        sleep
+        """
+        if now is None:
+            now = self.clock()
+        self._list_due = now + self.list_interval
+        states = self.api.vehicle_states
+        for vehicle in self.api.get_vehicles():
+            schedule = self._schedules.get(vehicle.id)
+            if schedule is None:
+                schedule = self._schedules[vehicle.id] = _Schedule(
+                    vehicle, now)
+            state = states.get(vehicle.id)
+            if state in OFFLINE_STATES:
+                if schedule.mode != MODE_ASLEEP:
+                    self._schedule(schedule, MODE_ASLEEP, None)
+            elif state == STATE_ONLINE and schedule.mode == MODE_ASLEEP:
+                schedule.active_at = now
+                self._schedule(schedule, MODE_PARKED, now)
+            elif (state == STATE_ONLINE and schedule.mode == MODE_IDLE and
+                    schedule.due <= now):
+                # did not fall asleep, check on it before leaving it again
+                self._schedule(schedule, MODE_PARKED, now)
+
+    def _due(self, now):
+        """
+        Pop the polls that are due, as far as the rate allowance goes
+        """
+        due = []
+        while self._queue and self._queue[0][0] <= now:
+            _, _, seq, vehicle_id = self._queue[0]
+            schedule = self._schedules[vehicle_id]
+            if seq != schedule.seq:
+                # superseded by a later _schedule
+                heapq.heappop(self._queue)
+                continue
+            if not self._take(now):
+                break
+            heapq.heappop(self._queue)
+            schedule.seq = None
+            due.append(schedule)
+        return due
+
+    def _poll(self, vehicle):
+        data = vehicle.get_vehicle_data(self.fields)
+        if self.on_data is not None:
+            self.on_data(vehicle.id, data)
+        return data
+
+    def step(self) -> dict:
+        """
+        Check the vehicle list and poll vehicles as they come due
+
+        returns
+        dict of vehicle id to FleetResult for the vehicles polled
+        """
+        now = self.clock()
+        if self._list_due is None or self._list_due <= now:
+            if self._take(now):
+                self.check_states(now)
+
+        schedules = self._due(now)
+        if not schedules:
+            return {}
+        results = self.fleet.map(
+            self._poll, [s.vehicle for s in schedules])
+
+        now = self.clock()
+        for schedule in schedules:
+            result = results[schedule.vehicle.id]
+            if isinstance(result.error, VehicleOfflineException):
+                self._schedule(schedule, MODE_ASLEEP, None)
+                continue
+            if result.error is not None:
+                mode = schedule.mode
+            else:
+                mode = vehicle_mode(result.result)
+            if mode != MODE_PARKED:
+                schedule.active_at = now
+            elif now - schedule.active_at >= self.idle_timeout:
+                self._schedule(schedule, MODE_IDLE, now + self.sleep_window)
+                continue
+            self._schedule(schedule, mode, now + self.intervals[mode])
+        return results
+
+    def next_due(self) -> float:
+        """
+        returns
+        seconds until the next poll or list check is due
+        """
+        now = self.clock()
+        due = [self._list_due if self._list_due is not None else now]
+        if self._queue:
+            due.append(self._queue[0][0])
+        wait = max(0.0, min(due) - now)
+        self._refill(now)
+        if wait == 0 and self._allowance < 1:
+            wait = (1 - self._allowance) / self.max_rate
+        return wait
+
+    def run(self, stop=None):
+        """
+        Poll until `stop` (a threading.Event) is set
+        """
+        if stop is None:
+            stop = threading.Event()
+        while not stop.is_set():
+            self.step()
+            stop.wait(self.next_due())
@@ -0,0 +1,195 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+VEHICLE_URL = re.compile(r'/api/1/vehicles/(\d+)')
+
+# backoff used for a 429 that does not carry a Retry-After header
+THROTTLE_BACKOFF = 1
+
+
+def vehicle_id_from_url(url):
+    match = VEHICLE_URL.search(url)
+    return match.group(1) if match else None
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header, either delay seconds or an http date
+
+    returns
+    seconds to wait, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket(object):
+    """
+    Thread safe token bucket
+
+    Callers reserve a token and are told how long to wait for it, which
+    lets the bucket go into debt: a throttled bucket is simply one whose
+    debt will take `retry_after` seconds to pay off.
+
+    input
+    rate: (float) tokens added per second
+    burst: (int) maximum tokens held, defaults to `rate`
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """
+        Take a token
+
+        returns
+        seconds the caller has to wait before using it
+        """
+        with self._lock:
+            self._refill(self.clock())
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def block(self, seconds):
+        """
+        Hold back all tokens for the next `seconds`
+        """
+        with self._lock:
+            self._refill(self.clock())
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class RateLimiter(object):
+    """
+    Client side rate limiting for a Tesla account
+
+    Every request takes a token from the account bucket, and requests for
+    a vehicle also take one from that vehicle's bucket. One RateLimiter
+    can be shared by any number of threads and TeslaAPI instances for
+    the same account.
+
+    A 429 response blocks the account bucket for its Retry-After (or an
+    exponential backoff when there is none) before the request is
+    retried, up to `max_retries` times. Waits are stretched by up to
+    `jitter` of their length so that throttled workers spread out.
+
+    input
+    rate: (float) account requests per second
+    burst: (int) account burst size, defaults to `rate`
+    vehicle_rate: (float) requests per second for each vehicle
+    vehicle_burst: (int) vehicle burst size, defaults to `vehicle_rate`
+    jitter: (float) fraction of each wait to randomly add
+    max_retries: (int) times to retry a request answered with 429
+    """
+
+    def __init__(self, rate=5, burst=10, vehicle_rate=1, vehicle_burst=3,
+                 jitter=0.1, max_retries=3, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.vehicle_rate = vehicle_rate
+        self.vehicle_burst = vehicle_burst
+        self.jitter = jitter
+        self.max_retries = max_retries
+        self.clock = clock
+        self.account = TokenBucket(rate, burst, clock)
+        self._vehicles = {}
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Number of requests currently waiting for a token
+        """
+        return self._waiting
+
+    def vehicle(self, vehicle_id) -> TokenBucket:
+        with self._lock:
+            bucket = self._vehicles.get(vehicle_id)
+            if bucket is None:
+                bucket = self._vehicles[vehicle_id] = TokenBucket(
+                    self.vehicle_rate, self.vehicle_burst, self.clock)
+            return bucket
+
+    def reserve(self, vehicle_id=None) -> float:
+        """
+        Take the tokens for a request
+
+        returns
+        seconds to wait before sending it, jitter included
+        """
+        wait = self.account.reserve()
+        if vehicle_id is not None:
+            wait = max(wait, self.vehicle(vehicle_id).reserve())
+        if wait and self.jitter:
+            wait += random.uniform(0, wait * self.jitter)
+        return wait
+
+    def _enter(self):
+        with self._lock:
+            self._waiting += 1
+
+    def _exit(self):
+        with self._lock:
+            self._waiting -= 1
+
+    def acquire(self, vehicle_id=None):
+        """
+        Block until a request may be sent
+        """
+        wait = self.reserve(vehicle_id)
+        if not wait:
+            return
+        self._enter()
+        try:
+            time.sleep(wait)
+        finally:
+            self._exit()
+
+    async def acquire_async(self, vehicle_id=None):
+        """
+        Wait, without blocking the event loop, until a request may be sent
+        """
+        wait = self.reserve(vehicle_id)
+        if not wait:
+            return
+        self._enter()
+        try:
+            await asyncio.sleep(wait)
+        finally:
+            self._exit()
+
+    def throttled(self, retry_after=None, attempt=0):
+        """
+        Record a 429 response
+
+        input
+        retry_after: (float) seconds from the Retry-After header, if any
+        attempt: (int) number of times the request has been throttled
+        """
+        if retry_after is None:
+            retry_after = THROTTLE_BACKOFF * (2 ** attempt)
+        self.account.block(retry_after)
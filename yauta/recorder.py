@@ -0,0 +1,307 @@
+import os
+import shutil
+import threading
+import time
+
+import numpy
+
+from yauta.exceptions import TeslaException
+from yauta.snapshot import VehicleSnapshot
+
+DTYPE = numpy.dtype('<f8')
+EXTENSION = '.f8'
+TIMESTAMP = 'timestamp'
+# file naming the generation directory that holds a vehicle's columns
+CURRENT = 'CURRENT'
+
+# column name to the (field group, field) of vehicle_data it is read from
+DEFAULT_COLUMNS = {
+    'battery_level': ('charge_state', 'battery_level'),
+    'charger_power': ('charge_state', 'charger_power'),
+    'odometer': ('vehicle_state', 'odometer'),
+    'speed': ('drive_state', 'speed'),
+    'latitude': ('drive_state', 'latitude'),
+    'longitude': ('drive_state', 'longitude'),
+    'heading': ('drive_state', 'heading'),
+    'inside_temp': ('climate_state', 'inside_temp'),
+    'outside_temp': ('climate_state', 'outside_temp')
+}
+
+
+def _value(value):
+    if value is None or isinstance(value, str):
+        return numpy.nan
+    return float(value)
+
+
+class TelemetryRecorder(object):
+    """
+    Append only, column oriented store of numeric vehicle telemetry
+
+    Every vehicle gets a directory holding one file per column, each an
+    array of little endian float64 values with a shared `timestamp`
+    column. Once compacted, the columns live in a generation directory
+    below it, named by its CURRENT file. Records are buffered in memory
+    and appended in batches, queries memory map the column files and
+    return numpy arrays without decoding any json. Missing values are
+    stored as NaN.
+
+        recorder = TelemetryRecorder('/var/lib/yauta')
+        recorder.record_vehicle(vehicle)
+        data = recorder.query(vehicle.id, start=time.time() - 3600)
+        data['battery_level'].mean()
+
+    input
+    path: directory to store column files in
+    columns: dict of column name to (field group, field), defaults to
+    DEFAULT_COLUMNS
+    buffer_size: (int) records per vehicle to buffer before appending
+    retention: (float) seconds of history to keep, None keeps everything
+    compact_interval: (float) seconds between automatic compactions when
+    retention is set
+    """
+
+    def __init__(self, path, columns=None, buffer_size=64, retention=None,
+                 compact_interval=3600):
+        self.path = path
+        self.columns = dict(columns or DEFAULT_COLUMNS)
+        if TIMESTAMP in self.columns:
+            raise TeslaException('%s is a reserved column name' % TIMESTAMP)
+        self.buffer_size = buffer_size
+        self.retention = retention
+        self.compact_interval = compact_interval
+        self._buffers = {}
+        self._last_timestamp = {}
+        self._last_compaction = time.time()
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def _names(self):
+        return [TIMESTAMP] + sorted(self.columns)
+
+    def _directory(self, key):
+        root = os.path.join(self.path, key)
+        try:
+            with open(os.path.join(root, CURRENT)) as f:
+                return os.path.join(root, f.read().strip())
+        except FileNotFoundError:
+            return root
+
+    def _file(self, directory, column):
+        return os.path.join(directory, column + EXTENSION)
+
+    def record(self, vehicle_id, data, timestamp=None):
+        """
+        Buffer a vehicle_data response for appending
+
+        input
+        vehicle_id: id of the vehicle the data belongs to
+        data: vehicle_data dict or VehicleSnapshot
+        timestamp: (float) epoch seconds, defaults to now, must not be
+        older than the last timestamp recorded for the vehicle
+        """
+        if isinstance(data, VehicleSnapshot):
+            data = data.to_dict()
+        if timestamp is None:
+            timestamp = time.time()
+
+        row = [float(timestamp)]
+        for column in sorted(self.columns):
+            group, field = self.columns[column]
+            row.append(_value((data.get(group) or {}).get(field)))
+
+        key = str(vehicle_id)
+        with self._lock:
+            if timestamp < self._last_timestamp.get(key, float('-inf')):
+                raise TeslaException(
+                    'Timestamp %s is older than the last record for %s'
+                    % (timestamp, vehicle_id))
+            self._last_timestamp[key] = timestamp
+            buffer = self._buffers.setdefault(key, [])
+            buffer.append(row)
+            if len(buffer) >= self.buffer_size:
+                self._flush_vehicle(key)
+
+    def record_vehicle(self, vehicle, fields=None):
+        """
+        Fetch vehicle data from a TeslaVehicle and record it
+
+        returns
+        the vehicle data that was recorded
+        """
+        data = vehicle.get_vehicle_data(fields)
+        self.record(vehicle.id, data)
+        return data
+
+    def _flush_vehicle(self, key):
+        rows = self._buffers.pop(key, None)
+        if not rows:
+            return
+        directory = self._directory(key)
+        os.makedirs(directory, exist_ok=True)
+        # cut off what an earlier append that died part way left in only
+        # some of the columns, so the new rows line up in all of them
+        self._truncate(directory, self._length(directory))
+        block = numpy.array(rows, dtype=DTYPE)
+        for i, column in enumerate(self._names()):
+            with open(self._file(directory, column), 'ab') as f:
+                f.write(block[:, i].tobytes())
+
+    def flush(self):
+        """
+        Append all buffered records to their column files
+        """
+        with self._lock:
+            for key in list(self._buffers):
+                self._flush_vehicle(key)
+            if (self.retention is not None and
+                    time.time() - self._last_compaction >=
+                    self.compact_interval):
+                self.compact()
+
+    def vehicles(self) -> list:
+        """
+        Returns the ids of every vehicle with recorded data
+        """
+        self.flush()
+        return self._vehicle_keys()
+
+    def _vehicle_keys(self):
+        return sorted(
+            name for name in os.listdir(self.path)
+            if os.path.isdir(os.path.join(self.path, name)))
+
+    def _map(self, directory, column, length=None):
+        path = self._file(directory, column)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return numpy.empty(0, dtype=DTYPE)
+        return numpy.memmap(path, dtype=DTYPE, mode='r', shape=length)
+
+    def _truncate(self, directory, length):
+        size = length * DTYPE.itemsize
+        for column in self._names():
+            path = self._file(directory, column)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    def _length(self, directory):
+        # a crash part way through an append can leave columns with
+        # different lengths, only rows present in every column count,
+        # the rest is cut off before the next append
+        lengths = []
+        for column in self._names():
+            path = self._file(directory, column)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            lengths.append(size // DTYPE.itemsize)
+        return min(lengths)
+
+    def query(self, vehicle_id, start=None, end=None, columns=None) -> dict:
+        """
+        Read a vehicle's telemetry for a time range
+
+        input
+        vehicle_id: id of the vehicle
+        start: (float) epoch seconds, inclusive, defaults to the first record
+        end: (float) epoch seconds, exclusive, defaults to the last record
+        columns: list of column names, defaults to all of them
+
+        returns
+        dict of column name to numpy array, always including `timestamp`.
+        Arrays are read only views onto the memory mapped files.
+        """
+        key = str(vehicle_id)
+        with self._lock:
+            self._flush_vehicle(key)
+        columns = [TIMESTAMP] + [
+            c for c in (columns or sorted(self.columns)) if c != TIMESTAMP]
+        for column in columns:
+            if column != TIMESTAMP and column not in self.columns:
+                raise TeslaException('Unknown column: %s' % column)
+
+        # mapped under the lock so compaction can't swap the columns out
+        # part way, the maps stay valid after it does
+        with self._lock:
+            directory = self._directory(key)
+            length = self._length(directory)
+            if not length:
+                return {c: numpy.empty(0, dtype=DTYPE) for c in columns}
+
+            timestamps = self._map(directory, TIMESTAMP, length)
+            lo = 0 if start is None else numpy.searchsorted(
+                timestamps, start, side='left')
+            hi = length if end is None else numpy.searchsorted(
+                timestamps, end, side='left')
+            return {
+                c: self._map(directory, c, length)[lo:hi] for c in columns}
+
+    def compact(self, now=None):
+        """
+        Drop records older than the retention period
+
+        The kept records of a vehicle are written to a new generation
+        directory, which replaces the old one with a single atomic rename
+        of its CURRENT file, so queries and a crash part way through see
+        either all of the old columns or all of the new ones.
+        """
+        if self.retention is None:
+            return
+        if now is None:
+            now = time.time()
+        cutoff = now - self.retention
+        with self._lock:
+            for key in list(self._buffers):
+                self._flush_vehicle(key)
+            for key in self._vehicle_keys():
+                directory = self._directory(key)
+                length = self._length(directory)
+                timestamps = self._map(directory, TIMESTAMP, length)
+                lo = int(numpy.searchsorted(timestamps, cutoff, side='left'))
+                del timestamps
+                if not lo and length == self._max_length(directory):
+                    continue
+                self._swap(key, directory, lo, length)
+            self._last_compaction = now
+
+    def _swap(self, key, directory, lo, length):
+        root = os.path.join(self.path, key)
+        current = os.path.basename(directory) if directory != root else 'g0'
+        generation = 'g%d' % (int(current[1:]) + 1)
+        target = os.path.join(root, generation)
+        shutil.rmtree(target, ignore_errors=True)
+        os.makedirs(target)
+        for column in self._names():
+            data = numpy.array(self._map(directory, column, length)[lo:])
+            with open(self._file(target, column), 'wb') as f:
+                f.write(data.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        pointer = os.path.join(root, CURRENT)
+        with open(pointer + '.tmp', 'w') as f:
+            f.write(generation)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer + '.tmp', pointer)
+
+        # older generations, and the columns from before the first
+        # compaction, are no longer read
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if name in (CURRENT, generation):
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif name.endswith(EXTENSION):
+                os.remove(path)
+
+    def _max_length(self, directory):
+        return max(
+            os.path.getsize(self._file(directory, c)) // DTYPE.itemsize
+            if os.path.exists(self._file(directory, c)) else 0
+            for c in self._names())
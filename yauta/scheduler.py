@@ -0,0 +1,499 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+from yauta.exceptions import TeslaException
+from yauta.vehicle import (
+    STATE_ONLINE,
+    WAKE_TIMEOUT,
+    TeslaVehicle,
+    validate_command
+)
+
+# slots per level of the timer wheel, with a one second tick the levels
+# span about 4 minutes, 4.5 hours, 12 days and 2 years
+WHEEL_SLOTS = (256, 64, 64, 64)
+
+# seconds before an action is due that its vehicle is woken
+WAKE_AHEAD = 120
+
+# seconds late an action may still be sent, for instance after a restart
+GRACE = 600
+
+
+class Timer(object):
+    """
+    Entry in a TimerWheel, `due` is in ticks
+    """
+
+    __slots__ = ('due', 'value', '_slot')
+
+    def __init__(self, due, value):
+        self.due = due
+        self.value = value
+        self._slot = None
+
+    @property
+    def active(self) -> bool:
+        return self._slot is not None
+
+
+class TimerWheel(object):
+    """
+    Hierarchical timer wheel
+
+    Timers are kept in the slot of the level whose span covers how far
+    away they are, so adding and cancelling a timer is O(1) whatever the
+    number of timers. Each time the level below goes round, one slot of
+    a level is cascaded down, until timers reach the first level and
+    expire. Timers further away than the wheel spans wait in an overflow
+    set until they come within range.
+
+    Time is counted in whole ticks, see advance.
+    """
+
+    def __init__(self, slots=WHEEL_SLOTS, now=0):
+        self.slots = tuple(slots)
+        # ticks covered by each level, and by the levels below it
+        self.spans = []
+        span = 1
+        for count in self.slots:
+            self.spans.append(span)
+            span *= count
+        self.range = span
+        self.now = now
+        self._levels = [[set() for _ in range(n)] for n in self.slots]
+        self._overflow = set()
+        self._expired = set()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _place(self, timer):
+        delta = timer.due - self.now
+        if delta <= 0:
+            slot = self._expired
+        elif delta >= self.range:
+            slot = self._overflow
+        else:
+            level = 0
+            while delta >= self.spans[level] * self.slots[level]:
+                level += 1
+            index = (timer.due // self.spans[level]) % self.slots[level]
+            slot = self._levels[level][index]
+        slot.add(timer)
+        timer._slot = slot
+
+    def add(self, due: int, value) -> Timer:
+        """
+        Add a timer expiring at tick `due`, timers already due expire on
+        the next advance
+        """
+        timer = Timer(due, value)
+        self._place(timer)
+        self._count += 1
+        return timer
+
+    def cancel(self, timer: Timer) -> bool:
+        """
+        returns
+        True if the timer was pending and is now cancelled
+        """
+        if timer._slot is None:
+            return False
+        timer._slot.discard(timer)
+        timer._slot = None
+        self._count -= 1
+        return True
+
+    def _cascade(self, slot):
+        timers = list(slot)
+        slot.clear()
+        for timer in timers:
+            self._place(timer)
+
+    def advance(self, now: int) -> list:
+        """
+        Move the wheel on to tick `now`
+
+        returns
+        list of timers that expired, in no particular order
+        """
+        expired = list(self._expired)
+        self._expired.clear()
+        while self.now < now:
+            if not self._count - len(expired):
+                # nothing left to expire on the way, jump straight there
+                self.now = now
+                break
+            self.now += 1
+            for level in range(1, len(self.slots)):
+                if self.now % self.spans[level]:
+                    break
+                self._cascade(self._levels[level][
+                    (self.now // self.spans[level]) % self.slots[level]])
+            else:
+                if self._overflow:
+                    self._cascade(self._overflow)
+            slot = self._levels[0][self.now % self.slots[0]]
+            if slot:
+                expired.extend(slot)
+                slot.clear()
+            if self._expired:
+                expired.extend(self._expired)
+                self._expired.clear()
+        for timer in expired:
+            timer._slot = None
+        self._count -= len(expired)
+        return expired
+
+
+class ScheduledAction(object):
+    """
+    A vehicle command to send at a given time
+
+    input
+    id: (str) unique id of the action
+    vehicle_id: id of the vehicle, as in TeslaVehicle.id
+    command: (str) name of the TeslaVehicle command
+    params: dict of keyword arguments to the command
+    at: (float) epoch seconds the command is due
+    every: (float) seconds between runs of a recurring action, None for
+    a one off
+    """
+
+    __slots__ = ('id', 'vehicle_id', 'command', 'params', 'at', 'every',
+                 '_timers')
+
+    def __init__(self, id, vehicle_id, command, params, at, every=None):
+        self.id = id
+        self.vehicle_id = vehicle_id
+        self.command = command
+        self.params = params
+        self.at = at
+        self.every = every
+        self._timers = ()
+
+    def __repr__(self):
+        return 'ScheduledAction(%r, %s, %r, at=%s)' % (
+            self.id, self.vehicle_id, self.command, self.at)
+
+
+class SqliteScheduleStore(object):
+    """
+    Keeps scheduled actions in a sqlite database so they survive restarts
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS actions '
+                '(id TEXT PRIMARY KEY, vehicle_id INTEGER NOT NULL, '
+                'command TEXT NOT NULL, params TEXT NOT NULL, '
+                'at REAL NOT NULL, every REAL)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def load(self) -> list:
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT id, vehicle_id, command, params, at, every '
+                'FROM actions').fetchall()
+        return [
+            ScheduledAction(i, v, c, json.loads(p), at, every)
+            for i, v, c, p, at, every in rows
+        ]
+
+    def save(self, action):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO actions '
+                '(id, vehicle_id, command, params, at, every) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (action.id, action.vehicle_id, action.command,
+                 json.dumps(action.params), action.at, action.every))
+
+    def delete(self, action_id):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM actions WHERE id = ?', (action_id,))
+
+
+def _timestamp(at) -> float:
+    if isinstance(at, datetime):
+        return at.timestamp()
+    return float(at)
+
+
+class CommandScheduler(object):
+    """
+    Send vehicle commands at given times, for a whole fleet from one
+    process
+
+        scheduler = CommandScheduler(t, store=SqliteScheduleStore(path))
+        scheduler.schedule(
+            vehicle.id, 'charge_start', at=offpeak, every=86400)
+        scheduler.schedule(
+            vehicle.id, 'set_temps', at=departure,
+            driver_temp=21, passenger_temp=21)
+        scheduler.run()
+
+    Actions are kept in a TimerWheel with a `tick` of resolution, so
+    tens of thousands of them cost little to schedule and cancel. With a
+    `store` they are saved as they are scheduled and picked up again by
+    the next scheduler, actions missed while it was down are still sent
+    if they are less than `grace` seconds late.
+
+    Vehicles that are not known to be online are sent a wake_up
+    `wake_ahead` seconds before their action is due, so they are awake
+    by the time it is sent. Requests, wake ups included, are sent at no
+    more than `max_rate` per second, so a burst of actions due at the
+    same moment (everything set to start charging at midnight) is
+    spread out in order rather than sent all at once.
+
+    input
+    api: TeslaAPI
+    store: optional SqliteScheduleStore
+    on_result: optional callable taking a ScheduledAction, the command
+    response and the exception raised (one of them None)
+    clock: returns the current time in epoch seconds
+    """
+
+    def __init__(self, api, store=None, tick=1.0, wake_ahead=WAKE_AHEAD,
+                 wake_timeout=WAKE_TIMEOUT, grace=GRACE, max_rate=10.0,
+                 burst=10, max_workers=10, on_result=None,
+                 clock=time.time):
+        self.api = api
+        self.store = store
+        self.tick = tick
+        self.wake_ahead = wake_ahead
+        self.wake_timeout = wake_timeout
+        self.grace = grace
+        self.max_rate = float(max_rate)
+        self.burst = float(burst)
+        self.on_result = on_result
+        self.clock = clock
+        self.wheel = TimerWheel(now=self._ticks(clock()))
+        self._actions = {}
+        self._vehicles = {}
+        self._ready = deque()
+        self._allowance = self.burst
+        self._allowance_at = clock()
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='yauta-scheduler')
+        if store is not None:
+            for action in store.load():
+                self._add(action)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._actions)
+
+    def _ticks(self, at):
+        return int(math.ceil(at / self.tick))
+
+    def _vehicle(self, vehicle_id):
+        vehicle = self._vehicles.get(vehicle_id)
+        if vehicle is None:
+            vehicle = self._vehicles[vehicle_id] = TeslaVehicle(
+                vehicle_id, self.api)
+        return vehicle
+
+    def schedule(self, vehicle_id, command: str, at, every: float = None,
+                 id: str = None, **params) -> ScheduledAction:
+        """
+        Schedule a vehicle command
+
+        input
+        vehicle_id: id of the vehicle
+        command: (str) name of a TeslaVehicle command, checked along with
+        its arguments straight away, see validate_command
+        at: epoch seconds or a datetime the command is due at
+        every: (float) repeat the command every so many seconds
+        id: (str) id of the action, replacing any action with that id
+        params: arguments to the command
+
+        returns
+        the ScheduledAction
+        """
+        validate_command(command, params)
+        if every is not None and every <= 0:
+            raise TeslaException('every must be positive: %s' % every)
+        action = ScheduledAction(
+            id or uuid.uuid4().hex, vehicle_id, command, params,
+            _timestamp(at), every)
+        with self._lock:
+            self._remove(action.id)
+            self._add(action)
+        if self.store is not None:
+            self.store.save(action)
+        return action
+
+    def cancel(self, action_id: str) -> bool:
+        """
+        returns
+        True if the action was scheduled and is now cancelled
+        """
+        with self._lock:
+            removed = self._remove(action_id)
+        if removed and self.store is not None:
+            self.store.delete(action_id)
+        return removed
+
+    def actions(self, vehicle_id=None) -> list:
+        """
+        returns
+        list of scheduled actions, for one vehicle if `vehicle_id` is
+        given, ordered by when they are due
+        """
+        with self._lock:
+            actions = [
+                a for a in self._actions.values()
+                if vehicle_id is None or a.vehicle_id == vehicle_id
+            ]
+        return sorted(actions, key=lambda a: a.at)
+
+    def _add(self, action):
+        self._actions[action.id] = action
+        timers = [self.wheel.add(self._ticks(action.at), ('send', action))]
+        if self.wake_ahead:
+            timers.append(self.wheel.add(
+                self._ticks(action.at - self.wake_ahead), ('wake', action)))
+        action._timers = timers
+
+    def _remove(self, action_id):
+        action = self._actions.pop(action_id, None)
+        if action is None:
+            return False
+        for timer in action._timers:
+            self.wheel.cancel(timer)
+        action._timers = ()
+        return True
+
+    def _refill(self, now):
+        self._allowance = min(
+            self.burst,
+            self._allowance + (now - self._allowance_at) * self.max_rate)
+        self._allowance_at = now
+
+    def step(self) -> int:
+        """
+        Advance to the current time and send what is due, as far as the
+        rate allows
+
+        returns
+        number of wake ups and commands sent
+        """
+        now = self.clock()
+        with self._lock:
+            for timer in self.wheel.advance(self._ticks(now)):
+                kind, action = timer.value
+                if kind == 'wake' and (
+                        now >= action.at or
+                        self.api.vehicle_states.get(action.vehicle_id) ==
+                        STATE_ONLINE):
+                    # awake already, or woken on the way anyway
+                    continue
+                self._ready.append((kind, action))
+            sent = 0
+            self._refill(now)
+            while self._ready and self._allowance >= 1:
+                kind, action = self._ready.popleft()
+                if self._actions.get(action.id) is not action:
+                    # cancelled or rescheduled since
+                    continue
+                if kind == 'send':
+                    self._next_run(action, now)
+                self._allowance -= 1
+                sent += 1
+                self._executor.submit(self._dispatch, kind, action, now)
+        return sent
+
+    def _next_run(self, action, now):
+        """
+        Take a due action off the schedule, or move a recurring one on to
+        its next run
+        """
+        if action.every is None:
+            self._remove(action.id)
+            if self.store is not None:
+                self.store.delete(action.id)
+            return
+        runs = max(1, int(math.ceil((now - action.at) / action.every)))
+        upcoming = ScheduledAction(
+            action.id, action.vehicle_id, action.command, action.params,
+            action.at + runs * action.every, action.every)
+        self._remove(action.id)
+        self._add(upcoming)
+        if self.store is not None:
+            self.store.save(upcoming)
+
+    def _dispatch(self, kind, action, now):
+        vehicle = self._vehicle(action.vehicle_id)
+        if kind == 'wake':
+            try:
+                vehicle.wake_up()
+            except Exception:
+                # the command wakes it up again when it is due
+                pass
+            return
+
+        result, error = None, None
+        try:
+            if now - action.at > self.grace:
+                raise TeslaException(
+                    'Missed %s for vehicle %s, due %ss ago'
+                    % (action.command, vehicle.id, int(now - action.at)))
+            if self.api.vehicle_states.get(vehicle.id) != STATE_ONLINE:
+                vehicle.wake_up(wait=True, timeout=self.wake_timeout)
+            result = getattr(vehicle, action.command)(**action.params)
+        except Exception as e:
+            error = e
+        if self.on_result is not None:
+            self.on_result(action, result, error)
+
+    def next_due(self) -> float:
+        """
+        returns
+        seconds until step has something to do
+        """
+        with self._lock:
+            if self._ready:
+                self._refill(self.clock())
+                return max(0.0, (1 - self._allowance) / self.max_rate)
+        return self.tick
+
+    def run(self, stop=None):
+        """
+        Send actions until `stop` (a threading.Event) is set
+        """
+        if stop is None:
+            stop = threading.Event()
+        while not stop.is_set():
+            self.step()
+            stop.wait(self.next_due())
+
+    def close(self, wait=True):
+        self._executor.shutdown(wait=wait)
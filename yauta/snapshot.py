@@ -0,0 +1,351 @@
+class _Record(object):
+    """
+    Base for compact, typed field group records
+
+    Known fields are stored in slots, anything else the api returns is
+    kept in `_extra`. Known fields the api left out keep an empty slot,
+    they read as None and are left out of to_dict(), so that it round
+    trips the original data.
+    """
+
+    __slots__ = ('_extra',)
+    FIELDS = ()
+
+    def __init__(self, **kwargs):
+        for field in self.FIELDS:
+            if field in kwargs:
+                setattr(self, field, kwargs.pop(field))
+        self._extra = kwargs or None
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def to_dict(self) -> dict:
+        data = {}
+        for field in self.FIELDS:
+            try:
+                data[field] = object.__getattribute__(self, field)
+            except AttributeError:
+                pass
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+    def __getattr__(self, name):
+        # known fields the api left out, then fields the api returns that
+        # are not declared in FIELDS
+        if name in type(self).FIELDS:
+            return None
+        extra = object.__getattribute__(self, '_extra')
+        if extra and name in extra:
+            return extra[name]
+        raise AttributeError(
+            '%s has no attribute %s' % (type(self).__name__, name))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join(
+            '%s=%r' % (f, getattr(self, f)) for f in self.FIELDS))
+
+
+def _record(name, fields):
+    return type(name, (_Record,), {
+        '__slots__': fields,
+        'FIELDS': fields,
+        '__doc__': '\n%s record, fields: %s\n' % (name, ', '.join(fields))
+    })
+
+
+# the fields of each group returned by the api, as many of them as are
+# known, so that real responses leave next to nothing in `_extra`
+ChargeState = _record('ChargeState', (
+    'battery_heater_on',
+    'battery_level',
+    'battery_range',
+    'charge_amps',
+    'charge_current_request',
+    'charge_current_request_max',
+    'charge_enable_request',
+    'charge_energy_added',
+    'charge_limit_soc',
+    'charge_limit_soc_max',
+    'charge_limit_soc_min',
+    'charge_limit_soc_std',
+    'charge_miles_added_ideal',
+    'charge_miles_added_rated',
+    'charge_port_cold_weather_mode',
+    'charge_port_color',
+    'charge_port_door_open',
+    'charge_port_latch',
+    'charge_rate',
+    'charge_to_max_range',
+    'charger_actual_current',
+    'charger_phases',
+    'charger_pilot_current',
+    'charger_power',
+    'charger_voltage',
+    'charging_state',
+    'conn_charge_cable',
+    'est_battery_range',
+    'fast_charger_brand',
+    'fast_charger_present',
+    'fast_charger_type',
+    'ideal_battery_range',
+    'managed_charging_active',
+    'managed_charging_start_time',
+    'managed_charging_user_canceled',
+    'max_range_charge_counter',
+    'minutes_to_full_charge',
+    'not_enough_power_to_heat',
+    'off_peak_charging_enabled',
+    'off_peak_charging_times',
+    'off_peak_hours_end_time',
+    'preconditioning_enabled',
+    'preconditioning_times',
+    'scheduled_charging_mode',
+    'scheduled_charging_pending',
+    'scheduled_charging_start_time',
+    'scheduled_departure_time',
+    'scheduled_departure_time_minutes',
+    'supercharger_session_trip_planner',
+    'time_to_full_charge',
+    'timestamp',
+    'trip_charging',
+    'usable_battery_level',
+    'user_charge_enable_request'
+))
+
+ClimateState = _record('ClimateState', (
+    'allow_cabin_overheat_protection',
+    'auto_seat_climate_left',
+    'auto_seat_climate_right',
+    'battery_heater',
+    'battery_heater_no_power',
+    'bioweapon_mode',
+    'cabin_overheat_protection',
+    'cabin_overheat_protection_actively_cooling',
+    'climate_keeper_mode',
+    'cop_activation_temperature',
+    'defrost_mode',
+    'driver_temp_setting',
+    'fan_status',
+    'hvac_auto_request',
+    'inside_temp',
+    'is_auto_conditioning_on',
+    'is_climate_on',
+    'is_front_defroster_on',
+    'is_preconditioning',
+    'is_rear_defroster_on',
+    'left_temp_direction',
+    'max_avail_temp',
+    'min_avail_temp',
+    'outside_temp',
+    'passenger_temp_setting',
+    'remote_heater_control_enabled',
+    'right_temp_direction',
+    'seat_heater_left',
+    'seat_heater_rear_center',
+    'seat_heater_rear_left',
+    'seat_heater_rear_right',
+    'seat_heater_right',
+    'side_mirror_heaters',
+    'smart_preconditioning',
+    'steering_wheel_heater',
+    'supports_fan_only_cabin_overheat_protection',
+    'timestamp',
+    'wiper_blade_heater'
+))
+
+DriveState = _record('DriveState', (
+    'active_route_destination',
+    'active_route_energy_at_arrival',
+    'active_route_latitude',
+    'active_route_longitude',
+    'active_route_miles_to_arrival',
+    'active_route_minutes_to_arrival',
+    'active_route_traffic_minutes_delay',
+    'gps_as_of',
+    'heading',
+    'latitude',
+    'longitude',
+    'native_latitude',
+    'native_location_supported',
+    'native_longitude',
+    'native_type',
+    'power',
+    'shift_state',
+    'speed',
+    'timestamp'
+))
+
+VehicleState = _record('VehicleState', (
+    'api_version',
+    'autopark_state_v2',
+    'autopark_state_v3',
+    'autopark_style',
+    'calendar_supported',
+    'car_version',
+    'center_display_state',
+    'dashcam_clip_save_available',
+    'dashcam_state',
+    'df',
+    'dr',
+    'fd_window',
+    'feature_bitmask',
+    'fp_window',
+    'ft',
+    'homelink_device_count',
+    'homelink_nearby',
+    'is_user_present',
+    'last_autopark_error',
+    'locked',
+    'media_info',
+    'media_state',
+    'notifications_supported',
+    'odometer',
+    'parsed_calendar_supported',
+    'pf',
+    'pr',
+    'rd_window',
+    'remote_start',
+    'remote_start_enabled',
+    'remote_start_supported',
+    'rp_window',
+    'rt',
+    'santa_mode',
+    'sentry_mode',
+    'sentry_mode_available',
+    'service_mode',
+    'service_mode_plus',
+    'smart_summon_available',
+    'software_update',
+    'speed_limit_mode',
+    'summon_standby_mode_enabled',
+    'sun_roof_percent_open',
+    'sun_roof_state',
+    'timestamp',
+    'tpms_hard_warning_fl',
+    'tpms_hard_warning_fr',
+    'tpms_hard_warning_rl',
+    'tpms_hard_warning_rr',
+    'tpms_last_seen_pressure_time_fl',
+    'tpms_last_seen_pressure_time_fr',
+    'tpms_last_seen_pressure_time_rl',
+    'tpms_last_seen_pressure_time_rr',
+    'tpms_pressure_fl',
+    'tpms_pressure_fr',
+    'tpms_pressure_rl',
+    'tpms_pressure_rr',
+    'tpms_rcp_front_value',
+    'tpms_rcp_rear_value',
+    'tpms_soft_warning_fl',
+    'tpms_soft_warning_fr',
+    'tpms_soft_warning_rl',
+    'tpms_soft_warning_rr',
+    'valet_mode',
+    'valet_pin_needed',
+    'vehicle_name',
+    'vehicle_self_test_progress',
+    'vehicle_self_test_requested',
+    'webcam_available'
+))
+
+
+def _group(name, record):
+    slot = '_' + name
+
+    def get(self):
+        value = getattr(self, slot)
+        if isinstance(value, dict):
+            value = record.from_dict(value)
+            setattr(self, slot, value)
+        return value
+
+    return property(get, doc='%s, decoded on first access' % name)
+
+
+class VehicleSnapshot(object):
+    """
+    Compact representation of a vehicle_data response
+
+    Field groups are kept as the raw dicts from the api until they are
+    first accessed, at which point they are decoded into a slotted
+    record and the dict is released. Snapshots that are held on to for a
+    long time should be created with `lazy=False`, or have decode()
+    called on them, so that only the compact records are retained.
+
+        snapshot = vehicle.get_vehicle_snapshot()
+        snapshot.charge_state.battery_level
+        snapshot.to_dict() == vehicle.get_vehicle_data()
+    """
+
+    GROUPS = (
+        ('charge_state', ChargeState),
+        ('climate_state', ClimateState),
+        ('drive_state', DriveState),
+        ('vehicle_state', VehicleState)
+    )
+    FIELDS = ('id', 'vehicle_id', 'vin', 'display_name', 'state')
+
+    __slots__ = FIELDS + tuple('_' + name for name, _ in GROUPS) + (
+        '_extra', '_missing')
+
+    charge_state = _group('charge_state', ChargeState)
+    climate_state = _group('climate_state', ClimateState)
+    drive_state = _group('drive_state', DriveState)
+    vehicle_state = _group('vehicle_state', VehicleState)
+
+    def __init__(self, data: dict, lazy: bool = True):
+        data = dict(data)
+        self._missing = tuple(f for f in self.FIELDS if f not in data) or None
+        for field in self.FIELDS:
+            setattr(self, field, data.pop(field, None))
+        for name, _ in self.GROUPS:
+            setattr(self, '_' + name, data.pop(name, None))
+        self._extra = data or None
+        if not lazy:
+            self.decode()
+
+    @classmethod
+    def from_dict(cls, data: dict, lazy: bool = True):
+        return cls(data, lazy=lazy)
+
+    def decode(self):
+        """
+        Decode every field group into its record
+        """
+        for name, _ in self.GROUPS:
+            getattr(self, name)
+        return self
+
+    def __getattr__(self, name):
+        # response keys without a record of their own, e.g. gui_settings
+        extra = object.__getattribute__(self, '_extra')
+        if extra and name in extra:
+            return extra[name]
+        raise AttributeError('VehicleSnapshot has no attribute %s' % name)
+
+    def to_dict(self) -> dict:
+        """
+        Returns the snapshot in the shape of the original api response
+        """
+        missing = self._missing or ()
+        data = {
+            field: getattr(self, field) for field in self.FIELDS
+            if field not in missing
+        }
+        for name, _ in self.GROUPS:
+            value = getattr(self, '_' + name)
+            if isinstance(value, _Record):
+                value = value.to_dict()
+            if value is not None:
+                data[name] = value
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+    def __repr__(self):
+        return 'VehicleSnapshot(id=%r, state=%r)' % (self.id, self.state)
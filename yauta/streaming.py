@@ -0,0 +1,238 @@
+import asyncio
+import inspect
+import json
+import queue
+import threading
+
+import aiohttp
+
+from yauta.exceptions import TeslaException
+
+STREAMING_URL = 'wss://streaming.vn.teslamotors.com/streaming/'
+
+DEFAULT_COLUMNS = (
+    'speed',
+    'odometer',
+    'soc',
+    'elevation',
+    'est_heading',
+    'est_lat',
+    'est_lng',
+    'power',
+    'shift_state',
+    'range',
+    'est_range',
+    'heading'
+)
+
+MSG_SUBSCRIBE = 'data:subscribe_oauth'
+MSG_UPDATE = 'data:update'
+MSG_ERROR = 'data:error'
+ERROR_CLIENT = 'client_error'
+
+
+def _parse_value(value):
+    if value == '':
+        return None
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+class StreamingClient(object):
+    """
+    Client for the Owner API streaming websocket
+
+    stream() is an async generator of records, dicts holding the
+    `timestamp` (epoch milliseconds) of the update and a value for each
+    requested column. The connection is re-established with exponential
+    backoff whenever it drops or the vehicle disconnects, and the token
+    is refreshed and the subscription resumed if the server rejects it.
+
+    input
+    vehicle_id: the `vehicle_id` of the vehicle, not its `id`
+    get_token: callable returning the current access token
+    refresh_token: callable, or coroutine function, called with the
+    rejected token, that re-authenticates so that get_token returns a
+    valid token
+    columns: list of columns to stream, defaults to DEFAULT_COLUMNS
+    url: streaming endpoint
+    reconnect_delay: (float) seconds to wait before the first reconnect
+    max_reconnect_delay: (float) upper bound on the reconnect backoff
+    max_reconnects: (int) consecutive reconnects without receiving data
+    before giving up, None to retry forever
+    max_refreshes: (int) consecutive token refreshes without receiving
+    data before giving up
+    """
+
+    def __init__(self, vehicle_id, get_token, refresh_token=None,
+                 columns=None, url=STREAMING_URL, reconnect_delay=1,
+                 max_reconnect_delay=30, max_reconnects=None,
+                 max_refreshes=3):
+        self.vehicle_id = vehicle_id
+        self.get_token = get_token
+        self.refresh_token = refresh_token
+        self.columns = list(columns or DEFAULT_COLUMNS)
+        self.url = url
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.max_reconnects = max_reconnects
+        self.max_refreshes = max_refreshes
+
+    def _subscribe_message(self, token):
+        return {
+            'msg_type': MSG_SUBSCRIBE,
+            'token': token,
+            'value': ','.join(self.columns),
+            'tag': str(self.vehicle_id)
+        }
+
+    def parse(self, value: str) -> dict:
+        """
+        Parse the comma separated value of a data:update message
+        """
+        values = value.split(',')
+        record = {'timestamp': _parse_value(values[0])}
+        for column, v in zip(self.columns, values[1:]):
+            record[column] = _parse_value(v)
+        return record
+
+    async def _refresh(self, token):
+        if self.refresh_token is None:
+            raise TeslaException(
+                'Streaming token rejected and no way to refresh it')
+        if inspect.iscoroutinefunction(self.refresh_token):
+            await self.refresh_token(token)
+        else:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.refresh_token, token)
+
+    async def stream(self):
+        """
+        Async generator yielding records until closed
+        """
+        delay = self.reconnect_delay
+        reconnects = 0
+        refreshes = 0
+        async with aiohttp.ClientSession() as session:
+            while True:
+                refresh = False
+                token = self.get_token()
+                try:
+                    async with session.ws_connect(self.url) as ws:
+                        await ws.send_json(self._subscribe_message(token))
+                        async for msg in ws:
+                            if msg.type not in (aiohttp.WSMsgType.TEXT,
+                                                aiohttp.WSMsgType.BINARY):
+                                break
+                            message = json.loads(msg.data)
+                            msg_type = message.get('msg_type')
+                            if msg_type == MSG_UPDATE:
+                                delay = self.reconnect_delay
+                                reconnects = 0
+                                refreshes = 0
+                                yield self.parse(message['value'])
+                            elif msg_type == MSG_ERROR:
+                                refresh = (
+                                    message.get('error_type') ==
+                                    ERROR_CLIENT)
+                                break
+                except aiohttp.ClientError:
+                    pass
+
+                reconnects += 1
+                if (self.max_reconnects is not None and
+                        reconnects > self.max_reconnects):
+                    raise TeslaException(
+                        'Unable to stream vehicle %s after %s reconnects'
+                        % (self.vehicle_id, self.max_reconnects))
+                if refresh:
+                    refreshes += 1
+                    if refreshes > self.max_refreshes:
+                        raise TeslaException(
+                            'Streaming token for vehicle %s rejected after '
+                            '%s refreshes' % (self.vehicle_id,
+                                              self.max_refreshes))
+                    await self._refresh(token)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+
+class StreamHandle(threading.Thread):
+    """
+    Runs a StreamingClient on a background thread, calling `callback`
+    with every record
+
+    `on_error` is called with the exception if the stream fails. Call
+    stop() to close the stream and wait for the thread to exit.
+    """
+
+    def __init__(self, client, callback, on_error=None):
+        super(StreamHandle, self).__init__(daemon=True)
+        self.client = client
+        self.callback = callback
+        self.on_error = on_error
+        self._loop = None
+        self._task = None
+        self._started = threading.Event()
+
+    def run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._task = self._loop.create_task(self._consume())
+            self._started.set()
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            if self.on_error is not None:
+                self.on_error(e)
+        finally:
+            self._loop.close()
+
+    async def _consume(self):
+        stream = self.client.stream()
+        try:
+            async for record in stream:
+                self.callback(record)
+        finally:
+            await stream.aclose()
+
+    def stop(self, timeout=None):
+        self._started.wait()
+        try:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        except RuntimeError:
+            # loop already closed, the stream ended on its own
+            pass
+        if threading.current_thread() is not self:
+            self.join(timeout)
+
+
+_END = object()
+
+
+def iter_stream(client):
+    """
+    Blocking generator over the records of a StreamingClient
+    """
+    records = queue.Queue()
+    errors = []
+
+    def on_error(e):
+        errors.append(e)
+        records.put(_END)
+
+    handle = StreamHandle(client, records.put, on_error)
+    handle.start()
+    try:
+        while True:
+            record = records.get()
+            if record is _END:
+                raise errors[0]
+            yield record
+    finally:
+        handle.stop()
@@ -0,0 +1,416 @@
+import threading
+import time
+
+import numpy
+
+from yauta.exceptions import TeslaException
+from yauta.snapshot import VehicleSnapshot
+
+NUMBER = 'number'
+BOOL = 'bool'
+TEXT = 'text'
+
+UPDATED_AT = 'updated_at'
+
+# column name to the (field group, field, kind) of vehicle_data it holds,
+# a field group of None reads a top level field
+DEFAULT_COLUMNS = {
+    'state': (None, 'state', TEXT),
+    'battery_level': ('charge_state', 'battery_level', NUMBER),
+    'battery_range': ('charge_state', 'battery_range', NUMBER),
+    'charge_limit_soc': ('charge_state', 'charge_limit_soc', NUMBER),
+    'charging_state': ('charge_state', 'charging_state', TEXT),
+    'charger_power': ('charge_state', 'charger_power', NUMBER),
+    'charge_port_door_open': ('charge_state', 'charge_port_door_open', BOOL),
+    'inside_temp': ('climate_state', 'inside_temp', NUMBER),
+    'outside_temp': ('climate_state', 'outside_temp', NUMBER),
+    'is_climate_on': ('climate_state', 'is_climate_on', BOOL),
+    'latitude': ('drive_state', 'latitude', NUMBER),
+    'longitude': ('drive_state', 'longitude', NUMBER),
+    'speed': ('drive_state', 'speed', NUMBER),
+    'shift_state': ('drive_state', 'shift_state', TEXT),
+    'odometer': ('vehicle_state', 'odometer', NUMBER),
+    'locked': ('vehicle_state', 'locked', BOOL),
+    'sentry_mode': ('vehicle_state', 'sentry_mode', BOOL)
+}
+
+AGGREGATES = {
+    'count': lambda values: int(numpy.count_nonzero(~numpy.isnan(values))),
+    'sum': numpy.nansum,
+    'mean': numpy.nanmean,
+    'min': numpy.nanmin,
+    'max': numpy.nanmax,
+    'median': numpy.nanmedian
+}
+
+# missing values, NaN in float columns
+MISSING_CODE = -1
+
+
+class _Column(object):
+
+    __slots__ = ('name', 'group', 'field', 'kind', 'values', 'categories',
+                 'codes')
+
+    def __init__(self, name, group, field, kind, capacity):
+        self.name = name
+        self.group = group
+        self.field = field
+        self.kind = kind
+        if kind == TEXT:
+            # text is dictionary encoded, values hold codes into
+            # categories
+            self.values = numpy.full(capacity, MISSING_CODE, numpy.int32)
+            self.categories = []
+            self.codes = {}
+        else:
+            # numbers and bools are floats so missing values are NaN
+            self.values = numpy.full(capacity, numpy.nan)
+
+    def encode(self, value):
+        if self.kind == TEXT:
+            if value is None:
+                return MISSING_CODE
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.categories)
+                self.categories.append(value)
+            return code
+        if value is None or isinstance(value, str):
+            return numpy.nan
+        return float(value)
+
+    def decode(self, values):
+        if self.kind == TEXT:
+            lookup = numpy.array(self.categories + [None], dtype=object)
+            return lookup[values]
+        if self.kind == BOOL:
+            decoded = numpy.full(len(values), None, dtype=object)
+            known = ~numpy.isnan(values)
+            decoded[known] = (values[known] == 1).tolist()
+            return decoded
+        return values
+
+    def grow(self, capacity):
+        fill = MISSING_CODE if self.kind == TEXT else numpy.nan
+        values = numpy.full(capacity, fill, self.values.dtype)
+        values[:len(self.values)] = self.values
+        self.values = values
+
+
+class FleetTable(object):
+    """
+    Latest state of every vehicle in a fleet, one array per field
+
+        table = FleetTable()
+        poller = AdaptivePoller(t, on_data=table.update)
+        ...
+        table.filter(battery_level__lt=20, charging_state='Disconnected')
+        table.filter(locked=False)
+        table.sort('battery_level', limit=10)
+        table.aggregate('battery_level', 'mean', state='online')
+
+    Each vehicle is a row, updated in place as new vehicle_data comes in.
+    Field groups missing from an update keep their previous values, so
+    partial polls can be mixed with full ones. Queries are evaluated
+    over whole columns with numpy, rather than looping over dicts.
+
+    Conditions are given as keyword arguments, `column=value` or
+    `column__op=value` where op is one of eq, ne, lt, le, gt, ge, in
+    and isnull. Text columns only support eq, ne, in and isnull. Missing
+    values never match a comparison.
+
+    input
+    columns: dict of column name to (field group, field, kind), kind
+    being 'number', 'bool' or 'text', defaults to DEFAULT_COLUMNS
+    capacity: (int) rows to allocate up front, the table grows as needed
+    """
+
+    def __init__(self, columns=None, capacity=64):
+        columns = dict(columns or DEFAULT_COLUMNS)
+        if UPDATED_AT in columns:
+            raise TeslaException('%s is a reserved column name' % UPDATED_AT)
+        columns[UPDATED_AT] = (None, None, NUMBER)
+        self._capacity = max(1, capacity)
+        self._columns = {}
+        for name, spec in columns.items():
+            group, field, kind = spec
+            if kind not in (NUMBER, BOOL, TEXT):
+                raise TeslaException('Unknown column kind: %s' % kind)
+            self._columns[name] = _Column(
+                name, group, field, kind, self._capacity)
+        self._ids = numpy.zeros(self._capacity, numpy.int64)
+        self._rows = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, vehicle_id):
+        return vehicle_id in self._rows
+
+    @property
+    def columns(self) -> list:
+        return list(self._columns)
+
+    @property
+    def ids(self):
+        """
+        numpy array of vehicle ids, in row order
+        """
+        with self._lock:
+            return self._ids[:len(self._rows)].copy()
+
+    def _row(self, vehicle_id):
+        row = self._rows.get(vehicle_id)
+        if row is not None:
+            return row
+        row = len(self._rows)
+        if row == self._capacity:
+            self._capacity *= 2
+            ids = numpy.zeros(self._capacity, numpy.int64)
+            ids[:row] = self._ids
+            self._ids = ids
+            for column in self._columns.values():
+                column.grow(self._capacity)
+        self._ids[row] = vehicle_id
+        self._rows[vehicle_id] = row
+        return row
+
+    def update(self, vehicle_id, data, timestamp=None):
+        """
+        Update a vehicle's row from vehicle_data
+
+        input
+        vehicle_id: id of the vehicle
+        data: vehicle_data dict or VehicleSnapshot, possibly with only
+        some of the field groups
+        timestamp: (float) epoch seconds of the data, defaults to now
+        """
+        if isinstance(data, VehicleSnapshot):
+            data = data.to_dict()
+        with self._lock:
+            row = self._row(vehicle_id)
+            for column in self._columns.values():
+                if column.field is None:
+                    continue
+                if column.group is None:
+                    source = data
+                else:
+                    source = data.get(column.group)
+                if not isinstance(source, dict) or column.field not in source:
+                    continue
+                column.values[row] = column.encode(source[column.field])
+            self._columns[UPDATED_AT].values[row] = (
+                time.time() if timestamp is None else timestamp)
+
+    def update_many(self, results: dict, timestamp=None):
+        """
+        Update from a dict of vehicle id to vehicle_data, or to the
+        FleetResults of TeslaFleet.poll, skipping those that failed
+        """
+        for vehicle_id, data in results.items():
+            if hasattr(data, 'error'):
+                if data.error is not None:
+                    continue
+                data = data.result
+            self.update(vehicle_id, data, timestamp)
+
+    def remove(self, vehicle_id) -> bool:
+        """
+        Drop a vehicle's row, the last row takes its place
+        """
+        with self._lock:
+            row = self._rows.pop(vehicle_id, None)
+            if row is None:
+                return False
+            last = len(self._rows)
+            if row != last:
+                moved = int(self._ids[last])
+                self._ids[row] = moved
+                self._rows[moved] = row
+                for column in self._columns.values():
+                    column.values[row] = column.values[last]
+            for column in self._columns.values():
+                column.values[last] = column.encode(None)
+            return True
+
+    def _column(self, name):
+        column = self._columns.get(name)
+        if column is None:
+            raise TeslaException('Unknown column: %s' % name)
+        return column
+
+    def column(self, name: str):
+        """
+        returns
+        numpy array of a column's values in row order (see ids). Numbers
+        are floats with NaN for missing values, bools and text are
+        decoded to objects with None for missing values.
+        """
+        with self._lock:
+            column = self._column(name)
+            return column.decode(column.values[:len(self._rows)].copy())
+
+    def _condition(self, key, value, size):
+        name, _, op = key.partition('__')
+        op = op or 'eq'
+        column = self._column(name)
+        values = column.values[:size]
+
+        if op == 'isnull':
+            if column.kind == TEXT:
+                missing = values == MISSING_CODE
+            else:
+                missing = numpy.isnan(values)
+            return missing if value else ~missing
+
+        if column.kind == TEXT:
+            if op in ('eq', 'ne'):
+                code = column.codes.get(value)
+                if code is None:
+                    matched = numpy.zeros(size, bool)
+                else:
+                    matched = values == code
+                if op == 'ne':
+                    matched = ~matched & (values != MISSING_CODE)
+                return matched
+            if op == 'in':
+                codes = [column.codes[v] for v in value if v in column.codes]
+                return numpy.isin(values, codes)
+            raise TeslaException(
+                'Text column %s does not support %s' % (name, op))
+
+        if op == 'in':
+            return numpy.isin(values, [column.encode(v) for v in value])
+        target = column.encode(value)
+        if op == 'eq':
+            return values == target
+        if op == 'ne':
+            return (values != target) & ~numpy.isnan(values)
+        if op == 'lt':
+            return values < target
+        if op == 'le':
+            return values <= target
+        if op == 'gt':
+            return values > target
+        if op == 'ge':
+            return values >= target
+        raise TeslaException('Unknown condition: %s' % key)
+
+    def mask(self, **conditions):
+        """
+        returns
+        numpy bool array, in row order, of the vehicles matching every
+        condition
+        """
+        with self._lock:
+            size = len(self._rows)
+            matched = numpy.ones(size, bool)
+            for key, value in conditions.items():
+                matched &= self._condition(key, value, size)
+            return matched
+
+    def filter(self, **conditions):
+        """
+        returns
+        numpy array of the ids of the vehicles matching every condition
+        """
+        with self._lock:
+            return self._ids[:len(self._rows)][self.mask(**conditions)]
+
+    def count(self, **conditions) -> int:
+        return int(numpy.count_nonzero(self.mask(**conditions)))
+
+    def sort(self, column: str, descending: bool = False, limit: int = None,
+             **conditions):
+        """
+        Order the vehicles matching `conditions` by a number column,
+        vehicles missing the value come last
+
+        returns
+        numpy array of vehicle ids, only the first `limit` if given
+        """
+        with self._lock:
+            if self._column(column).kind == TEXT:
+                raise TeslaException('Can not sort on text column %s' % column)
+            size = len(self._rows)
+            matched = self.mask(**conditions)
+            ids = self._ids[:size][matched]
+            values = self._columns[column].values[:size][matched]
+        if descending:
+            values = -values
+        if limit is not None and limit < len(values):
+            # only order the rows that make the cut
+            top = numpy.argpartition(values, limit - 1)[:limit]
+            return ids[top[numpy.argsort(values[top], kind='stable')]]
+        return ids[numpy.argsort(values, kind='stable')]
+
+    def aggregate(self, column: str, how: str = 'mean', **conditions):
+        """
+        Aggregate a number or bool column over the vehicles matching
+        `conditions`, ignoring missing values
+
+        input
+        how: one of count, sum, mean, min, max and median
+
+        returns
+        the aggregate, NaN if no vehicle has a value (0 for count and
+        sum)
+        """
+        fn = AGGREGATES.get(how)
+        if fn is None:
+            raise TeslaException(
+                'Unknown aggregate: %s, must be one of: %s'
+                % (how, ', '.join(sorted(AGGREGATES))))
+        with self._lock:
+            if self._column(column).kind == TEXT:
+                raise TeslaException(
+                    'Can not aggregate text column %s' % column)
+            values = self._columns[column].values[:len(self._rows)][
+                self.mask(**conditions)]
+        if how not in ('count', 'sum') and numpy.isnan(values).all():
+            return numpy.nan
+        return fn(values)
+
+    def value_counts(self, column: str, **conditions) -> dict:
+        """
+        returns
+        dict of each value of a column to the number of vehicles matching
+        `conditions` with it, missing values counted under None
+        """
+        with self._lock:
+            column = self._column(column)
+            values = column.values[:len(self._rows)][self.mask(**conditions)]
+            if column.kind == TEXT:
+                counts = numpy.bincount(
+                    values + 1, minlength=len(column.categories) + 1)
+                labels = [None] + column.categories
+                return {
+                    labels[i]: int(n) for i, n in enumerate(counts) if n
+                }
+        missing = numpy.isnan(values)
+        found, counts = numpy.unique(values[~missing], return_counts=True)
+        labels = column.decode(found)
+        result = {label: int(n) for label, n in zip(labels, counts)}
+        if missing.any():
+            result[None] = int(missing.sum())
+        return result
+
+    def row(self, vehicle_id) -> dict:
+        """
+        returns
+        dict of column name to a vehicle's values, None if the vehicle is
+        not in the table
+        """
+        with self._lock:
+            row = self._rows.get(vehicle_id)
+            if row is None:
+                return None
+            result = {}
+            for name, column in self._columns.items():
+                value = column.decode(column.values[row:row + 1])[0]
+                if isinstance(value, float):
+                    value = None if numpy.isnan(value) else float(value)
+                result[name] = value
+            return result
@@ -1,16 +1,62 @@
+import threading
+import time
+
 from requests import Session, HTTPError
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
 
 from yauta.exceptions import TeslaAuthException
+from yauta.ratelimit import parse_retry_after, vehicle_id_from_url
+from yauta.singleflight import SingleFlight
+from yauta.tokens import (
+    OAUTH_URL,
+    REFRESH_MARGIN,
+    is_expiring,
+    password_grant,
+    refresh_grant,
+    token_from_response
+)
+from yauta.transport import Transport
 from yauta.vehicle import TeslaVehicle
 
 
 class TeslaAPI(Session):
+    """
+    Session for the Tesla Owner API
+
+    With a `token_store`, tokens are persisted per account (keyed by
+    email) so initialize() can skip the password grant, and are renewed
+    with the refresh token `refresh_margin` seconds before they expire.
+    A 401 response triggers a single re-authentication shared by every
+    thread that saw it, after which each request is retried once.
+
+    A `rate_limiter` (yauta.ratelimit.RateLimiter) paces requests and
+    retries those throttled with a 429.
+
+    The last known state of every vehicle is kept in `vehicle_states`,
+    calls to vehicles known to be asleep fail fast with
+    VehicleOfflineException, or wake the vehicle first with `auto_wake`.
+    A `circuit_breaker` (yauta.circuit.CircuitBreaker) stops calls to
+    vehicles that keep failing.
+
+    Identical reads made concurrently by several threads share one
+    request, unless `coalesce_reads` is off. A `hedge`
+    (yauta.hedging.HedgePolicy) sends a second request for reads that
+    are slower than usual.
+
+    With `metrics` (yauta.metrics.Metrics) every response is recorded,
+    including the retries urllib3 makes on its own.
+
+    Requests go through a connection pool of `pool_size`, or through a
+    `transport` (yauta.transport.Transport) shared with other sessions,
+    which is left open when this session is closed.
+    """
 
     BASE_URL = 'https://owner-api.teslamotors.com'
 
-    def __init__(self, client_id, client_secret, email, password):
+    def __init__(self, client_id, client_secret, email, password,
+                 pool_size=10, cache=None, token_store=None,
+                 refresh_margin=REFRESH_MARGIN, rate_limiter=None,
+                 auto_wake=False, circuit_breaker=None, metrics=None,
+                 coalesce_reads=True, transport=None, hedge=None):
         self.prefix_url = TeslaAPI.BASE_URL
         super(TeslaAPI, self).__init__()
 
@@ -18,12 +64,35 @@ class TeslaAPI(Session):
         self.client_secret = client_secret
         self.email = email
         self.password = password
-        retries = Retry(
-            total=5,
-            backoff_factor=1,
-            status_forcelist=[408, 502, 503, 504]
-        )
-        self.mount('https://', HTTPAdapter(max_retries=retries))
+        self.access_token = None
+        self.refresh_token = None
+        self.expires_at = None
+        self.token_store = token_store
+        self.refresh_margin = refresh_margin
+        self._auth_lock = threading.Lock()
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.auto_wake = auto_wake
+        self.circuit_breaker = circuit_breaker
+        self.metrics = metrics
+        # last known state of each vehicle, by id
+        self.vehicle_states = {}
+        self.wake_flight = SingleFlight()
+        self.read_flight = SingleFlight() if coalesce_reads else None
+        self.hedge = hedge
+        # vehicles share this session, so size the pool for the number of
+        # threads expected to be talking to the api at once
+        self._own_transport = transport is None
+        if transport is None:
+            transport = Transport(
+                pool_size=pool_size, pool_connections=pool_size)
+        self.transport = transport
+        transport.mount(self)
+
+    def close(self):
+        super(TeslaAPI, self).close()
+        if self._own_transport:
+            self.transport.close()
 
     def __copy__(self):
         return type(self)(
@@ -37,13 +106,158 @@ class TeslaAPI(Session):
 
     def initialize(self, access_token=None):
         try:
-            self.headers.update(self._get_access_token(access_token))
+            if access_token:
+                self._set_token({'access_token': access_token}, save=False)
+                return self
+
+            token = None
+            if self.token_store is not None:
+                token = self.token_store.load(self.email)
+            if token is None:
+                token = self._fetch_token(None)
+            elif is_expiring(token.get('expires_at'), self.refresh_margin):
+                token = self._fetch_token(token.get('refresh_token'))
+            else:
+                self._set_token(token, save=False)
+                return self
+            self._set_token(token)
         except HTTPError as e:
             raise TeslaAuthException(
                 'Unable to initialize, token fetch failed: %s' % e
             )
         return self
 
+    def _fetch_token(self, refresh_token):
+        """
+        Get a new token, using the refresh token when there is one and
+        falling back to the password grant if it is rejected
+        """
+        start = time.monotonic()
+        try:
+            return self._grant_token(refresh_token)
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe_auth(time.monotonic() - start)
+
+    def _grant_token(self, refresh_token):
+        url = OAUTH_URL + '?grant_type=password'
+        if refresh_token:
+            payload = refresh_grant(
+                self.client_id, self.client_secret, refresh_token)
+            resp = self.post(OAUTH_URL, data=payload)
+            if resp.ok or not self.password:
+                resp.raise_for_status()
+                return token_from_response(resp.json())
+        payload = password_grant(
+            self.client_id, self.client_secret, self.email, self.password)
+        resp = self.post(url, data=payload)
+        resp.raise_for_status()
+        return token_from_response(resp.json())
+
+    def _set_token(self, token, save=True):
+        self.access_token = token['access_token']
+        self.refresh_token = token.get('refresh_token')
+        self.expires_at = token.get('expires_at')
+        self.headers['Authorization'] = 'Bearer %s' % self.access_token
+        if save and self.token_store is not None:
+            self.token_store.save(self.email, token)
+
+    def reauthenticate(self, stale_token=None):
+        """
+        Get a new access token
+
+        Only one thread re-authenticates at a time. If `stale_token` is
+        given and has already been replaced by another thread, the
+        current token is returned without making a request.
+
+        returns
+        the current access token
+        """
+        with self._auth_lock:
+            if stale_token is not None and self.access_token != stale_token:
+                return self.access_token
+            try:
+                self._set_token(self._fetch_token(self.refresh_token))
+            except HTTPError as e:
+                raise TeslaAuthException(
+                    'Unable to re-authenticate, token fetch failed: %s' % e
+                )
+            return self.access_token
+
+    def _can_reauthenticate(self):
+        return bool(self.refresh_token or self.password)
+
+    def request(self, method, url, *args, **kwargs):
+        """
+        Make a request, re-authenticating and retrying once on a 401
+
+        With metrics, the request is recorded once with its final status,
+        the time from the first attempt to the final response and the
+        number of retries made for it.
+        """
+        start = time.monotonic()
+        retries = 0
+        try:
+            if self.access_token is None or OAUTH_URL in url:
+                resp, retries = self._send(method, url, *args, **kwargs)
+            else:
+                token = self.access_token
+                if is_expiring(self.expires_at, self.refresh_margin):
+                    token = self.reauthenticate(token)
+                resp, retries = self._send(method, url, *args, **kwargs)
+                if resp.status_code == 401 and self._can_reauthenticate():
+                    self.reauthenticate(token)
+                    resp, more = self._send(method, url, *args, **kwargs)
+                    retries += 1 + more
+        except Exception:
+            self._observe(method, url, None, start, retries)
+            raise
+        self._observe(method, url, resp, start, retries)
+        return resp
+
+    def _send(self, method, url, *args, **kwargs):
+        """
+        Send a request, waiting on the rate limiter if there is one and
+        retrying requests it answers with 429
+
+        returns
+        tuple of the response and the number of retries made for it,
+        including those made by urllib3
+        """
+        limiter = self.rate_limiter
+        retries = 0
+        attempt = 0
+        while True:
+            if limiter is not None:
+                limiter.acquire(vehicle_id_from_url(url))
+            resp = super(TeslaAPI, self).request(method, url, *args, **kwargs)
+            # urllib3 keeps the retries it made for this response to itself
+            history = getattr(
+                getattr(resp.raw, 'retries', None), 'history', ())
+            retries += len(history or ())
+            if (limiter is None or resp.status_code != 429 or
+                    attempt >= limiter.max_retries):
+                return resp, retries
+            limiter.throttled(
+                parse_retry_after(resp.headers.get('Retry-After')), attempt)
+            attempt += 1
+            retries += 1
+
+    def _observe(self, method, url, resp, start, retries):
+        metrics = self.metrics
+        if metrics is None:
+            return
+        if resp is None:
+            metrics.observe_request(
+                method, url, None, time.monotonic() - start, retries)
+            return
+        body = resp.request.body or b''
+        metrics.observe_request(
+            method, url, resp.status_code, time.monotonic() - start,
+            retries=retries,
+            sent=len(body.encode('utf-8') if isinstance(body, str) else body),
+            received=len(resp.content or b''))
+
     def get(self, url, *args, **kwargs):
         url = self.prefix_url + url
         return super(TeslaAPI, self).get(url, *args, **kwargs)
@@ -56,22 +270,6 @@ class TeslaAPI(Session):
         url = self.prefix_url + url
         return super(TeslaAPI, self).patch(url, *args, **kwargs)
 
-    def _get_access_token(self, access_token=None):
-        if not access_token:
-            oauth_url = '/oauth/token?grant_type=password'
-            payload = {
-                'grant_type': 'password',
-                'client_id': self.client_id,
-                'client_secret': self.client_secret,
-                'email': self.email,
-                'password': self.password
-            }
-            resp = self.post(oauth_url, data=payload)
-            resp.raise_for_status()
-            access_token = resp.json()['access_token']
-        self.access_token = access_token
-        return {'Authorization': 'Bearer %s' % access_token}
-
     def get_vehicles(self):
         """
         Returns list of all vehicles
@@ -84,5 +282,10 @@ class TeslaAPI(Session):
         """
         vehicles_url = '/api/1/vehicles'
         vehicles = self.get(vehicles_url).json()['response']
-        vehicle_list = [TeslaVehicle(v['id'], self) for v in vehicles] # noqa
+        for v in vehicles:
+            self.vehicle_states[v['id']] = v.get('state')
+        vehicle_list = [
+            TeslaVehicle(v['id'], self, v.get('vehicle_id'))
+            for v in vehicles
+        ]
         return vehicle_list
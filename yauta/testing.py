@@ -0,0 +1,319 @@
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+VEHICLE_URL = re.compile(r'^/api/1/vehicles/(\d+)(/.*)?$')
+
+GROUPS = (
+    'charge_state',
+    'climate_state',
+    'drive_state',
+    'gui_settings',
+    'vehicle_config',
+    'vehicle_state'
+)
+
+
+def vehicle_data(vehicle_id, state):
+    """
+    Returns a plausible vehicle_data response for a fake vehicle
+    """
+    now = int(time.time() * 1000)
+    return {
+        'id': vehicle_id,
+        'vehicle_id': vehicle_id,
+        'vin': '5YJ3E1EA%09d' % vehicle_id,
+        'display_name': 'Car %s' % vehicle_id,
+        'state': state,
+        'charge_state': {
+            'battery_level': vehicle_id % 100,
+            'battery_range': 200.5,
+            'charge_limit_soc': 90,
+            'charging_state': 'Disconnected',
+            'charger_power': 0,
+            'charge_port_door_open': False,
+            'timestamp': now
+        },
+        'climate_state': {
+            'inside_temp': 21.5,
+            'outside_temp': 15.0,
+            'driver_temp_setting': 21.0,
+            'passenger_temp_setting': 21.0,
+            'is_climate_on': False,
+            'timestamp': now
+        },
+        'drive_state': {
+            'latitude': 37.4 + vehicle_id * 1e-4,
+            'longitude': -122.1,
+            'heading': 90,
+            'speed': None,
+            'shift_state': None,
+            'timestamp': now
+        },
+        'gui_settings': {'gui_distance_units': 'mi/hr', 'timestamp': now},
+        'vehicle_config': {'car_type': 'model3', 'timestamp': now},
+        'vehicle_state': {
+            'odometer': 1000.0 + vehicle_id,
+            'locked': True,
+            'car_version': '2020.4.1',
+            'timestamp': now
+        }
+    }
+
+
+class _FakeVehicle(object):
+
+    def __init__(self, vehicle_id, asleep):
+        self.id = vehicle_id
+        self.data = vehicle_data(vehicle_id, 'online')
+        self.asleep = asleep
+        self.online_at = None
+
+    @property
+    def state(self):
+        if self.asleep and self.online_at is not None:
+            if time.monotonic() >= self.online_at:
+                self.asleep = False
+                self.online_at = None
+        return 'asleep' if self.asleep else 'online'
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'vehicle_id': self.id,
+            'vin': self.data['vin'],
+            'display_name': self.data['display_name'],
+            'state': self.state
+        }
+
+
+class FakeOwnerAPI(object):
+    """
+    Local stand-in for the Owner API, for tests and benchmarks
+
+    Serves the token, vehicle list, summary, wake_up, vehicle_data,
+    data_request and command endpoints over plain http on localhost, with
+    a thread per request.
+
+        with FakeOwnerAPI(fleet_size=100, asleep=0.5) as server:
+            api = TeslaAPI(...)
+            api.prefix_url = server.url
+
+    input
+    fleet_size: (int) number of vehicles on the account, ids 1..n
+    asleep: (float) fraction of vehicles that start asleep, or a list of
+    vehicle ids
+    wake_delay: (float) seconds for a vehicle to come online after
+    wake_up
+    latency: (float) seconds to delay every response, or a dict of
+    endpoint to seconds, endpoints being 'auth', 'vehicles', 'summary',
+    'wake_up', 'vehicle_data', 'data_request' and 'command'
+    errors: dict of status code to the probability of answering a
+    request with it, e.g. {429: 0.05, 503: 0.01}; token requests are
+    exempt
+    retry_after: (float) Retry-After sent with injected 429s
+    seed: seed for the random number generator
+    """
+
+    def __init__(self, fleet_size=1, asleep=0.0, wake_delay=0.0,
+                 latency=0.0, errors=None, retry_after=1, seed=None):
+        self.random = random.Random(seed)
+        if isinstance(asleep, (list, tuple, set)):
+            sleeping = set(asleep)
+        else:
+            sleeping = set(
+                i for i in range(1, fleet_size + 1)
+                if self.random.random() < asleep)
+        self.vehicles = {
+            i: _FakeVehicle(i, i in sleeping)
+            for i in range(1, fleet_size + 1)
+        }
+        self.wake_delay = wake_delay
+        self.latency = latency
+        self.errors = dict(errors or {})
+        self.retry_after = retry_after
+        self.requests = Counter()
+        self.tokens = 0
+        # tcp connections accepted
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%s' % (host, port)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        server = self
+
+        class Handler(_Handler):
+            fake = server
+
+        self._server = _Server(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def _latency(self, endpoint):
+        if isinstance(self.latency, dict):
+            return self.latency.get(endpoint, 0)
+        return self.latency
+
+    def _injected_error(self):
+        roll = self.random.random()
+        for status, probability in self.errors.items():
+            if roll < probability:
+                return status
+            roll -= probability
+        return None
+
+    def handle(self, method, path, query, form):
+        """
+        Route a request
+
+        returns
+        tuple of (status, body, headers)
+        """
+        if path == '/oauth/token':
+            endpoint = 'auth'
+        elif path == '/api/1/vehicles':
+            endpoint = 'vehicles'
+        else:
+            match = VEHICLE_URL.match(path)
+            if match is None:
+                return 404, {'error': 'not_found'}, {}
+            rest = match.group(2) or ''
+            if rest == '':
+                endpoint = 'summary'
+            elif rest == '/wake_up':
+                endpoint = 'wake_up'
+            elif rest == '/vehicle_data':
+                endpoint = 'vehicle_data'
+            elif rest.startswith('/data_request/'):
+                endpoint = 'data_request'
+            elif rest.startswith('/command/'):
+                endpoint = 'command'
+            else:
+                return 404, {'error': 'not_found'}, {}
+
+        with self._lock:
+            self.requests[endpoint] += 1
+        latency = self._latency(endpoint)
+        if latency:
+            time.sleep(latency)
+
+        if endpoint == 'auth':
+            with self._lock:
+                self.tokens += 1
+                token = self.tokens
+            return 200, {
+                'access_token': 'token_%s' % token,
+                'refresh_token': 'refresh_%s' % token,
+                'token_type': 'bearer',
+                'expires_in': 3888000,
+                'created_at': int(time.time())
+            }, {}
+
+        with self._lock:
+            status = self._injected_error()
+        if status == 429:
+            return 429, {'error': 'rate_limited'}, {
+                'Retry-After': str(self.retry_after)}
+        if status is not None:
+            return status, {'error': 'injected'}, {}
+
+        if endpoint == 'vehicles':
+            vehicles = [v.summary() for v in self.vehicles.values()]
+            return 200, {'response': vehicles, 'count': len(vehicles)}, {}
+
+        vehicle = self.vehicles.get(int(match.group(1)))
+        if vehicle is None:
+            return 404, {'error': 'not_found'}, {}
+        if endpoint == 'summary':
+            return 200, {'response': vehicle.summary()}, {}
+        if endpoint == 'wake_up':
+            with self._lock:
+                if vehicle.asleep and vehicle.online_at is None:
+                    vehicle.online_at = time.monotonic() + self.wake_delay
+            return 200, {'response': vehicle.summary()}, {}
+
+        if vehicle.state != 'online':
+            return 408, {'response': None, 'error': 'vehicle unavailable'}, {}
+
+        if endpoint == 'vehicle_data':
+            data = dict(vehicle.data)
+            endpoints = query.get('endpoints')
+            if endpoints:
+                wanted = endpoints[0].split(';')
+                data = {
+                    k: v for k, v in data.items()
+                    if k not in GROUPS or k in wanted
+                }
+            return 200, {'response': data}, {}
+        if endpoint == 'data_request':
+            group = rest[len('/data_request/'):]
+            if group not in GROUPS:
+                return 404, {'error': 'not_found'}, {}
+            return 200, {'response': vehicle.data[group]}, {}
+        return 200, {'response': {'result': True, 'reason': ''}}, {}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # the listen backlog, large enough for a fleet's worth of connections
+    request_queue_size = 1024
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    fake = None
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super(_Handler, self).setup()
+        with self.fake._lock:
+            self.fake.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, method):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode() if length else ''
+        status, payload, headers = self.fake.handle(
+            method, url.path, parse_qs(url.query), parse_qs(body))
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        self._respond('GET')
+
+    def do_POST(self):
+        self._respond('POST')
@@ -0,0 +1,181 @@
+import abc
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+OAUTH_URL = '/oauth/token'
+
+# refresh tokens this many seconds before they expire
+REFRESH_MARGIN = 24 * 60 * 60
+
+
+def password_grant(client_id, client_secret, email, password) -> dict:
+    return {
+        'grant_type': 'password',
+        'client_id': client_id,
+        'client_secret': client_secret,
+        'email': email,
+        'password': password
+    }
+
+
+def refresh_grant(client_id, client_secret, refresh_token) -> dict:
+    return {
+        'grant_type': 'refresh_token',
+        'client_id': client_id,
+        'client_secret': client_secret,
+        'refresh_token': refresh_token
+    }
+
+
+def token_from_response(body: dict) -> dict:
+    """
+    Convert an /oauth/token response into the token dict that is stored
+
+    returns
+    dict of access_token, refresh_token and expires_at (epoch seconds)
+    """
+    expires_at = None
+    if body.get('expires_in') is not None:
+        created_at = body.get('created_at') or time.time()
+        expires_at = created_at + body['expires_in']
+    return {
+        'access_token': body['access_token'],
+        'refresh_token': body.get('refresh_token'),
+        'expires_at': expires_at
+    }
+
+
+def is_expiring(expires_at, margin=REFRESH_MARGIN) -> bool:
+    return expires_at is not None and time.time() >= expires_at - margin
+
+
+class TokenStore(abc.ABC):
+    """
+    Base class for persisting tokens between processes
+
+    Tokens are dicts as returned by token_from_response, keyed by the
+    account they belong to. Subclasses must implement load, save and
+    delete.
+    """
+
+    @abc.abstractmethod
+    def load(self, key: str):
+        """
+        returns the stored token for `key`, or None
+        """
+
+    @abc.abstractmethod
+    def save(self, key: str, token: dict):
+        pass
+
+    @abc.abstractmethod
+    def delete(self, key: str):
+        pass
+
+
+class MemoryTokenStore(TokenStore):
+    """
+    Keeps tokens in memory, useful for sharing between TeslaAPI instances
+    in one process
+    """
+
+    def __init__(self):
+        self._tokens = {}
+
+    def load(self, key):
+        token = self._tokens.get(key)
+        return dict(token) if token else None
+
+    def save(self, key, token):
+        self._tokens[key] = dict(token)
+
+    def delete(self, key):
+        self._tokens.pop(key, None)
+
+
+class FileTokenStore(TokenStore):
+    """
+    Keeps tokens for any number of accounts in a single json file
+
+    The file is only readable by its owner and is replaced atomically on
+    every save.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write(self, tokens):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(tokens, f)
+        os.chmod(tmp, 0o600)
+        os.replace(tmp, self.path)
+
+    def load(self, key):
+        with self._lock:
+            return self._read().get(key)
+
+    def save(self, key, token):
+        with self._lock:
+            tokens = self._read()
+            tokens[key] = token
+            self._write(tokens)
+
+    def delete(self, key):
+        with self._lock:
+            tokens = self._read()
+            if tokens.pop(key, None) is not None:
+                self._write(tokens)
+
+
+class SqliteTokenStore(TokenStore):
+    """
+    Keeps tokens in a sqlite database, safe to share between processes
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS tokens '
+                '(key TEXT PRIMARY KEY, token TEXT NOT NULL)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def load(self, key):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT token FROM tokens WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, key, token):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO tokens (key, token) VALUES (?, ?)',
+                (key, json.dumps(token)))
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM tokens WHERE key = ?', (key,))
@@ -0,0 +1,260 @@
+import socket
+import time
+
+from requests.adapters import DEFAULT_CA_BUNDLE_PATH, HTTPAdapter
+from requests.packages.urllib3.connection import HTTPConnection
+from requests.packages.urllib3.exceptions import (
+    MaxRetryError,
+    ReadTimeoutError,
+    ResponseError
+)
+from requests.packages.urllib3.util.retry import Retry
+from requests.packages.urllib3.util.ssl_ import create_urllib3_context
+from requests.packages.urllib3.util.timeout import Timeout
+
+RETRY_TOTAL = 5
+RETRY_BACKOFF_FACTOR = 1
+# 408 means the vehicle is asleep or unreachable, which retrying won't fix
+RETRY_STATUS_FORCELIST = [502, 503, 504]
+
+# seconds to connect and to wait for a response
+DEFAULT_TIMEOUT = (10, 60)
+
+# start tcp keep-alive probes after a minute idle, then every 20 seconds
+KEEPALIVE_IDLE = 60
+KEEPALIVE_INTERVAL = 20
+KEEPALIVE_COUNT = 3
+
+
+# shortest timeout given to an attempt made right at its deadline
+MIN_ATTEMPT_TIMEOUT = 0.001
+
+
+class _Retry(Retry):
+    """
+    Retry that gives up on read timeouts straight away, and that stops
+    retrying once another attempt could not be made before its deadline
+
+    A read timeout is the caller's latency budget running out, retrying
+    would only overrun it, and a read that slow is better hedged, see
+    yauta.hedging.
+    """
+
+    # time.monotonic() by which the retries have to be over, if any
+    deadline = None
+
+    def new(self, **kw):
+        retry = super(_Retry, self).new(**kw)
+        retry.deadline = self.deadline
+        return retry
+
+    def increment(self, method=None, url=None, response=None, error=None,
+                  _pool=None, _stacktrace=None):
+        if isinstance(error, ReadTimeoutError):
+            raise error
+        retry = super(_Retry, self).increment(
+            method, url, response, error, _pool, _stacktrace)
+        if (self.deadline is not None and
+                time.monotonic() + retry.get_backoff_time() >= self.deadline):
+            if error is None:
+                error = ResponseError(
+                    ResponseError.SPECIFIC_ERROR.format(
+                        status_code=response.status)
+                    if response is not None and response.status
+                    else ResponseError.GENERIC_ERROR)
+            raise MaxRetryError(_pool, url, error)
+        return retry
+
+
+def deadline_retries(retries: Retry, deadline: float) -> Retry:
+    """
+    returns
+    a copy of `retries` that makes no attempt after `deadline`, a
+    time.monotonic(). A Retry that is not one of default_retries() can't
+    be bounded that way, it is not allowed to retry at all
+    """
+    if isinstance(retries, _Retry):
+        retries = retries.new()
+        retries.deadline = deadline
+        return retries
+    return retries.new(total=0)
+
+
+class DeadlineTimeout(Timeout):
+    """
+    Timeout for a request that has to be answered within `seconds`,
+    retries made by the transport included
+
+        api.get(url, timeout=DeadlineTimeout(5))
+
+    Every attempt is given what is left of the budget as its connect and
+    read timeout, and the transport doesn't retry once it has run out,
+    see deadline_retries.
+    """
+
+    def __init__(self, seconds: float, deadline: float = None):
+        super(DeadlineTimeout, self).__init__(connect=seconds, read=seconds)
+        if deadline is None:
+            deadline = time.monotonic() + seconds
+        self.deadline = deadline
+
+    def clone(self):
+        # urllib3 clones the timeout for every attempt
+        remaining = max(
+            MIN_ATTEMPT_TIMEOUT, self.deadline - time.monotonic())
+        return DeadlineTimeout(remaining, self.deadline)
+
+
+def default_retries() -> Retry:
+    return _Retry(
+        total=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_FORCELIST,
+        # otherwise urllib3 retries any 429 carrying a Retry-After itself,
+        # hidden from the rate limiter
+        respect_retry_after_header=False
+    )
+
+
+def keepalive_options(idle=KEEPALIVE_IDLE, interval=KEEPALIVE_INTERVAL,
+                      count=KEEPALIVE_COUNT) -> list:
+    """
+    Socket options turning on tcp keep-alive, so idle pooled connections
+    are noticed when they drop instead of failing the next request
+    """
+    options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    # not every platform lets the probes be tuned
+    for name, value in (('TCP_KEEPIDLE', idle), ('TCP_KEEPINTVL', interval),
+                        ('TCP_KEEPCNT', count)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+class _SharedAdapter(HTTPAdapter):
+    """
+    HTTPAdapter mounted on every session of a Transport
+
+    Sessions close their adapters when they are closed, which must not
+    take the pool away from the other sessions, so only the Transport
+    closes it.
+    """
+
+    def __init__(self, transport, **kwargs):
+        self.transport = transport
+        super(_SharedAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False,
+                         **pool_kwargs):
+        pool_kwargs['socket_options'] = self.transport.socket_options
+        super(_SharedAdapter, self).init_poolmanager(
+            connections, maxsize, block, **pool_kwargs)
+
+    def build_connection_pool_key_attributes(self, request, verify,
+                                             cert=None):
+        host_params, pool_kwargs = super(
+            _SharedAdapter, self).build_connection_pool_key_attributes(
+                request, verify, cert)
+        if verify is True and host_params['scheme'] == 'https':
+            # a custom bundle gets a context of its own, never this one
+            pool_kwargs['ssl_context'] = self.transport.ssl_context
+        return host_params, pool_kwargs
+
+    def cert_verify(self, conn, url, verify, cert):
+        super(_SharedAdapter, self).cert_verify(conn, url, verify, cert)
+        if verify is True:
+            # the shared context already trusts the default bundle, giving
+            # it to urllib3 again would reload it on every new connection
+            conn.ca_certs = None
+            conn.ca_cert_dir = None
+
+    def send(self, request, stream=False, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.transport.timeout
+        adapter = self
+        deadline = getattr(timeout, 'deadline', None)
+        if deadline is not None:
+            # the same adapter, sharing its pool, with retries bounded by
+            # the deadline. max_retries is left alone, other threads are
+            # sending through it
+            adapter = object.__new__(type(self))
+            adapter.__dict__.update(self.__dict__)
+            adapter.max_retries = deadline_retries(self.max_retries, deadline)
+        return super(_SharedAdapter, adapter).send(
+            request, stream=stream, timeout=timeout, **kwargs)
+
+    def close(self):
+        pass
+
+    def _close(self):
+        super(_SharedAdapter, self).close()
+
+
+class Transport(object):
+    """
+    Connection pool shared by many TeslaAPI sessions
+
+        transport = Transport(pool_size=50)
+        apis = [TeslaAPI(transport=transport, **a) for a in accounts]
+
+    Every session keeps its own tokens and headers, but they all send
+    through one pool of keep-alive connections, so the number of sockets
+    open to the api follows the number of requests in flight rather than
+    the number of accounts, and a connection set up (TLS handshake
+    included) for one account is reused by the next.
+
+    The CA bundle is loaded once into an ssl context shared by every
+    connection, rather than on each new connection.
+
+    input
+    pool_size: (int) connections kept open per host, size it for the
+    number of threads sending requests at once
+    block: (bool) wait for a free connection rather than opening one
+    past pool_size that is thrown away afterwards
+    timeout: seconds, or a (connect, read) tuple, for requests made
+    without a timeout of their own
+    keepalive: (bool) turn on tcp keep-alive probes
+    max_retries: urllib3 Retry, defaults to default_retries(). Requests
+    sent with a DeadlineTimeout are only retried while there is time
+    left, see deadline_retries
+    """
+
+    def __init__(self, pool_size=10, pool_connections=10, block=False,
+                 timeout=DEFAULT_TIMEOUT, keepalive=True, max_retries=None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.socket_options = list(HTTPConnection.default_socket_options)
+        if keepalive:
+            self.socket_options += keepalive_options()
+        self.ssl_context = create_urllib3_context()
+        self.ssl_context.load_verify_locations(DEFAULT_CA_BUNDLE_PATH)
+        self.adapter = _SharedAdapter(
+            self,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_size,
+            pool_block=block,
+            max_retries=(
+                default_retries() if max_retries is None else max_retries)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def mount(self, session):
+        """
+        Send every request of a requests.Session through this transport
+        """
+        session.mount('https://', self.adapter)
+        # plain http is only used against local stand-ins for the api
+        session.mount('http://', self.adapter)
+        return session
+
+    def close(self):
+        """
+        Close every pooled connection, sessions can still be used and
+        will open new ones
+        """
+        self.adapter._close()
@@ -1,41 +1,258 @@
+import inspect
 import time
-from requests.exceptions import HTTPError
-
-from yauta.exceptions import TeslaException
+from urllib.parse import quote
+
+from requests.exceptions import (
+    HTTPError,
+    RequestException,
+    RetryError,
+    Timeout
+)
+
+from yauta.exceptions import (
+    TeslaDeadlineException,
+    TeslaException,
+    TeslaWakeTimeoutException,
+    VehicleOfflineException
+)
+from yauta.snapshot import VehicleSnapshot
+from yauta.transport import DeadlineTimeout
 
 METHOD_GET = 'GET'
 METHOD_POST = 'POST'
 METHOD_PATCH = 'PATCH'
 METHOD_DELETE = 'DELETE'
 
+COMMAND_PREFIX = '/command/'
+
+# TeslaVehicle methods that send a /command/, the only ones validate_command
+# accepts
+COMMANDS = frozenset((
+    'honk_horn', 'flash_lights', 'remote_start_drive',
+    'speed_limit_set_limit', 'speed_limit_activate',
+    'speed_limit_deactivate', 'speed_limit_clear_pin', 'set_valet_mode',
+    'reset_valet_pin', 'door_unlock', 'door_lock', 'actuate_trunk',
+    'sun_roof_control', 'charge_port_door_open', 'charge_port_door_close',
+    'charge_start', 'charge_stop', 'charge_standard', 'charge_max_range',
+    'set_charge_limit', 'auto_conditioning_start', 'auto_conditioning_stop',
+    'set_temps', 'remote_seat_heater_request', 'media_toggle_playback',
+    'media_next_track', 'media_prev_track', 'media_next_fav',
+    'media_prev_fav', 'media_volume_up', 'media_volume_down',
+    'navigation_request', 'schedule_software_update',
+    'cancel_software_update'
+))
+
+VEHICLE_DATA_FIELDS = (
+    'charge_state',
+    'climate_state',
+    'drive_state',
+    'gui_settings',
+    'vehicle_config',
+    'vehicle_state'
+)
+
+STATE_ONLINE = 'online'
+STATE_ASLEEP = 'asleep'
+STATE_OFFLINE = 'offline'
+OFFLINE_STATES = (STATE_ASLEEP, STATE_OFFLINE)
+
+# endpoints that answer with the vehicle summary, including its state,
+# and can be called while the vehicle is asleep
+SUMMARY_URLS = ('', '/wake_up')
+
+# the api answers 408 when the vehicle can't be reached
+STATUS_VEHICLE_UNAVAILABLE = 408
+
+# while waiting for a vehicle to wake, poll its state starting at
+# WAKE_POLL_INITIAL seconds and backing off up to WAKE_POLL_MAX seconds
+WAKE_TIMEOUT = 120
+WAKE_POLL_INITIAL = 1
+WAKE_POLL_BACKOFF = 1.5
+WAKE_POLL_MAX = 10
+
+
+def validate_trunk_position(position: str):
+    try:
+        assert position in ('front', 'rear')
+    except AssertionError:
+        raise TeslaException(
+            'Invalid position: %s, must be "front" or "rear"' % position)
+
+
+def validate_sun_roof_state(state: str):
+    try:
+        assert state in ('vent', 'close')
+    except AssertionError:
+        raise TeslaException(
+            'Invalid state: %s, must be "vent" or "close"' % state)
+
+
+def validate_charge_limit(percent: int):
+    try:
+        assert 10 < percent < 100
+    except AssertionError:
+        raise TeslaException(
+            "percent: %s must be between 10 and 100" % percent)
+
+
+def validate_seat_heater(heater: int, level: int):
+    try:
+        assert heater in range(5)
+    except AssertionError:
+        raise TeslaException(
+            'Invalid seat selected, seat number must be in range: %s'
+            % range(5)
+        )
+    try:
+        assert level in range(4)
+    except AssertionError:
+        raise TeslaException(
+            'Invalid level selected, level must be in range: %s'
+            % range(4)
+        )
+
+
+# argument validation for commands, by method name, taking the same
+# arguments as the method. Raises TeslaException on invalid arguments
+VALIDATORS = {
+    'actuate_trunk': validate_trunk_position,
+    'sun_roof_control': validate_sun_roof_state,
+    'set_charge_limit': validate_charge_limit,
+    'remote_seat_heater_request': validate_seat_heater
+}
+
+
+def validate_command(command: str, params: dict, args: tuple = ()):
+    """
+    Check that `command` is one of COMMANDS and that `args` and `params`
+    are valid positional and keyword arguments to it, without sending
+    anything
+
+    raises TeslaException otherwise
+    """
+    if command not in COMMANDS:
+        raise TeslaException('Unknown vehicle command: %s' % command)
+    method = getattr(TeslaVehicle, command)
+    try:
+        inspect.signature(method).bind(None, *args, **params)
+    except TypeError as e:
+        raise TeslaException('Invalid arguments to %s: %s' % (command, e))
+    validator = VALIDATORS.get(command)
+    if validator is not None:
+        validator(*args, **params)
+
 
 class TeslaVehicle(object):
 
-    def __init__(self, id, api):
+    def __init__(self, id, api, vehicle_id=None):
         self.id = id
         self.api = api
-        self.api.prefix_url = self.api.prefix_url + '/api/1/vehicles/%s' % self.id # noqa
+        # the streaming api identifies vehicles by vehicle_id rather than id
+        self.vehicle_id = vehicle_id
+        self.prefix_url = '/api/1/vehicles/%s' % self.id
 
-    def _call(self, method: str, url: str, data: dict) -> dict:
+    def _call(self, method: str, url: str, data: dict,
+              timeout: float = None) -> dict:
         """
         Make calls via http
 
         Since all of the methods on TeslaVehicle should raise on error,
         this is a centralized method make all the various HTTP calls from.
 
+        Calls to a vehicle last seen asleep or offline raise
+        VehicleOfflineException without making a request, unless the api
+        has `auto_wake` set, in which case the vehicle is woken first.
+
+        Concurrent GETs of the same url for the same vehicle share a
+        single request through the api's `read_flight`, every caller gets
+        its result or exception.
+
+        GETs go through the api's `hedge` policy when it has one, see
+        yauta.hedging.HedgePolicy.
+
         input
         method: one of 'GET', 'POST'
         url: the api endpoint without the prefix url
         data: a data payload if necessary
-        """
-
-        if method == METHOD_POST:
-            if data:
-                resp = self.api.post(url, data=data)
+        timeout: (float) latency budget in seconds, covering any wake up
+        as well as the request and the retries the transport makes for
+        it, TeslaDeadlineException is raised once it is spent or when
+        retrying a failed request would overrun it. Coalesced reads share
+        the budget of the first caller.
+        """
+
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        flight = self.api.read_flight
+        if method == METHOD_GET and flight is not None:
+            return flight.do(
+                (self.id, url), self._request, method, url, data, deadline)
+        return self._request(method, url, data, deadline)
+
+    def _request(self, method: str, url: str, data: dict,
+                 deadline: float = None) -> dict:
+        if self._needs_wake(url):
+            if deadline is None:
+                self.wake_up(wait=True)
+            else:
+                self.wake_up(wait=True, timeout=min(
+                    WAKE_TIMEOUT, self._remaining(deadline, url)))
+        breaker = self.api.circuit_breaker
+        trial = breaker is not None and breaker.check(self.id)
+        try:
+            return self._send(method, url, data, deadline)
+        finally:
+            if trial:
+                # no-op when the outcome was recorded, frees the trial
+                # when the call ended any other way
+                breaker.release(self.id)
+
+    def _send(self, method: str, url: str, data: dict,
+              deadline: float = None) -> dict:
+        breaker = self.api.circuit_breaker
+        endpoint = url
+        url = self.prefix_url + url
+
+        def send(timeout):
+            kwargs = {}
+            if timeout is not None:
+                kwargs['timeout'] = DeadlineTimeout(timeout)
+            try:
+                if method == METHOD_POST:
+                    if data:
+                        return self.api.post(url, data=data, **kwargs)
+                    return self.api.post(url, **kwargs)
+                return self.api.get(url, **kwargs)
+            except Timeout as e:
+                if deadline is None:
+                    raise
+                raise TeslaDeadlineException(
+                    'No response from %s within the deadline: %s'
+                    % (url, e))
+
+        hedge = self.api.hedge
+        try:
+            if method == METHOD_GET and hedge is not None:
+                resp = hedge.call(url, send, deadline)
             else:
-                resp = self.api.post(url)
-        elif method == METHOD_GET:
-            resp = self.api.get(url)
+                resp = send(
+                    None if deadline is None
+                    else self._remaining(deadline, endpoint))
+        except (RequestException, TeslaDeadlineException) as e:
+            if breaker is not None:
+                breaker.failure(self.id)
+            if isinstance(e, RetryError):
+                # the transport gave up retrying a failing response
+                if deadline is not None:
+                    raise TeslaDeadlineException(
+                        'No successful response from %s within the '
+                        'deadline: %s' % (url, e))
+                raise TeslaException(
+                    'Unable to complete request to: %s - %s' % (url, e))
+            raise
+
+        self._after_call(endpoint, resp.status_code)
 
         try:
             resp.raise_for_status()
@@ -43,26 +260,296 @@ class TeslaVehicle(object):
             raise TeslaException(
                 'Unable to complete request to: %s - %s' % (url, e))
 
-        return resp.json()['response']
+        response = resp.json()['response']
+        self._record_state(endpoint, response)
+        return response
+
+    def _remaining(self, deadline: float, url: str) -> float:
+        """
+        returns
+        seconds left before `deadline`, raises TeslaDeadlineException if
+        there are none
+        """
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TeslaDeadlineException(
+                'Deadline passed before calling %s%s'
+                % (self.prefix_url, url))
+        return remaining
+
+    def _needs_wake(self, url: str) -> bool:
+        """
+        Check the last known state of the vehicle before calling `url`
+
+        returns True if the vehicle has to be woken up first, raises
+        VehicleOfflineException if it is offline and auto_wake is off
+        """
+        if url in SUMMARY_URLS:
+            return False
+        state = self.api.vehicle_states.get(self.id)
+        if state not in OFFLINE_STATES:
+            return False
+        if self.api.auto_wake:
+            return True
+        raise VehicleOfflineException(
+            'Vehicle %s is %s, wake it up first' % (self.id, state))
+
+    def _after_call(self, url: str, status: int):
+        """
+        Update the cache, vehicle state and circuit breaker after a
+        response with `status` was received for `url`
+        """
+        if url.startswith(COMMAND_PREFIX) and self.api.cache is not None:
+            self.api.cache.invalidate_command(
+                self.id, url[len(COMMAND_PREFIX):])
+
+        breaker = self.api.circuit_breaker
+        if status == STATUS_VEHICLE_UNAVAILABLE:
+            self.api.vehicle_states[self.id] = STATE_OFFLINE
+            if breaker is not None:
+                breaker.failure(self.id)
+            raise VehicleOfflineException(
+                'Vehicle %s is unavailable' % self.id)
+        if breaker is not None:
+            if status >= 500:
+                breaker.failure(self.id)
+            else:
+                breaker.success(self.id)
+
+    def _record_state(self, url: str, response: dict):
+        if url in SUMMARY_URLS:
+            self.api.vehicle_states[self.id] = response['state']
+        else:
+            self.api.vehicle_states[self.id] = STATE_ONLINE
+
+    def _get_data(self, url: str, groups: list = None,
+                  group: str = None, timeout: float = None):
+        """
+        Make a GET for vehicle data, going through the api cache if set
+
+        input
+        url: the api endpoint without the prefix url
+        groups: the field groups the endpoint returns, None for all
+        group: set when the endpoint returns a single field group rather
+        than a vehicle_data style response
+        timeout: (float) latency budget in seconds, see _call
+        """
 
-    def get_vehicle_data(self) -> dict:
+        data = None
+        if group is not None:
+            groups = [group]
+
+        def fetch():
+            resp = self._call(METHOD_GET, url, data, timeout)
+            return resp if group is None else {group: resp}
+
+        cache = self.api.cache
+        if cache is None:
+            resp = fetch()
+            return resp if group is None else resp[group]
+
+        cached, fresh = cache.get(self.id, groups)
+        if cached is not None and groups is not None:
+            if not all(g in cached for g in groups):
+                cached = None
+            else:
+                cached = {
+                    k: v for k, v in cached.items()
+                    if not isinstance(v, dict) or k in groups
+                }
+
+        if cached is not None and fresh:
+            resp = cached
+        elif cached is not None and cache.stale_while_revalidate:
+            cache.revalidate(self.id, fetch, groups)
+            resp = cached
+        else:
+            resp = fetch()
+            cache.put(self.id, resp, groups)
+        return resp if group is None else resp[group]
+
+    def get_vehicle_data(self, fields: list = None,
+                         timeout: float = None) -> dict:
         """
         Get detailed vehicle data
+
+        When the api has a VehicleDataCache, fresh cached data is
+        returned without making a request.
+
+        input
+        fields: optional list of field groups to fetch, e.g.
+        ['charge_state', 'drive_state'], defaults to all of them
+        timeout: (float) seconds to answer within, TeslaDeadlineException
+        is raised after that
         """
 
+        url = self._vehicle_data_url(fields)
+        return self._get_data(url, fields or None, timeout=timeout)
+
+    @staticmethod
+    def _vehicle_data_url(fields):
         url = '/vehicle_data'
+        if fields:
+            for field in fields:
+                if field not in VEHICLE_DATA_FIELDS:
+                    raise TeslaException(
+                        'Invalid field: %s, must be one of: %s'
+                        % (field, ', '.join(VEHICLE_DATA_FIELDS)))
+            url += '?endpoints=%s' % quote(';'.join(fields))
+        return url
+
+    def get_vehicle_snapshot(self, fields: list = None) -> VehicleSnapshot:
+        """
+        Get detailed vehicle data as a compact VehicleSnapshot
+
+        input
+        fields: optional list of field groups to fetch, see
+        get_vehicle_data
+        """
+
+        return VehicleSnapshot.from_dict(self.get_vehicle_data(fields))
+
+    def _streaming_client(self, columns, **kwargs):
+        from yauta.streaming import StreamingClient
+
+        return StreamingClient(
+            self.vehicle_id,
+            lambda: self.api.access_token,
+            self.api.reauthenticate,
+            columns=columns,
+            **kwargs
+        )
+
+    def stream(self, columns: list = None, callback=None, **kwargs):
+        """
+        Stream telemetry from the vehicle
+
+        Requires the `async` extra. Records are dicts with the
+        `timestamp` of the update in epoch milliseconds and a value for
+        each column. The stream reconnects when it drops and
+        re-authenticates if the access token is rejected.
+
+        input
+        columns: list of columns to stream, e.g. ['speed', 'est_lat',
+        'est_lng'], defaults to yauta.streaming.DEFAULT_COLUMNS
+        callback: optional callable, when given it is called with each
+        record on a background thread instead of returning a generator
+        kwargs: passed on to yauta.streaming.StreamingClient
+
+        returns
+        a generator of records, or a started StreamHandle if a callback
+        was given, call stop() on it to end the stream
+        """
+        from yauta.streaming import StreamHandle, iter_stream
+
+        if self.vehicle_id is None:
+            self.vehicle_id = self.get_state()['vehicle_id']
+        client = self._streaming_client(columns, **kwargs)
+        if callback is None:
+            return iter_stream(client)
+        handle = StreamHandle(client, callback)
+        handle.start()
+        return handle
+
+    def get_charge_state(self) -> dict:
+        """
+        Get charge_state only
+        """
+
+        url = '/data_request/charge_state'
+        return self._get_data(url, group='charge_state')
+
+    def get_climate_state(self) -> dict:
+        """
+        Get climate_state only
+        """
+
+        url = '/data_request/climate_state'
+        return self._get_data(url, group='climate_state')
+
+    def get_drive_state(self) -> dict:
+        """
+        Get drive_state only
+        """
+
+        url = '/data_request/drive_state'
+        return self._get_data(url, group='drive_state')
+
+    def get_vehicle_state(self) -> dict:
+        """
+        Get vehicle_state only
+        """
+
+        url = '/data_request/vehicle_state'
+        return self._get_data(url, group='vehicle_state')
+
+    def get_gui_settings(self) -> dict:
+        """
+        Get gui_settings only
+        """
+
+        url = '/data_request/gui_settings'
+        return self._get_data(url, group='gui_settings')
+
+    def get_state(self) -> dict:
+        """
+        Get the vehicle summary, including its online `state`
+
+        Unlike get_vehicle_data this is answered by the api while the
+        vehicle is asleep, and does not wake it up.
+        """
+
+        url = ''
         data = None
         return self._call(METHOD_GET, url, data)
 
-    def wake_up(self) -> dict:
+    def wake_up(self, wait: bool = False,
+                timeout: float = WAKE_TIMEOUT) -> dict:
         """
         Wake up vehicle
+
+        Concurrent calls for the same vehicle, waiting or not, are
+        coalesced into a single request and receive the same response.
+        Callers that wait poll the vehicle state with their own timeout,
+        sharing the polls that are in flight at the same time.
+
+        input
+        wait: (bool) block until the vehicle reports that it is online
+        timeout: (float) seconds to wait for the vehicle to come online,
+        TeslaWakeTimeoutException is raised once it has elapsed
+
+        returns
+        the vehicle summary, which includes its `state`
         """
 
         url = '/wake_up'
         data = None
         method = METHOD_POST
-        return self._call(method, url, data)
+        flight = self.api.wake_flight
+        start = time.monotonic()
+        resp = flight.do(self.id, self._call, method, url, data)
+        if not wait:
+            return resp
+
+        deadline = start + timeout
+        delay = WAKE_POLL_INITIAL
+        while resp['state'] != STATE_ONLINE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._observe_wake(time.monotonic() - start, False)
+                raise TeslaWakeTimeoutException(
+                    'Vehicle %s did not wake up within %ss, state: %s'
+                    % (self.id, timeout, resp['state']))
+            time.sleep(min(delay, remaining))
+            delay = min(delay * WAKE_POLL_BACKOFF, WAKE_POLL_MAX)
+            resp = flight.do((self.id, 'state'), self.get_state)
+        self._observe_wake(time.monotonic() - start, True)
+        return resp
+
+    def _observe_wake(self, elapsed, online):
+        metrics = self.api.metrics
+        if metrics is not None:
+            metrics.observe_wake(elapsed, online)
 
     def honk_horn(self) -> dict:
         """
@@ -213,11 +700,7 @@ class TeslaVehicle(object):
         input:
         position: (str) either `front` or `rear`
         """
-        try:
-            assert position in ('front', 'rear')
-        except AssertionError:
-            raise TeslaException(
-                'Invalid position: %s, must be "front" or "rear"' % position)
+        validate_trunk_position(position)
 
         url = '/command/actuate_trunk'
         data = {
@@ -234,11 +717,7 @@ class TeslaVehicle(object):
         state: (str) either `vent` or `close`
         """
 
-        try:
-            assert state in ('vent', 'close')
-        except AssertionError:
-            raise TeslaException(
-                'Invalid state: %s, must be "vent" or "close"' % state)
+        validate_sun_roof_state(state)
 
         url = '/command/sun_roof_control'
         data = {
@@ -316,11 +795,7 @@ class TeslaVehicle(object):
         charged until must be between 10 and 100
         """
 
-        try:
-            assert 10 < percent < 100
-        except AssertionError:
-            raise TeslaException(
-                "percent: %s must be between 10 and 100" % percent)
+        validate_charge_limit(percent)
 
         url = '/command/set_charge_limit'
         data = {
@@ -388,20 +863,7 @@ class TeslaVehicle(object):
         level: (int) desired level for heater (0-3)
         """
 
-        try:
-            assert heater in range(5)
-        except AssertionError:
-            raise TeslaException(
-                'Invalid seat selected, seat number must be in range: %s'
-                % range(5)
-            )
-        try:
-            assert level in range(4)
-        except AssertionError:
-            raise TeslaException(
-                'Invalid level selected, level must be in range: %s'
-                % range(4)
-            )
+        validate_seat_heater(heater, level)
 
         url = '/command/remote_seat_heater_request'
         data = {